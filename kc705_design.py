@@ -10,6 +10,11 @@ from litex.soc.integration.soc_core import *
 from litex.soc.integration.builder import *
 from litex.soc.cores.uart import UARTWishboneBridge
 
+from liteeth.common import convert_ip
+from liteeth.phy import LiteEthPHY
+from liteeth.core import LiteEthUDPIPCore
+from liteeth.frontend.etherbone import LiteEthEtherbone
+
 import kc705_platform as kc705
 
 import sdcard
@@ -55,12 +60,22 @@ class _CRG(Module):
 
 
 class BaseSoC(SoCCore):
+    csr_map = {
+        "sdcard": 16,
+        "ethphy": 17,
+        "sdcard1": 18,
+        "sdcard2": 19,
+    }
+    csr_map.update(SoCCore.csr_map)
+
     mem_map = {
         "sdcard": 0x50000000,  # (shadow @0xd0000000)
     }
     mem_map.update(SoCCore.mem_map)
 
-    def __init__(self, **kwargs):
+    def __init__(self, sdcard_fifo_depth=16, sdcard_burst=False, sdcard_stream=False,
+                 sdcard_descriptors=False, sdcard_perf=False, sdcard_cmd_queue=0, sdcard_slots=1,
+                 bridge="uart", bridge_baudrate=115200, eth_ip="192.168.1.50", **kwargs):
         platform = kc705.Platform(toolchain="vivado")
         clk_freq = 125*1000000
 
@@ -76,16 +91,37 @@ class BaseSoC(SoCCore):
         # clock/reset generation
         self.submodules.crg = _CRG(platform)
 
-        # uart <--> wishbone bridge
-        self.add_cpu_or_bridge(UARTWishboneBridge(platform.request("serial"), clk_freq, baudrate=115200))
-        self.add_wb_master(self.cpu_or_bridge.wishbone)
-
-        # sdcard
-        self.submodules.sdcard = sdcard.SDCARD(platform, platform.request("sd_card"))
-        self.add_wb_master(self.sdcard.master)
-
-        self.add_wb_slave(mem_decoder(self.mem_map["sdcard"]), self.sdcard.slave)
-        self.add_memory_region("sdcard", self.mem_map["sdcard"]+self.shadow_base, 0x2000)
+        if bridge == "etherbone":
+            # ethernet (gmii) <--> udp/ip <--> etherbone <--> wishbone bridge
+            self.submodules.ethphy = LiteEthPHY(platform.request("eth_clocks"),
+                                                platform.request("eth"), clk_freq=clk_freq)
+            self.submodules.ethcore = LiteEthUDPIPCore(self.ethphy, 0x10e2d5000000,
+                                                       convert_ip(eth_ip), clk_freq)
+            self.add_cpu_or_bridge(LiteEthEtherbone(self.ethcore.udp, 1234))
+            self.add_wb_master(self.cpu_or_bridge.wishbone.bus)
+
+            self.ethphy.crg.cd_eth_rx.clk.attr.add("keep")
+            self.ethphy.crg.cd_eth_tx.clk.attr.add("keep")
+            platform.add_period_constraint(self.ethphy.crg.cd_eth_tx.clk, 8.0)
+            platform.add_false_path_constraints(
+                self.crg.cd_sys.clk,
+                self.ethphy.crg.cd_eth_rx.clk,
+                self.ethphy.crg.cd_eth_tx.clk)
+        else:
+            # uart <--> wishbone bridge
+            self.add_cpu_or_bridge(UARTWishboneBridge(platform.request("serial"), clk_freq,
+                                                      baudrate=bridge_baudrate))
+            self.add_wb_master(self.cpu_or_bridge.wishbone)
+
+        # sdcard, further slots get the next register windows and their
+        # own DMA master, the shared bus arbiter serves the masters in turn
+        sdcard.add_sdcard_slots(self, platform, sdcard_slots,
+                                fifo_depth=sdcard_fifo_depth,
+                                burst=sdcard_burst,
+                                with_stream=sdcard_stream,
+                                descriptors=sdcard_descriptors,
+                                perf=sdcard_perf,
+                                cmd_queue=sdcard_cmd_queue)
 
         # led blink
         counter = Signal(32)
@@ -103,10 +139,37 @@ def main():
     parser = argparse.ArgumentParser(description="LiteX SoC port to the KC705")
     builder_args(parser)
     soc_core_args(parser)
+    parser.add_argument("--bridge", default="uart", choices=["uart", "etherbone"],
+                        help="host bridge: UART on the USB serial port or Etherbone on the eth port")
+    parser.add_argument("--bridge-baudrate", default=115200, type=int,
+                        help="UART bridge rate, the host needs the same (the CP2103 goes to 1 Mbaud)")
+    parser.add_argument("--eth-ip", default="192.168.1.50",
+                        help="IP address of the Etherbone bridge (UDP port 1234)")
+    parser.add_argument("--sdcard-fifo-depth", default=16, type=int,
+                        help="depth of each SD card DMA FIFO in 32-bit words (power of two)")
+    parser.add_argument("--sdcard-burst", action="store_true",
+                        help="use incrementing wishbone bursts for SD card DMA")
+    parser.add_argument("--sdcard-stream", action="store_true",
+                        help="add the SD card stream ports with a one block loopback FIFO")
+    parser.add_argument("--sdcard-descriptors", action="store_true",
+                        help="add descriptor chain (scatter-gather) DMA to the SD card controller")
+    parser.add_argument("--sdcard-perf", action="store_true",
+                        help="add the SD card performance counter CSRs")
+    parser.add_argument("--sdcard-cmd-queue", default=0, type=int, metavar="DEPTH",
+                        help="add a command queue of DEPTH entries in front of the SD card controller")
+    parser.add_argument("--sdcard-slots", default=1, type=int,
+                        help="number of SD card slots (see the platform's sd_card resources)")
     args = parser.parse_args()
 
-    soc = BaseSoC(**soc_core_argdict(args))
-    builder = Builder(soc, output_dir="build")
+    soc = BaseSoC(sdcard_fifo_depth=args.sdcard_fifo_depth, sdcard_burst=args.sdcard_burst,
+                  sdcard_stream=args.sdcard_stream,
+                  sdcard_descriptors=args.sdcard_descriptors,
+                  sdcard_perf=args.sdcard_perf,
+                  sdcard_cmd_queue=args.sdcard_cmd_queue,
+                  sdcard_slots=args.sdcard_slots,
+                  bridge=args.bridge, bridge_baudrate=args.bridge_baudrate, eth_ip=args.eth_ip,
+                  **soc_core_argdict(args))
+    builder = Builder(soc, output_dir="build", csr_csv="build/csr.csv")
     builder.build()
 
 
@@ -196,6 +196,21 @@ _io = [
         Subsignal("cd", Pins("AA21")),
         Subsignal("d", Pins("AC20 AA23 AA22 AC21"), Misc("PULLUP")),
         IOStandard("LVCMOS25"), Misc("SLEW=FAST")
+    ),
+    # SD card breakouts on the FMC LA pairs (VADJ 2.5V), --sdcard-slots
+    ("sd_card", 1,
+        Subsignal("cmd", Pins("HPC:LA00_CC_P"), Misc("PULLUP")),
+        Subsignal("clk", Pins("HPC:LA00_CC_N")),
+        Subsignal("cd", Pins("HPC:LA01_CC_P")),
+        Subsignal("d", Pins("HPC:LA02_P HPC:LA02_N HPC:LA03_P HPC:LA03_N"), Misc("PULLUP")),
+        IOStandard("LVCMOS25"), Misc("SLEW=FAST")
+    ),
+    ("sd_card", 2,
+        Subsignal("cmd", Pins("LPC:LA00_CC_P"), Misc("PULLUP")),
+        Subsignal("clk", Pins("LPC:LA00_CC_N")),
+        Subsignal("cd", Pins("LPC:LA01_CC_P")),
+        Subsignal("d", Pins("LPC:LA02_P LPC:LA02_N LPC:LA03_P LPC:LA03_N"), Misc("PULLUP")),
+        IOStandard("LVCMOS25"), Misc("SLEW=FAST")
     )
 ]
 
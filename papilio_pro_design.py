@@ -8,19 +8,21 @@ from litex.gen.genlib.io import CRG
 from litex.gen.genlib.resetsync import AsyncResetSynchronizer
 
 from litex.soc.interconnect import wishbone
-from litex.soc.integration.soc_core import *
+from litex.soc.integration.soc_sdram import *
 from litex.soc.integration.builder import *
 from litex.soc.cores.uart import UARTWishboneBridge
 
+from litedram.modules import MT48LC4M16
+from litedram.phy import gensdrphy
+
 import papilio_pro_platform as papilio_pro
 
 import sdcard
 
 
 class _CRG(Module):
-    def __init__(self, platform, clk_freq):
+    def __init__(self, platform, clk_freq, with_sdram=False):
         self.clock_domains.cd_sys = ClockDomain()
-        self.clock_domains.cd_sys_ps = ClockDomain()
 
         f0 = 32*1000000
         clk32 = platform.request("clk32")
@@ -60,39 +62,73 @@ class _CRG(Module):
         self.specials += Instance("BUFG", i_I=pll[4], o_O=self.cd_sys.clk)
         self.specials += AsyncResetSynchronizer(self.cd_sys, ~pll_lckd)
 
+        if with_sdram:
+            # SDRAM clock: sys shifted by 270 degrees, forwarded through an ODDR2
+            self.clock_domains.cd_sys_ps = ClockDomain()
+            self.specials += Instance("BUFG", i_I=pll[5], o_O=self.cd_sys_ps.clk)
+            self.specials += Instance("ODDR2", p_DDR_ALIGNMENT="NONE",
+                                      p_INIT=0, p_SRTYPE="SYNC",
+                                      i_D0=0, i_D1=1, i_S=0, i_R=0, i_CE=1,
+                                      i_C0=self.cd_sys_ps.clk, i_C1=~self.cd_sys_ps.clk,
+                                      o_Q=platform.request("sdram_clock"))
+
+
+class BaseSoC(SoCSDRAM):
+    csr_map = {
+        "sdcard": 16,
+        "sdcard1": 17,
+        "sdcard2": 18,
+    }
+    csr_map.update(SoCSDRAM.csr_map)
 
-class BaseSoC(SoCCore):
     mem_map = {
         "sdcard": 0x50000000,  # (shadow @0xd0000000)
     }
-    mem_map.update(SoCCore.mem_map)
+    mem_map.update(SoCSDRAM.mem_map)
 
-    def __init__(self, **kwargs):
+    def __init__(self, sdcard_fifo_depth=16, sdcard_burst=False, sdcard_stream=False,
+                 sdcard_descriptors=False, sdcard_perf=False, sdcard_cmd_queue=0, sdcard_slots=1,
+                 bridge_baudrate=115200, sdram=False, **kwargs):
         platform = papilio_pro.Platform()
-        clk_freq = 127*1000000
+        # GENSDRPHY doesn't close timing at the SD controller's 127MHz
+        clk_freq = (80 if sdram else 127)*1000000
 
-        SoCCore.__init__(self, platform, clk_freq,
+        SoCSDRAM.__init__(self, platform, clk_freq,
                           cpu_type=None,
                           csr_data_width=32,
                           with_uart=False,
                           ident="SDCard example design",
                           with_timer=False,
-                          integrated_main_ram_size=0x8000,
+                          integrated_main_ram_size=0 if sdram else 0x8000,
                           **kwargs)
 
         # clock/reset generation
-        self.submodules.crg = _CRG(platform, clk_freq)
+        self.submodules.crg = _CRG(platform, clk_freq, sdram)
+
+        # sdram: main_ram, and with it the SD card DMA buffers, in the
+        # 8MB MT48LC4M16 instead of 32KB of block RAM. There is no CPU to
+        # run the BIOS init, the host does it (sdcard_host.sdram).
+        if sdram:
+            self.submodules.sdrphy = gensdrphy.GENSDRPHY(platform.request("sdram"))
+            sdram_module = MT48LC4M16(clk_freq, "1:1")
+            self.register_sdram(self.sdrphy,
+                                sdram_module.geom_settings,
+                                sdram_module.timing_settings)
 
         # uart <--> wishbone bridge
-        self.add_cpu_or_bridge(UARTWishboneBridge(platform.request("serial"), clk_freq, baudrate=115200))
+        self.add_cpu_or_bridge(UARTWishboneBridge(platform.request("serial"), clk_freq,
+                                                  baudrate=bridge_baudrate))
         self.add_wb_master(self.cpu_or_bridge.wishbone)
 
-        # sdcard
-        self.submodules.sdcard = sdcard.SDCARD(platform, platform.request("sd_card"))
-        self.add_wb_master(self.sdcard.master)
-
-        self.add_wb_slave(mem_decoder(self.mem_map["sdcard"]), self.sdcard.slave)
-        self.add_memory_region("sdcard", self.mem_map["sdcard"]+self.shadow_base, 0x2000)
+        # sdcard, further slots get the next register windows and their
+        # own DMA master, the shared bus arbiter serves the masters in turn
+        sdcard.add_sdcard_slots(self, platform, sdcard_slots,
+                                fifo_depth=sdcard_fifo_depth,
+                                burst=sdcard_burst,
+                                with_stream=sdcard_stream,
+                                descriptors=sdcard_descriptors,
+                                perf=sdcard_perf,
+                                cmd_queue=sdcard_cmd_queue)
 
         # led blink
         counter = Signal(32)
@@ -109,11 +145,37 @@ class BaseSoC(SoCCore):
 def main():
     parser = argparse.ArgumentParser(description="MiSoC port to the Papilio Pro")
     builder_args(parser)
-    soc_core_args(parser)
+    soc_sdram_args(parser)
+    parser.add_argument("--bridge-baudrate", default=115200, type=int,
+                        help="UART bridge rate, the host needs the same (e.g. 3000000)")
+    parser.add_argument("--sdcard-fifo-depth", default=16, type=int,
+                        help="depth of each SD card DMA FIFO in 32-bit words (power of two)")
+    parser.add_argument("--sdcard-burst", action="store_true",
+                        help="use incrementing wishbone bursts for SD card DMA")
+    parser.add_argument("--sdcard-stream", action="store_true",
+                        help="add the SD card stream ports with a one block loopback FIFO")
+    parser.add_argument("--sdcard-descriptors", action="store_true",
+                        help="add descriptor chain (scatter-gather) DMA to the SD card controller")
+    parser.add_argument("--sdcard-perf", action="store_true",
+                        help="add the SD card performance counter CSRs")
+    parser.add_argument("--sdcard-cmd-queue", default=0, type=int, metavar="DEPTH",
+                        help="add a command queue of DEPTH entries in front of the SD card controller")
+    parser.add_argument("--sdcard-slots", default=1, type=int,
+                        help="number of SD card slots (see the platform's sd_card resources)")
+    parser.add_argument("--sdram", action="store_true",
+                        help="put main_ram (the DMA buffers) in the 8MB SDRAM, sys clock 80MHz")
     args = parser.parse_args()
 
-    soc = BaseSoC(**soc_core_argdict(args))
-    builder = Builder(soc, output_dir="build")
+    soc = BaseSoC(sdcard_fifo_depth=args.sdcard_fifo_depth, sdcard_burst=args.sdcard_burst,
+                  sdcard_stream=args.sdcard_stream,
+                  sdcard_descriptors=args.sdcard_descriptors,
+                  sdcard_perf=args.sdcard_perf,
+                  sdcard_cmd_queue=args.sdcard_cmd_queue,
+                  sdcard_slots=args.sdcard_slots,
+                  bridge_baudrate=args.bridge_baudrate,
+                  sdram=args.sdram,
+                  **soc_sdram_argdict(args))
+    builder = Builder(soc, output_dir="build", csr_csv="build/csr.csv")
     builder.build()
 
 
@@ -48,6 +48,21 @@ _io = [
         Subsignal("cd", Pins("P120")),
         Subsignal("d", Pins("P114 P119 P118 P117"), Misc("PULLUP"), IOStandard("SDIO")),
         IOStandard("SDIO"), Misc("SLEW=FAST")
+    ),
+    # the same wiring on wings A and B, --sdcard-slots
+    ("sd_card", 1,
+        Subsignal("cmd", Pins("A:1"), Misc("PULLUP"), IOStandard("SDIO")),
+        Subsignal("clk", Pins("A:2")),
+        Subsignal("cd", Pins("A:6")),
+        Subsignal("d", Pins("A:0 A:5 A:4 A:3"), Misc("PULLUP"), IOStandard("SDIO")),
+        IOStandard("SDIO"), Misc("SLEW=FAST")
+    ),
+    ("sd_card", 2,
+        Subsignal("cmd", Pins("B:1"), Misc("PULLUP"), IOStandard("SDIO")),
+        Subsignal("clk", Pins("B:2")),
+        Subsignal("cd", Pins("B:6")),
+        Subsignal("d", Pins("B:0 B:5 B:4 B:3"), Misc("PULLUP"), IOStandard("SDIO")),
+        IOStandard("SDIO"), Misc("SLEW=FAST")
     )
 ]
 
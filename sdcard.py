@@ -1,13 +1,322 @@
 import os
 
 from litex.gen import *
-from litex.soc.interconnect import wishbone
+from litex.gen.genlib.cdc import MultiReg
+from litex.gen.genlib.fifo import SyncFIFO
+from litex.soc.interconnect import stream, wishbone
+from litex.soc.interconnect.csr import *
 
+# sd_defines.h interrupt status bits
+_INT_CMD_CC = 0
+_INT_CMD_EI = 1
+_INT_CTE = 2
+_INT_CCRCE = 3
+_INT_DATA_EI = 1
+_INT_DATA_CFE = 4
 
-class SDCARD(Module):
-    def __init__(self, platform, pads):
+# sd_defines.h register addresses (bytes) used by the command queue
+_REG_ARGUMENT = 0x00
+_REG_COMMAND = 0x04
+_REG_RESP0 = 0x08
+_REG_CMD_ISR = 0x34
+_REG_DATA_ISR = 0x3c
+
+# command queue entry flags, above the 16 command register bits
+_QUEUE_WAIT_DATA = 16
+_QUEUE_KEEP_GOING = 17
+
+
+# register window of each slot, slot i at the design's sdcard base + i*SLOT_WINDOW
+SLOT_WINDOW = 0x2000
+
+
+def slot_decoder(base, slot):
+    """Wishbone decoder for the register window of slot, ignoring the shadow bit."""
+    shift = log2_int(SLOT_WINDOW)
+    window = ((base + slot*SLOT_WINDOW) >> shift) & (2**(31 - shift) - 1)
+    return lambda a: a[shift - 2:29] == window
+
+
+def add_sdcard_slots(soc, platform, n, with_stream=False, **kwargs):
+    """Add n SDCARDs with kwargs to soc as sdcard, sdcard1, ..."""
+    if not 1 <= n <= 3:
+        raise ValueError("1 to 3 SD card slots, got {}".format(n))
+    for i in range(n):
+        name = "sdcard{}".format(i) if i else "sdcard"
+        slot = SDCARD(platform, platform.request("sd_card", i), with_stream=with_stream and not i, **kwargs)
+        setattr(soc.submodules, name, slot)
+        soc.add_wb_master(slot.master)
+        soc.add_wb_slave(slot_decoder(soc.mem_map["sdcard"], i), slot.slave)
+        soc.add_memory_region(name, soc.mem_map["sdcard"] + i*SLOT_WINDOW + soc.shadow_base, SLOT_WINDOW)
+    if with_stream:
+        # slot 0's stream ports looped back through a one block FIFO
+        soc.submodules.sdcard_loopback = stream.SyncFIFO([("data", 32)], 128, buffered=True)
+        soc.comb += [
+            soc.sdcard.source.connect(soc.sdcard_loopback.sink),
+            soc.sdcard_loopback.source.connect(soc.sdcard.sink)
+        ]
+
+
+def _fifo_adr_size(depth):
+    if depth < 2 or depth > 2**15 or depth & (depth - 1):
+        raise ValueError("FIFO depth must be a power of two between 2 and 32768, got {}".format(depth))
+    return log2_int(depth)
+
+
+class SDCARDPerf(Module, AutoCSR):
+    """Performance counters for the sdc_controller perf_* events."""
+    # Durations are in sys clock cycles. A write to snapshot copies the
+    # counters into the status CSRs (so the multi-word ones read back
+    # consistent), a write to clear zeroes them.
+    def __init__(self, width=48):
+        self.snapshot = CSR()
+        self.clear = CSR()
+
+        self.cmd_start = Signal()
+        self.cmd_int = Signal(5)
+        self.data_int = Signal(5)
+        self.data_busy = Signal()
+        self.write_busy = Signal()
+        self.rx_full = Signal()
+        self.rx_empty = Signal()
+        self.tx_full = Signal()
+        self.tx_empty = Signal()
+        self.xfer = Signal()
+
+        # # #
+
+        # the data path levels partly come from the sd_clk domain
+        levels = Signal(6)
+        self.specials += MultiReg(Cat(self.data_busy, self.write_busy,
+                                      self.rx_full, self.rx_empty,
+                                      self.tx_full, self.tx_empty), levels)
+
+        cmd_int_d = Signal(5)
+        data_int_d = Signal(5)
+        cmd_rise = Signal(5)
+        data_rise = Signal(5)
+        self.sync += [
+            cmd_int_d.eq(self.cmd_int),
+            data_int_d.eq(self.data_int)
+        ]
+        self.comb += [
+            cmd_rise.eq(self.cmd_int & ~cmd_int_d),
+            data_rise.eq(self.data_int & ~data_int_d)
+        ]
+
+        cmd_pending = Signal()
+        cmd_done = Signal()
+        cmd_latency = Signal(32)
+        cmd_latency_max = Signal(32)
+        self.comb += cmd_done.eq(cmd_pending & (cmd_rise[_INT_CMD_CC] | cmd_rise[_INT_CMD_EI]))
+        self.sync += [
+            If(self.cmd_start,
+                cmd_pending.eq(1),
+                cmd_latency.eq(0)
+            ).Elif(cmd_done,
+                cmd_pending.eq(0)
+            ).Elif(cmd_pending,
+                cmd_latency.eq(cmd_latency + 1)
+            ),
+            If(self.clear.re,
+                cmd_latency_max.eq(0)
+            ).Elif(cmd_done & (cmd_latency > cmd_latency_max),
+                cmd_latency_max.eq(cmd_latency)
+            )
+        ]
+
+        events = [
+            ("cmds",              cmd_done,                 32),
+            ("cmd_cycles",        cmd_pending,              width),
+            ("data_cycles",       levels[0],                width),
+            ("write_busy_cycles", levels[1],                width),
+            ("rx_full_cycles",    levels[2],                width),
+            ("rx_empty_cycles",   levels[3],                width),
+            ("tx_full_cycles",    levels[4],                width),
+            ("tx_empty_cycles",   levels[5],                width),
+            ("words",             self.xfer,                width),
+            ("cmd_crc_errors",    cmd_rise[_INT_CCRCE],     32),
+            ("cmd_timeouts",      cmd_rise[_INT_CTE],       32),
+            ("data_crc_errors",   data_rise[_INT_CCRCE],    32),
+            ("data_timeouts",     data_rise[_INT_CTE],      32),
+            ("fifo_errors",       data_rise[_INT_DATA_CFE], 32)
+        ]
+        for name, event, counter_width in events:
+            counter = Signal(counter_width)
+            status = CSRStatus(counter_width, name=name)
+            setattr(self, name, status)
+            self.sync += [
+                If(self.clear.re,
+                    counter.eq(0)
+                ).Elif(event,
+                    counter.eq(counter + 1)
+                ),
+                If(self.snapshot.re,
+                    status.status.eq(counter)
+                )
+            ]
+        self.cmd_cycles_max = CSRStatus(32)
+        self.sync += If(self.snapshot.re, self.cmd_cycles_max.status.eq(cmd_latency_max))
+
+
+class SDCARDCmdQueue(Module, AutoCSR):
+    """Command queue in front of the sdc_controller registers."""
+    # Writing argument queues an entry made of it and the command CSR:
+    # the command register value in [15:0], wait for the data phase in
+    # [16], go on after an error in [17]. Each entry leaves a record:
+    # result_status holds cmd_isr [4:0], data_isr [12:8] (with [16]
+    # only), the command index [21:16] and [31] set while a record is
+    # there, result_response resp0 to resp3; result_pop drops it.
+    # A failed entry without [17] halts the queue until a write to flush.
+    # status has busy [0], halted [1], the queued entries [15:8] and the
+    # records [23:16].
+    def __init__(self, depth=16):
+        if depth > 255:
+            raise ValueError("command queue depth must be below 256, got {}".format(depth))
+        self.bus = bus = wishbone.Interface()
+        self.cmd_int = Signal(5)
+        self.data_int = Signal(5)
+
+        self.command = CSRStorage(32)
+        self.argument = CSR(32)
+        self.status = CSRStatus(32)
+        self.result_status = CSRStatus(32)
+        self.result_response = CSRStatus(128)
+        self.result_pop = CSR()
+        self.flush = CSR()
+
+        # # #
+
+        queue = ResetInserter()(SyncFIFO(32 + 18, depth))
+        results = SyncFIFO(5 + 5 + 6 + 128, depth)
+        self.submodules += queue, results
+
+        self.comb += [
+            queue.reset.eq(self.flush.re),
+            queue.din.eq(Cat(self.argument.r, self.command.storage[:18])),
+            queue.we.eq(self.argument.re),
+            results.re.eq(self.result_pop.re)
+        ]
+
+        argument = Signal(32)
+        command = Signal(16)
+        wait_data = Signal()
+        keep_going = Signal()
+        cmd_status = Signal(5)
+        data_status = Signal(5)
+        response = [Signal(32) for i in range(4)]
+        halted = Signal()
+        error = Signal()
+        self.comb += [
+            error.eq(cmd_status[_INT_CMD_EI] | data_status[_INT_DATA_EI]),
+            results.din.eq(Cat(cmd_status, data_status, command[8:14],
+                               response[3], response[2], response[1], response[0]))
+        ]
+
+        self.submodules.fsm = fsm = FSM(reset_state="IDLE")
+
+        def access(state, adr, next_state, we=0, dat_w=0, done=[]):
+            fsm.act(state,
+                bus.cyc.eq(1),
+                bus.stb.eq(1),
+                bus.we.eq(we),
+                bus.adr.eq(adr >> 2),
+                bus.sel.eq(0xf),
+                bus.dat_w.eq(dat_w),
+                If(bus.ack,
+                    *done,
+                    NextState(next_state)
+                )
+            )
+
+        fsm.act("IDLE",
+            queue.re.eq(1),
+            If(queue.readable & ~halted,
+                NextValue(argument, queue.dout[:32]),
+                NextValue(command, queue.dout[32:48]),
+                NextValue(wait_data, queue.dout[48]),
+                NextValue(keep_going, queue.dout[49]),
+                NextValue(cmd_status, 0),
+                NextValue(data_status, 0),
+                NextState("COMMAND")
+            )
+        )
+        # the argument write starts the command
+        access("COMMAND", _REG_COMMAND, "ARGUMENT", 1, command)
+        access("ARGUMENT", _REG_ARGUMENT, "CMD_WAIT", 1, argument)
+        fsm.act("CMD_WAIT",
+            If(self.cmd_int != 0,
+                NextValue(cmd_status, self.cmd_int),
+                NextState("RESP0")
+            )
+        )
+        for i in range(4):
+            access("RESP{}".format(i), _REG_RESP0 + 4*i,
+                   "RESP{}".format(i + 1) if i < 3 else "CMD_CLEAR",
+                   done=[NextValue(response[i], bus.dat_r)])
+        # the clear crosses to sd_clk and back, wait for it before
+        # starting anything else
+        access("CMD_CLEAR", _REG_CMD_ISR, "CMD_CLEARED", 1, 0)
+        fsm.act("CMD_CLEARED",
+            If(self.cmd_int == 0,
+                If(wait_data & ~cmd_status[_INT_CMD_EI],
+                    NextState("DATA_WAIT")
+                ).Else(
+                    NextState("PUSH")
+                )
+            )
+        )
+        fsm.act("DATA_WAIT",
+            If(self.data_int != 0,
+                NextValue(data_status, self.data_int),
+                NextState("DATA_CLEAR")
+            )
+        )
+        access("DATA_CLEAR", _REG_DATA_ISR, "DATA_CLEARED", 1, 0)
+        fsm.act("DATA_CLEARED",
+            If(self.data_int == 0,
+                NextState("PUSH")
+            )
+        )
+        fsm.act("PUSH",
+            results.we.eq(1),
+            If(results.writable,
+                If(error & ~keep_going,
+                    NextValue(halted, 1)
+                ),
+                NextState("IDLE")
+            )
+        )
+        self.sync += If(self.flush.re, halted.eq(0))
+
+        self.comb += [
+            self.status.status[0].eq(~fsm.ongoing("IDLE") | queue.readable),
+            self.status.status[1].eq(halted),
+            self.status.status[8:16].eq(queue.level),
+            self.status.status[16:24].eq(results.level),
+            self.result_status.status[0:5].eq(results.dout[0:5]),
+            self.result_status.status[8:13].eq(results.dout[5:10]),
+            self.result_status.status[16:22].eq(results.dout[10:16]),
+            self.result_status.status[31].eq(results.readable),
+            self.result_response.status.eq(results.dout[16:])
+        ]
+
+
+class SDCARD(Module, AutoCSR):
+    """sdc_controller with its register slave and DMA master."""
+    # With descriptors, the controller register descriptor bit makes
+    # dst_src_addr point to a chain of (buffer, blocks, next, status)
+    # descriptors, see verilog/sd_fifo_filler.v.
+    def __init__(self, platform, pads, fifo_depth=16, rx_fifo_depth=None, tx_fifo_depth=None,
+                 burst=False, max_burst=16, with_stream=False,
+                 descriptors=False, perf=False, cmd_queue=0):
+        self.rx_fifo_depth = rx_fifo_depth or fifo_depth
+        self.tx_fifo_depth = tx_fifo_depth or fifo_depth
         self.master = master = wishbone.Interface()
         self.slave = slave = wishbone.Interface()
+        # big endian words, source.last on the last word of each block
+        self.source = source = stream.Endpoint([("data", 32)])
+        self.sink = sink = stream.Endpoint([("data", 32)])
 
 
         self.int_cmd = Signal()
@@ -26,12 +335,20 @@ class SDCARD(Module):
         self.specials += self.cmd.get_tristate(pads.cmd)
         self.specials += self.dat.get_tristate(pads.d)
 
+        # the controller register slave, behind an arbiter with the
+        # command queue
+        regs = slave
+        if cmd_queue:
+            self.submodules.cmd_queue = SDCARDCmdQueue(cmd_queue)
+            regs = wishbone.Interface()
+            self.submodules += wishbone.Arbiter([slave, self.cmd_queue.bus], regs)
+
         master_adr_o = Signal(32)
         slave_adr_i = Signal(32)
 
         self.comb += [
             self.master.adr.eq(master_adr_o[2:]),
-            slave_adr_i[2:].eq(self.slave.adr)
+            slave_adr_i[2:].eq(regs.adr)
 
         ]
         
@@ -49,19 +366,52 @@ class SDCARD(Module):
 
         # # #
 
+        cmd_int = Signal(5)
+        data_int = Signal(5)
+        if cmd_queue:
+            self.comb += [
+                self.cmd_queue.cmd_int.eq(cmd_int),
+                self.cmd_queue.data_int.eq(data_int)
+            ]
+
+        perf_ports = {}
+        if perf:
+            self.submodules.perf = p = SDCARDPerf()
+            self.comb += [
+                p.cmd_int.eq(cmd_int),
+                p.data_int.eq(data_int)
+            ]
+            perf_ports = dict(
+                o_perf_cmd_start_o=p.cmd_start,
+                o_perf_data_busy_o=p.data_busy,
+                o_perf_write_busy_o=p.write_busy,
+                o_perf_rx_full_o=p.rx_full,
+                o_perf_rx_empty_o=p.rx_empty,
+                o_perf_tx_full_o=p.tx_full,
+                o_perf_tx_empty_o=p.tx_empty,
+                o_perf_xfer_o=p.xfer
+            )
+
         self.specials += Instance("sdc_controller",
+                            p_RX_FIFO_ADR_SIZE=_fifo_adr_size(self.rx_fifo_depth),
+                            p_TX_FIFO_ADR_SIZE=_fifo_adr_size(self.tx_fifo_depth),
+                            p_BURST=int(burst),
+                            p_MAX_BURST=max_burst,
+                            p_STREAM=int(with_stream),
+                            p_DESC=int(descriptors),
+
                             i_wb_clk_i=ClockSignal(),
                             i_wb_rst_i=ResetSignal(),
 
                             # Wishbone slave
-                            i_wb_dat_i=slave.dat_w,
-                            o_wb_dat_o=slave.dat_r,
+                            i_wb_dat_i=regs.dat_w,
+                            o_wb_dat_o=regs.dat_r,
                             i_wb_adr_i=slave_adr_i,
-                            i_wb_sel_i=slave.sel,
-                            i_wb_we_i=slave.we,
-                            i_wb_cyc_i=slave.cyc,
-                            i_wb_stb_i=slave.stb,
-                            o_wb_ack_o=slave.ack,
+                            i_wb_sel_i=regs.sel,
+                            i_wb_we_i=regs.we,
+                            i_wb_cyc_i=regs.cyc,
+                            i_wb_stb_i=regs.stb,
+                            o_wb_ack_o=regs.ack,
                                   
                             # Wishbone master
                             o_m_wb_dat_o=master.dat_w,
@@ -87,7 +437,20 @@ class SDCARD(Module):
                             i_sd_clk_i_pad=ClockSignal(),
 
                             o_int_cmd=self.int_cmd,
-                            o_int_data=self.int_data
+                            o_int_data=self.int_data,
+                            o_perf_cmd_int_o=cmd_int,
+                            o_perf_data_int_o=data_int,
+
+                            # Data streams
+                            o_rx_stream_data_o=source.data,
+                            o_rx_stream_valid_o=source.valid,
+                            i_rx_stream_ready_i=source.ready if with_stream else 0,
+                            o_rx_stream_last_o=source.last,
+                            i_tx_stream_data_i=sink.data,
+                            i_tx_stream_valid_i=sink.valid if with_stream else 0,
+                            o_tx_stream_ready_o=sink.ready,
+
+                            **perf_ports
         )
 
         sdcard_path = os.path.abspath(os.path.dirname(__file__))
@@ -0,0 +1,10 @@
+from sdcard_host.comm_uart import CommUART
+from sdcard_host.comm_etherbone import CommEtherbone
+from sdcard_host.sdc import SDController, SDCTimeout, command
+from sdcard_host.async_comm_uart import AsyncCommUART
+from sdcard_host.card import SDCard, SDCardError
+from sdcard_host.cache import CachedBlockDevice
+from sdcard_host.perf import PerfCounters
+from sdcard_host.metrics import TransportMetrics
+from sdcard_host.queue import CommandQueue
+from sdcard_host.slots import SlotArray, StripedVolume
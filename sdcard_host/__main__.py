@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+import argparse
+import json
+
+from sdcard_host.card import SDCard
+from sdcard_host.comm_etherbone import ETHERBONE_PORT, CommEtherbone
+from sdcard_host.comm_uart import CommUART
+from sdcard_host import image
+from sdcard_host.metrics import TransportMetrics
+from sdcard_host.perf import PerfCounters, summary
+from sdcard_host.queue import CommandQueue
+from sdcard_host.sd_defines import registers
+from sdcard_host.sdc import SDController
+from sdcard_host.sdram import init_sdram
+from sdcard_host.slots import SlotArray, StripedVolume
+
+
+def _int(s):
+    return int(s, 0)
+
+
+def print_regs(sdc):
+    print("---")
+    for name, value in sdc.dump():
+        print("{:02x} {:<12s}: {:08x}".format(registers[name], name, value))
+
+
+def print_info(card):
+    print("CID: {}".format(" ".join("{}={}".format(k, v) for k, v in card.cid.items())))
+    print("RCA: {:04x}, OCR: {:08x}, {}".format(
+        card.rca, card.ocr, "SDHC/SDXC" if card.high_capacity else "SDSC"))
+    print("capacity: {} blocks ({:.1f} MiB), TRAN_SPEED {} Hz, sd_clk {:.0f} Hz".format(
+        card.nblocks, card.capacity/2**20, card.csd["tran_speed"], card.clock))
+    print("SCR: SD_SPEC {}, bus widths {}; {}-bit bus, {}".format(
+        card.scr["sd_spec"], "/".join(map(str, card.scr["bus_widths"])), card.bus_width,
+        "high speed" if card.high_speed else "default speed"))
+
+
+def print_perf(counters, clk_freq):
+    for name, value in counters.items():
+        print("{:<18s}: {}".format(name, value))
+    for name, value in summary(counters, clk_freq).items():
+        print("{:<18s}: {:.3f}".format(name, value))
+
+
+def write_metrics(metrics, path):
+    with open(path, "w") as f:
+        if path.endswith(".prom"):
+            f.write(metrics.prometheus())
+        else:
+            json.dump(metrics.as_dict(), f, indent=2)
+
+
+def hexdump(data, offset=0):
+    for i in range(0, len(data), 16):
+        print("{:08x}: {}".format(offset + i, bytes(data[i:i+16]).hex()))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SDCard example design host tool")
+    parser.add_argument("--bridge", default="uart", choices=["uart", "etherbone"],
+                        help="host link, as built with the design's --bridge")
+    parser.add_argument("--port", default="/dev/ttyUSB1", help="serial port or pyserial URL")
+    parser.add_argument("--baudrate", default=115200, type=int, help="the design's --bridge-baudrate")
+    parser.add_argument("--ip", default="192.168.1.50", help="etherbone bridge address")
+    parser.add_argument("--udp-port", default=ETHERBONE_PORT, type=int, help="etherbone UDP port")
+    parser.add_argument("--addressing", default="word", choices=["word", "byte"],
+                        help="bridge address format")
+    parser.add_argument("--base", default=0x50000000, type=_int, help="sdcard core base address")
+    parser.add_argument("--dma-addr", default=0x40000000, type=_int, help="DMA buffer address")
+    parser.add_argument("--debug", action="store_true", help="print every bus access")
+    parser.add_argument("--dma-size", type=_int,
+                        help="DMA buffer size (default 0x8000, all of the SDRAM with --sdram)")
+    parser.add_argument("--clk-freq", type=int,
+                        help="design system clock in Hz (default 127000000, 80000000 with --sdram)")
+    parser.add_argument("--max-clock", type=int, help="upper bound for sd_clk (Hz)")
+    parser.add_argument("--bus-width", default=4, type=int, choices=[1, 4], help="widest data bus to use")
+    parser.add_argument("--no-high-speed", action="store_true", help="don't switch the card to high speed")
+    parser.add_argument("--no-auto-stop", action="store_true",
+                        help="send CMD12 from the host instead of auto CMD23/CMD12")
+    parser.add_argument("--cmd-queue", metavar="CSR_CSV",
+                        help="use the command queue (--sdcard-cmd-queue designs) described by csr.csv")
+    parser.add_argument("--cmd-queue-depth", default=16, type=int, help="the design's --sdcard-cmd-queue")
+    parser.add_argument("--slots", default=1, type=int,
+                        help="the design's --sdcard-slots, block commands go to a volume striped over them")
+    parser.add_argument("--stripe-blocks", default=8, type=int, help="blocks per stripe with --slots")
+    parser.add_argument("--sdram", metavar="CSR_CSV",
+                        help="initialize the SDRAM of a --sdram design described by csr.csv first")
+    parser.add_argument("--metrics", metavar="FILE",
+                        help="time every bridge transaction, write the histograms as JSON "
+                             "(Prometheus text for a .prom file)")
+    subparsers = parser.add_subparsers(dest="cmd")
+    subparsers.required = True
+
+    subparsers.add_parser("regs", help="dump the controller registers")
+
+    read_parser = subparsers.add_parser("read", help="read words from the bus")
+    read_parser.add_argument("addr", type=_int)
+    read_parser.add_argument("length", type=_int, nargs="?", default=1)
+
+    write_parser = subparsers.add_parser("write", help="write words to the bus")
+    write_parser.add_argument("addr", type=_int)
+    write_parser.add_argument("values", type=_int, nargs="+")
+
+    subparsers.add_parser("info", help="initialize the card and show its CID/CSD")
+
+    readblk_parser = subparsers.add_parser("readblk", help="initialize the card and dump blocks")
+    readblk_parser.add_argument("lba", type=_int)
+    readblk_parser.add_argument("count", type=_int, nargs="?", default=1)
+
+    dump_parser = subparsers.add_parser("dump", help="save blocks to an image file")
+    dump_parser.add_argument("image")
+    dump_parser.add_argument("--start", type=_int, default=0, help="first block")
+    dump_parser.add_argument("--count", type=_int, help="number of blocks (default: to the end)")
+    dump_parser.add_argument("--sparse", action="store_true", help="leave zero blocks as holes")
+    dump_parser.add_argument("--preallocate", action="store_true", help="allocate the whole image first")
+    dump_parser.add_argument("--restart", action="store_true", help="ignore an existing checkpoint")
+
+    restore_parser = subparsers.add_parser("restore", help="write an image file to the card")
+    restore_parser.add_argument("image")
+    restore_parser.add_argument("--start", type=_int, default=0, help="first block")
+    restore_parser.add_argument("--restart", action="store_true", help="ignore an existing checkpoint")
+
+    perf_parser = subparsers.add_parser("perf", help="show the performance counters (--sdcard-perf designs)")
+    perf_parser.add_argument("--csr-csv", default="build/csr.csv", help="csr.csv of the design")
+    perf_parser.add_argument("--clear", action="store_true", help="clear the counters after reading")
+
+    args = parser.parse_args()
+
+    metrics = TransportMetrics(args.base) if args.metrics else None
+    if args.bridge == "etherbone":
+        comm = CommEtherbone(args.ip, args.udp_port, args.debug, metrics=metrics)
+    else:
+        comm = CommUART(args.port, args.baudrate, args.addressing, args.debug, metrics=metrics)
+    sdc = SDController(comm, args.base)
+    if args.dma_size is None:
+        args.dma_size = 0x800000 if args.sdram else 0x8000
+    if args.clk_freq is None:
+        args.clk_freq = 80000000 if args.sdram else 127000000
+    try:
+        if args.sdram:
+            init_sdram(comm, args.sdram)
+        if args.cmd == "regs":
+            print_regs(sdc)
+        elif args.cmd == "read":
+            for i, value in enumerate(comm.read(args.addr, args.length)):
+                print("{:08x}: {:08x}".format(args.addr + 4*i, value))
+        elif args.cmd == "write":
+            comm.write(args.addr, args.values)
+        elif args.cmd == "perf":
+            perf = PerfCounters(comm, args.csr_csv)
+            print_perf(perf.read(clear=args.clear), args.clk_freq)
+        else:
+            if args.slots > 1:
+                slots = SlotArray.open(comm, args.slots, args.clk_freq, args.base, args.dma_addr,
+                                       args.dma_size, auto_stop=not args.no_auto_stop)
+            else:
+                queue = None
+                if args.cmd_queue:
+                    queue = CommandQueue(comm, args.cmd_queue, depth=args.cmd_queue_depth)
+                slots = SlotArray([SDCard(sdc, args.clk_freq, args.dma_addr, args.dma_size,
+                                          not args.no_auto_stop, queue)])
+            for i, card in enumerate(slots.cards):
+                card.init(negotiate=False)
+                card.negotiate(args.bus_width, not args.no_high_speed, args.max_clock)
+                if args.slots > 1:
+                    print("slot {}:".format(i))
+                print_info(card)
+            card = slots.cards[0]
+            if args.slots > 1:
+                card = StripedVolume(slots, args.stripe_blocks)
+                print("striped volume: {} blocks".format(card.nblocks))
+            if args.cmd == "readblk":
+                hexdump(card.read(args.lba, args.count), args.lba*card.block_size)
+            elif args.cmd == "dump":
+                rate = image.dump(card, args.image, args.start, args.count,
+                                  not args.restart, args.sparse, args.preallocate)
+                print("{:.1f} KiB/s".format(rate/1024))
+            elif args.cmd == "restore":
+                rate = image.restore(card, args.image, args.start, not args.restart)
+                print("{:.1f} KiB/s".format(rate/1024))
+    finally:
+        comm.close()
+        if metrics is not None:
+            write_metrics(metrics, args.metrics)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,194 @@
+import asyncio
+import contextvars
+import fcntl
+import os
+import termios
+import time
+import tty
+from array import array
+from contextlib import asynccontextmanager
+
+from sdcard_host.comm_uart import BridgeFrames
+
+
+_batch = contextvars.ContextVar("sdcard_host_batch", default=None)
+
+
+def _set_low_latency(fd):
+    # what pyserial's set_low_latency_mode() does: ASYNC_LOW_LATENCY in
+    # the flags of struct serial_struct
+    buf = array("i", [0]*32)
+    try:
+        fcntl.ioctl(fd, termios.TIOCGSERIAL, buf)
+        buf[4] |= 0x2000
+        fcntl.ioctl(fd, termios.TIOCSSERIAL, buf)
+    except OSError:
+        # not a serial driver with ASYNC_LOW_LATENCY (pty, ...)
+        pass
+
+
+class AsyncCommUART(BridgeFrames):
+    """asyncio counterpart of CommUART, with the same methods as coroutines."""
+    def __init__(self, port, baudrate=115200, addressing="word", debug=False, low_latency=None,
+                 metrics=None):
+        BridgeFrames.__init__(self, port, baudrate, addressing, debug, low_latency, metrics)
+        self._reader = None
+        self._writer = None
+        self._read_transport = None
+        self._opening = None
+        self._pending = None
+        self._receiver = None
+
+    async def _open_tty(self):
+        fd = os.open(self.port_name, os.O_RDWR | os.O_NOCTTY | os.O_NONBLOCK)
+        try:
+            speed = getattr(termios, "B{}".format(self.baudrate), None)
+            if speed is None:
+                raise ValueError("unsupported baudrate {}".format(self.baudrate))
+            tty.setraw(fd)
+            attrs = termios.tcgetattr(fd)
+            attrs[4] = attrs[5] = speed
+            termios.tcsetattr(fd, termios.TCSANOW, attrs)
+            if self.low_latency:
+                _set_low_latency(fd)
+        except BaseException:
+            os.close(fd)
+            raise
+        loop = asyncio.get_running_loop()
+        reader = asyncio.StreamReader()
+        self._read_transport, _ = await loop.connect_read_pipe(
+            lambda: asyncio.StreamReaderProtocol(reader),
+            os.fdopen(fd, "rb", buffering=0))
+        transport, protocol = await loop.connect_write_pipe(
+            asyncio.streams.FlowControlMixin,
+            os.fdopen(os.dup(fd), "wb", buffering=0))
+        writer = asyncio.StreamWriter(transport, protocol, reader, loop)
+        return reader, writer
+
+    async def _open(self):
+        if self.port_name.startswith("socket://"):
+            host, port = self.port_name[len("socket://"):].rsplit(":", 1)
+            self._reader, self._writer = await asyncio.open_connection(host, int(port))
+        else:
+            self._reader, self._writer = await self._open_tty()
+        self._pending = asyncio.Queue()
+        self._receiver = asyncio.ensure_future(self._receive())
+
+    async def open(self):
+        if self._opening is None:
+            self._opening = asyncio.ensure_future(self._open())
+        await self._opening
+
+    async def close(self):
+        """Close the link, reads still waiting for a reply fail."""
+        if self._opening is None:
+            return
+        opening, self._opening = self._opening, None
+        await opening
+        self._receiver.cancel()
+        try:
+            await self._receiver
+        except asyncio.CancelledError:
+            pass
+        self._writer.close()
+        if self._read_transport is not None:
+            self._read_transport.close()
+        self._reader = self._writer = self._read_transport = None
+        self._receiver = None
+
+    def _fail_pending(self, e, future=None):
+        if future is not None and not future.done():
+            future.set_exception(e)
+        while not self._pending.empty():
+            _, future = self._pending.get_nowait()
+            if not future.done():
+                future.set_exception(e)
+
+    async def _receive(self):
+        future = None
+        try:
+            while True:
+                nbytes, future = await self._pending.get()
+                try:
+                    data = await self._reader.readexactly(nbytes)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    # the link is out of sync, fail everything in flight
+                    self._fail_pending(e, future)
+                    future = None
+                    continue
+                if not future.done():
+                    future.set_result(data)
+                future = None
+        finally:
+            # stopped by close(), nothing will answer these anymore
+            self._fail_pending(ConnectionError("link to {} closed".format(self.port_name)), future)
+
+    async def _transact(self, tx, rx, ops):
+        if not tx:
+            return []
+        await self.open()
+        nbytes = self._reply_length(rx)
+        if self.metrics is not None:
+            start = time.time()
+            t0 = time.perf_counter()
+        if nbytes:
+            future = asyncio.get_running_loop().create_future()
+            self._pending.put_nowait((nbytes, future))
+        self._writer.write(tx)
+        await self._writer.drain()
+        data = await future if nbytes else b""
+        if self.metrics is not None:
+            self._record(start, t0, tx, data, ops)
+        return self._decode(rx, data)
+
+    def _queue(self):
+        batch = _batch.get()
+        if batch is not None and batch[0] is self:
+            return batch[1], True
+        return (self._tx_buffer(), [], []), False
+
+    async def flush(self):
+        """Send the frames queued with the submit_*() methods."""
+        tx, rx, ops = self._tx, self._rx, self._ops
+        self._tx, self._rx, self._ops = self._tx_buffer(), [], []
+        return await self._transact(tx, rx, ops)
+
+    @asynccontextmanager
+    async def batch(self):
+        """Send every read/write awaited in the block as one buffer."""
+        results = []
+        queue = (self._tx_buffer(), [], [])
+        token = _batch.set((self, queue))
+        try:
+            yield results
+        finally:
+            _batch.reset(token)
+        results.extend(await self._transact(*queue))
+
+    async def read(self, addr, length=None):
+        queue, batching = self._queue()
+        self._queue_read(queue, addr, length, False)
+        if batching:
+            return None
+        return (await self._transact(*queue))[0]
+
+    async def write(self, addr, data):
+        queue, batching = self._queue()
+        self._queue_write(queue, addr, data, False)
+        if not batching:
+            await self._transact(*queue)
+
+    async def read_block(self, addr, nwords):
+        queue, batching = self._queue()
+        self._queue_read(queue, addr, nwords, True)
+        if batching:
+            return None
+        return (await self._transact(*queue))[0]
+
+    async def write_block(self, addr, buf):
+        queue, batching = self._queue()
+        self._queue_write(queue, addr, buf, True)
+        if not batching:
+            await self._transact(*queue)
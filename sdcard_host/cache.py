@@ -0,0 +1,130 @@
+from collections import OrderedDict
+
+
+class CachedBlockDevice:
+    """LRU block cache with read-ahead in front of an SDCard."""
+    def __init__(self, card, capacity=256, readahead=32, sequential_threshold=2):
+        if readahead >= capacity:
+            raise ValueError("readahead must be smaller than the cache capacity")
+        self.card = card
+        self.block_size = card.block_size
+        self.capacity = capacity
+        self.readahead = readahead
+        self.sequential_threshold = sequential_threshold
+        self._blocks = OrderedDict()
+        self._dirty = set()
+        self._next_lba = None
+        self._sequential = 0
+        self.hits = 0
+        self.misses = 0
+        self.readahead_blocks = 0
+
+    @property
+    def nblocks(self):
+        return self.card.nblocks
+
+    def stats(self):
+        return {
+            "hits":             self.hits,
+            "misses":           self.misses,
+            "readahead_blocks": self.readahead_blocks,
+            "cached":           len(self._blocks),
+            "dirty":            len(self._dirty),
+        }
+
+    def reset_stats(self):
+        self.hits = self.misses = self.readahead_blocks = 0
+
+    def _check(self, lba, count):
+        if lba < 0 or count < 0 or lba + count > self.nblocks:
+            raise ValueError("blocks {}-{} outside the card".format(lba, lba + count - 1))
+
+    def _insert(self, lba, data):
+        self._blocks[lba] = data
+        self._blocks.move_to_end(lba)
+        while len(self._blocks) > self.capacity:
+            old = next(iter(self._blocks))
+            if old in self._dirty:
+                # stays cached and dirty if the write fails
+                self.card.write(old, self._blocks[old])
+                self._dirty.discard(old)
+            del self._blocks[old]
+
+    def _fetch(self, lba, count, found):
+        data = self.card.read(lba, count)
+        for i in range(count):
+            block = bytes(data[i*self.block_size:(i + 1)*self.block_size])
+            if lba + i not in self._blocks:
+                self._insert(lba + i, block)
+            found[lba + i] = self._blocks.get(lba + i, block)
+
+    def _track(self, lba, count):
+        if lba == self._next_lba:
+            self._sequential += 1
+        else:
+            self._sequential = 0
+        self._next_lba = lba + count
+        return self._sequential >= self.sequential_threshold
+
+    def read(self, lba, count=1):
+        self._check(lba, count)
+        sequential = self._track(lba, count)
+        found = {}
+        runs = []
+        for block in range(lba, lba + count):
+            if block in self._blocks:
+                self.hits += 1
+                self._blocks.move_to_end(block)
+                found[block] = self._blocks[block]
+            else:
+                self.misses += 1
+                if runs and runs[-1][0] + runs[-1][1] == block:
+                    runs[-1][1] += 1
+                else:
+                    runs.append([block, 1])
+        if sequential:
+            # read ahead past the request once less than half of the
+            # readahead window is left cached, so it is refilled in
+            # large transfers instead of one block per request
+            end = lba + count
+            while end in self._blocks and end < lba + count + self.readahead:
+                end += 1
+            extra = min(lba + count + self.readahead, self.nblocks) - end
+            if extra > 0 and end - (lba + count) < self.readahead//2:
+                if runs and runs[-1][0] + runs[-1][1] == end:
+                    runs[-1][1] += extra
+                else:
+                    runs.append([end, extra])
+                self.readahead_blocks += extra
+        for start, n in runs:
+            self._fetch(start, n, found)
+        return b"".join(found[block] for block in range(lba, lba + count))
+
+    def write(self, lba, data):
+        data = memoryview(data).cast("B")
+        if len(data) % self.block_size:
+            raise ValueError("data is not a multiple of the block size")
+        count = len(data)//self.block_size
+        self._check(lba, count)
+        for i in range(count):
+            self._dirty.add(lba + i)
+            self._insert(lba + i, bytes(data[i*self.block_size:(i + 1)*self.block_size]))
+
+    def flush(self):
+        """Write all dirty blocks back to the card."""
+        dirty = sorted(self._dirty)
+        start = 0
+        while start < len(dirty):
+            end = start + 1
+            while (end < len(dirty) and dirty[end] == dirty[end - 1] + 1 and
+                   end - start < self.card.max_blocks):
+                end += 1
+            self.card.write(dirty[start], b"".join(self._blocks[lba] for lba in dirty[start:end]))
+            self._dirty.difference_update(dirty[start:end])
+            start = end
+
+    def invalidate(self):
+        """Drop every clean block."""
+        for lba in list(self._blocks):
+            if lba not in self._dirty:
+                del self._blocks[lba]
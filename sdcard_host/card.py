@@ -0,0 +1,462 @@
+import time
+from array import array
+
+from sdcard_host.sd_defines import *
+from sdcard_host.sdc import SDCTimeout, command
+
+
+# response types: command register flags (see sdc.command())
+R1 = dict(chk_id=1, chk_crc=1, wait_resp=1)
+R1b = dict(chk_id=1, chk_crc=1, chk_busy=1, wait_resp=1)
+R2 = dict(chk_crc=1, wait_resp=2)
+R3 = dict(wait_resp=1)
+R6 = R1
+R7 = R1
+
+OCR_BUSY = 0x80000000
+OCR_HCS = 0x40000000
+OCR_VOLTAGE = 0x00ff8000  # 2.7V - 3.6V
+
+IDENT_CLOCK = 400000
+DEFAULT_CLOCK = 25000000
+HIGH_SPEED_CLOCK = 50000000
+
+# CMD6 argument: check or set mode, every function group but 1 unchanged
+SWITCH_CHECK = 0x00fffff0
+SWITCH_SET = 0x80fffff0
+SWITCH_HIGH_SPEED = 1
+# CCC bit of the switch command class
+CCC_SWITCH = 1 << 10
+# SCR CMD_SUPPORT bit of CMD23 (SET_BLOCK_COUNT)
+SCR_CMD23 = 1 << 1
+
+# TRAN_SPEED decoding: rate units (/10, 4-7 reserved) and multipliers (x10)
+_tran_speed_unit = [10000, 100000, 1000000, 10000000, 0, 0, 0, 0]
+_tran_speed_mult = [0, 10, 12, 13, 15, 20, 25, 30, 35, 40, 45, 50, 55, 60, 70, 80]
+
+# block transfer commands by data_xfer (1 read, 2 write): single, multiple
+_transfer_index = {1: (17, 18), 2: (24, 25)}
+
+
+class SDCardError(Exception):
+    pass
+
+
+def descriptor_chain(addr, buffers, ring=False):
+    """Words of a DMA descriptor chain at addr for (address, blocks) buffers."""
+    words = array("I")
+    for i, (buf, blocks) in enumerate(buffers):
+        last = i == len(buffers) - 1
+        if last and ring:
+            flags, next_desc = 0, addr
+        elif last:
+            flags, next_desc = 1 << DESC_LAST, 0
+        else:
+            flags, next_desc = 0, addr + (i + 1)*DESC_SIZE
+        words.extend([buf, flags | blocks << DESC_BLOCKS, next_desc, 0])
+    return words
+
+
+def _bits(value, msb, lsb):
+    return (value >> lsb) & ((1 << (msb - lsb + 1)) - 1)
+
+
+def _r2_value(response):
+    # the controller drops the CRC7 byte: resp0..resp3 hold bits [127:8]
+    return (response[0] << 96) | (response[1] << 64) | (response[2] << 32) | response[3]
+
+
+def parse_cid(response):
+    cid = _r2_value(response)
+    return {
+        "mid":  _bits(cid, 127, 120),
+        "oid":  _bits(cid, 119, 104).to_bytes(2, "big").decode("ascii", "replace"),
+        "pnm":  _bits(cid, 103, 64).to_bytes(5, "big").decode("ascii", "replace"),
+        "prv":  "{}.{}".format(_bits(cid, 63, 60), _bits(cid, 59, 56)),
+        "psn":  _bits(cid, 55, 24),
+        "mdt":  "{}/{:02d}".format(2000 + _bits(cid, 19, 12), _bits(cid, 11, 8)),
+    }
+
+
+def parse_csd(response):
+    csd = _r2_value(response)
+    version = _bits(csd, 127, 126)
+    tran_speed = _bits(csd, 103, 96)
+    info = {
+        "version":      version + 1,
+        "tran_speed":   _tran_speed_unit[tran_speed & 0x7]*_tran_speed_mult[(tran_speed >> 3) & 0xf],
+        "ccc":          _bits(csd, 95, 84),
+        "read_bl_len":  1 << _bits(csd, 83, 80),
+    }
+    if version == 0:
+        c_size = _bits(csd, 73, 62)
+        c_size_mult = _bits(csd, 49, 47)
+        info["capacity"] = (c_size + 1)*(1 << (c_size_mult + 2))*info["read_bl_len"]
+    else:
+        c_size = _bits(csd, 69, 48)
+        info["capacity"] = (c_size + 1)*512*1024
+    info["c_size"] = c_size
+    return info
+
+
+def parse_scr(data):
+    """SCR fields from the 8 bytes returned by ACMD51."""
+    scr = int.from_bytes(bytes(data[:8]), "big")
+    widths = _bits(scr, 51, 48)
+    return {
+        "version":      _bits(scr, 63, 60),
+        "sd_spec":      _bits(scr, 59, 56),
+        "bus_widths":   [width for bit, width in ((0, 1), (2, 4)) if widths & (1 << bit)],
+        "sd_spec3":     _bits(scr, 47, 47),
+        "cmd_support":  _bits(scr, 33, 32),
+    }
+
+
+def parse_switch_status(data):
+    """Access mode (group 1) fields of the 64 byte CMD6 status."""
+    status = int.from_bytes(bytes(data[:64]), "big")
+    return {
+        "max_current":      _bits(status, 511, 496),
+        "group1_support":   _bits(status, 415, 400),
+        "group1_function":  _bits(status, 379, 376),
+    }
+
+
+class SDCard:
+    """SD card protocol on top of an SDController."""
+    block_size = 512
+
+    def __init__(self, sdc, clk_freq, dma_addr=0x40000000, dma_size=0x8000, auto_stop=True,
+                 queue=None):
+        self.sdc = sdc
+        self.comm = sdc.comm
+        self.clk_freq = clk_freq
+        self.dma_addr = dma_addr
+        self.dma_size = dma_size
+        self.auto_stop = auto_stop
+        self.queue = queue
+        self.rca = 0
+        self.ocr = 0
+        self.version = None
+        self.high_capacity = False
+        self.cid = None
+        self.csd = None
+        self.scr = None
+        self.bus_width = 1
+        self.high_speed = False
+        self.clock = None
+
+    @property
+    def capacity(self):
+        return self.csd["capacity"]
+
+    @property
+    def nblocks(self):
+        return self.capacity//self.block_size
+
+    @property
+    def max_blocks(self):
+        return self.dma_size//self.block_size
+
+    def set_clock(self, freq):
+        """Select the fastest sd_clk not above freq, clk_freq/(2*(N+1))."""
+        divider = max(0, -(-int(self.clk_freq)//(2*int(freq))) - 1)
+        if divider > 0xff:
+            raise ValueError("{} Hz is below the slowest sd_clk".format(freq))
+        with self.comm.batch():
+            self.sdc.write("reset", 1)
+            self.sdc.write("clock_d", divider)
+            self.sdc.write("reset", 0)
+        self.clock = self.clk_freq/(2*(divider + 1))
+        return self.clock
+
+    def _controller(self, stream=False, desc=False):
+        return ((int(self.bus_width == 4) << CONTROLLER_4BIT) |
+                (int(stream) << CONTROLLER_STREAM) |
+                (int(desc) << CONTROLLER_DESC))
+
+    def set_bus_width(self, width):
+        self.bus_width = width
+        self.sdc.write("controller", self._controller())
+
+    def cmd(self, index, arg=0, resp=R1, data_xfer=0, timeout=1.0):
+        """Send a command and wait for it, returns the response words."""
+        self.sdc.send_command(command(index, data_xfer, **resp), arg)
+        try:
+            status = self.sdc.wait_cmd_done(timeout)
+        except SDCTimeout:
+            raise SDCardError("CMD{} not completed".format(index))
+        if status & CmdInt.EI:
+            raise SDCardError("CMD{} failed: {!r}".format(index, status))
+        if resp.get("wait_resp") == 2:
+            with self.comm.batch() as response:
+                for reg in ("resp0", "resp1", "resp2", "resp3"):
+                    self.sdc.read(reg)
+            return response
+        elif resp.get("wait_resp"):
+            return [self.sdc.read("resp0")]
+        return []
+
+    def cmds(self, commands, timeout=1.0):
+        """Send (index, arg, resp) commands in order, through the queue if any."""
+        if self.queue is None:
+            return [self.cmd(index, arg, resp, timeout=timeout) for index, arg, resp in commands]
+        results = self.queue.run([dict(index=index, arg=arg, resp=resp)
+                                  for index, arg, resp in commands], timeout)
+        responses = []
+        for (index, _, resp), result in zip(commands, results):
+            if result.cmd_status & CmdInt.EI:
+                raise SDCardError("CMD{} failed: {!r}".format(index, result.cmd_status))
+            responses.append(result.response[:{0: 0, 1: 1, 2: 4}[resp.get("wait_resp", 0)]])
+        if len(responses) < len(commands):
+            raise SDCardError("CMD{} not completed".format(commands[len(responses)][0]))
+        return responses
+
+    def app_cmd(self, index, arg=0, resp=R1, data_xfer=0, timeout=1.0):
+        self.cmd(55, self.rca << 16)
+        return self.cmd(index, arg, resp, data_xfer, timeout)
+
+    def _read_data(self, index, arg, nbytes, app=False, timeout=1.0):
+        """Read a short data block (SCR, switch status) through the DMA buffer."""
+        if app:
+            self.cmd(55, self.rca << 16)
+        with self.comm.batch():
+            self.sdc.write("blksize", nbytes - 1)
+            self.sdc.write("dst_src_addr", self.dma_addr)
+            self.sdc.write("blkcnt", 0)
+            self.sdc.send_command(command(index, 1, **R1), arg)
+        try:
+            self._finish(index, 1, timeout)
+        finally:
+            self.sdc.write("blksize", self.block_size - 1)
+        return bytes(self.comm.read_block(self.dma_addr, (nbytes + 3)//4))[:nbytes]
+
+    def negotiate(self, bus_width=4, high_speed=True, max_clock=None, timeout=1.0):
+        """Switch to the widest and fastest bus the card allows, returns sd_clk."""
+        self.scr = parse_scr(self._read_data(51, 0, 8, app=True, timeout=timeout))
+        if bus_width == 4 and 4 in self.scr["bus_widths"]:
+            self.app_cmd(6, 2)
+            self.set_bus_width(4)
+
+        freq = min(self.csd["tran_speed"], DEFAULT_CLOCK)
+        self.high_speed = False
+        if high_speed and self.csd["ccc"] & CCC_SWITCH and self.scr["sd_spec"] >= 1:
+            status = parse_switch_status(self._read_data(6, SWITCH_CHECK | SWITCH_HIGH_SPEED, 64,
+                                                         timeout=timeout))
+            if (status["group1_support"] & (1 << SWITCH_HIGH_SPEED) and
+                    status["group1_function"] == SWITCH_HIGH_SPEED):
+                status = parse_switch_status(self._read_data(6, SWITCH_SET | SWITCH_HIGH_SPEED, 64,
+                                                             timeout=timeout))
+                # the card is in high speed 8 clocks after the status block
+                self.high_speed = status["group1_function"] == SWITCH_HIGH_SPEED
+        if self.high_speed:
+            freq = HIGH_SPEED_CLOCK
+        if max_clock is not None:
+            freq = min(freq, max_clock)
+        return self.set_clock(freq)
+
+    def init(self, timeout=1.0, negotiate=True):
+        self.sdc.setup(cmd_timeout=0xffff, data_timeout=0xffffff,
+                       bus_4bit=False, blksize=self.block_size, dma_addr=self.dma_addr)
+        self.bus_width = 1
+        self.set_clock(IDENT_CLOCK)
+
+        # CMD0: go idle
+        self.cmd(0, resp={})
+        time.sleep(0.002)
+
+        # CMD8: interface condition, only answered by v2 cards
+        try:
+            r7 = self.cmd(8, 0x1aa, R7)[0]
+        except SDCardError:
+            self.version = 1
+        else:
+            if r7 & 0xfff != 0x1aa:
+                raise SDCardError("CMD8 pattern mismatch: {:08x}".format(r7))
+            self.version = 2
+
+        # ACMD41: wait for power up
+        arg = OCR_VOLTAGE | (OCR_HCS if self.version == 2 else 0)
+        deadline = time.monotonic() + timeout
+        while True:
+            self.ocr = self.cmds([(55, self.rca << 16, R1), (41, arg, R3)], timeout)[1][0]
+            if self.ocr & OCR_BUSY:
+                break
+            if time.monotonic() >= deadline:
+                raise SDCardError("card did not leave the busy state")
+            time.sleep(0.001)
+        self.high_capacity = bool(self.ocr & OCR_HCS)
+
+        # CMD2: CID, CMD3: relative address
+        cid, r6 = self.cmds([(2, 0, R2), (3, 0, R6)], timeout)
+        self.cid = parse_cid(cid)
+        self.rca = r6[0] >> 16
+
+        # CMD9: CSD, CMD7: select, CMD16: block length (ignored by SDHC/SDXC)
+        csd, _, _ = self.cmds([(9, self.rca << 16, R2), (7, self.rca << 16, R1b),
+                               (16, self.block_size, R1)], timeout)
+        self.csd = parse_csd(csd)
+        self.high_speed = False
+        if negotiate:
+            self.negotiate(timeout=timeout)
+        else:
+            self.set_clock(min(self.csd["tran_speed"], DEFAULT_CLOCK))
+
+    def _block_arg(self, lba):
+        return lba if self.high_capacity else lba*self.block_size
+
+    def _auto_stop(self, count):
+        if count < 2 or not self.auto_stop:
+            return {}
+        if self.scr is not None and self.scr["cmd_support"] & SCR_CMD23:
+            return {"auto_cmd23": 1}
+        return {"auto_cmd12": 1}
+
+    @staticmethod
+    def _index(count, data_xfer):
+        return _transfer_index[data_xfer][count > 1]
+
+    def _start(self, index, lba, count, addr, data_xfer):
+        with self.comm.batch():
+            self.sdc.write("dst_src_addr", addr)
+            self.sdc.write("blkcnt", count - 1)
+            self.sdc.send_command(command(index, data_xfer, **R1, **self._auto_stop(count)),
+                                  self._block_arg(lba))
+
+    def _data_timeout(self, count, timeout):
+        # a DMA buffer in SDRAM holds more than the bus moves in timeout
+        if self.clock:
+            timeout = max(timeout, 2*count*self.block_size*8/(self.bus_width*self.clock))
+        return timeout
+
+    def _finish(self, index, count, timeout):
+        try:
+            status = self.sdc.wait_cmd_done(timeout)
+            if not status & CmdInt.EI:
+                status = self.sdc.wait_data_done(self._data_timeout(count, timeout))
+        except SDCTimeout:
+            raise SDCardError("CMD{} not completed".format(index))
+        if isinstance(status, DataInt) and status & DataInt.CFE:
+            fifo = self.sdc.fifo_status()[0]
+            raise SDCardError("CMD{} failed: {!r} {!r}".format(index, status, fifo))
+        if status & CmdInt.EI:
+            raise SDCardError("CMD{} failed: {!r}".format(index, status))
+        if count > 1 and not self.auto_stop:
+            self.cmd(12, 0, R1b)
+
+    def issue(self, lba, count, write=False, addr=None):
+        """Start a transfer of count blocks without waiting for it."""
+        data_xfer = 2 if write else 1
+        self._start(self._index(count, data_xfer), lba, count,
+                    self.dma_addr if addr is None else addr, data_xfer)
+
+    def complete(self, count, write=False, timeout=1.0):
+        """Wait for the transfer started by issue()."""
+        data_xfer = 2 if write else 1
+        self._finish(self._index(count, data_xfer), count, timeout)
+
+    def read_blocks(self, lba, count, timeout=1.0):
+        """Stream count blocks, yielding a memoryview per transfer."""
+        window_size = self.dma_size//2
+        window_blocks = window_size//self.block_size
+        pending = None
+        window = 0
+        # (index, blocks) of the command filling a window, until finished
+        running = None
+        try:
+            while count or pending:
+                if not count:
+                    yield self.comm.read_block(*pending)
+                    return
+                n = min(count, window_blocks)
+                addr = self.dma_addr + window*window_size
+                index = self._index(n, 1)
+                running = (index, n)
+                with self.comm.batch() as data:
+                    self._start(index, lba, n, addr, 1)
+                    if pending:
+                        self.comm.read_block(*pending)
+                if pending:
+                    yield data[0]
+                try:
+                    self._finish(index, n, timeout)
+                except SDCardError:
+                    running = None
+                    raise
+                running = None
+                pending = (addr, n*self.block_size//4)
+                window ^= 1
+                lba += n
+                count -= n
+        finally:
+            if running is not None:
+                # the caller stopped early (close(), an exception, Ctrl-C):
+                # let the card finish, the next command would find it busy
+                try:
+                    self._finish(*running, timeout)
+                except SDCardError:
+                    pass
+
+    def read(self, lba, count=1, timeout=1.0):
+        """Read count blocks, see read_blocks()."""
+        return b"".join(self.read_blocks(lba, count, timeout))
+
+    def write(self, lba, data, timeout=1.0):
+        """Write whole blocks, one CMD25 per DMA buffer."""
+        data = memoryview(data).cast("B")
+        if len(data) % self.block_size:
+            raise ValueError("data is not a multiple of the block size")
+        pos = 0
+        while pos < len(data):
+            n = min((len(data) - pos)//self.block_size, self.max_blocks)
+            index = self._index(n, 2)
+            with self.comm.batch():
+                self.comm.write_block(self.dma_addr, data[pos:pos + n*self.block_size])
+                self._start(index, lba, n, self.dma_addr, 2)
+            self._finish(index, n, timeout)
+            lba += n
+            pos += n*self.block_size
+
+    def _stream(self, index, lba, count, data_xfer, timeout):
+        with self.comm.batch():
+            self.sdc.write("controller", self._controller(stream=True))
+            self._start(index, lba, count, 0, data_xfer)
+        try:
+            self._finish(index, count, timeout)
+        finally:
+            self.sdc.write("controller", self._controller())
+
+    def read_to_stream(self, lba, count=1, timeout=1.0):
+        """Read count blocks into the gateware's stream source."""
+        self._stream(self._index(count, 1), lba, count, 1, timeout)
+
+    def write_from_stream(self, lba, count=1, timeout=1.0):
+        """Write count blocks from the gateware's stream sink."""
+        self._stream(self._index(count, 2), lba, count, 2, timeout)
+
+    def _sg(self, index, lba, buffers, table_addr, data_xfer, timeout):
+        count = sum(blocks for _, blocks in buffers)
+        with self.comm.batch():
+            self.comm.write_block(table_addr, descriptor_chain(table_addr, buffers))
+            self.sdc.write("controller", self._controller(desc=True))
+            self._start(index, lba, count, table_addr, data_xfer)
+        try:
+            self._finish(index, count, timeout)
+        finally:
+            self.sdc.write("controller", self._controller())
+        with self.comm.batch() as status:
+            for i in range(len(buffers)):
+                self.comm.read(table_addr + i*DESC_SIZE + 12)
+        for i, ((buf, blocks), word) in enumerate(zip(buffers, status)):
+            if not word >> DESC_DONE & 1:
+                raise SDCardError("descriptor {} ({:08x}, {} blocks) not completed".format(i, buf, blocks))
+
+    def read_sg(self, lba, buffers, table_addr, timeout=1.0):
+        """Read into (address, blocks) buffers through a descriptor chain."""
+        count = sum(blocks for _, blocks in buffers)
+        self._sg(self._index(count, 1), lba, buffers, table_addr, 1, timeout)
+
+    def write_sg(self, lba, buffers, table_addr, timeout=1.0):
+        """Write from (address, blocks) buffers through a descriptor chain."""
+        count = sum(blocks for _, blocks in buffers)
+        self._sg(self._index(count, 2), lba, buffers, table_addr, 2, timeout)
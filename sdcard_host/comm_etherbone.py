@@ -0,0 +1,105 @@
+import socket
+import struct
+
+from sdcard_host.comm_uart import CommUART
+
+
+ETHERBONE_MAGIC = 0x4e6f
+ETHERBONE_VERSION = 1
+ETHERBONE_PORT = 1234
+
+# packet header: magic, version/flags, address/port size (4 bytes each),
+# padding; record header: flags, byte enables, write count, read count
+_packet_header = struct.Struct(">HBB4x")
+_record_header = struct.Struct(">BBBB")
+
+
+def encode_packet(writes=None, reads=None, base_ret_addr=0):
+    """One Etherbone packet with a single record."""
+    wdata = writes[1] if writes else b""
+    reads = reads or []
+    packet = bytearray(_packet_header.pack(ETHERBONE_MAGIC, ETHERBONE_VERSION << 4, 0x44))
+    packet += _record_header.pack(0, 0x0f, len(wdata)//4, len(reads))
+    if writes:
+        packet += struct.pack(">I", writes[0])
+        packet += wdata
+    if reads:
+        packet += struct.pack(">I{}I".format(len(reads)), base_ret_addr, *reads)
+    return packet
+
+
+def decode_packet(packet):
+    """Split a packet into (writes, reads, base_ret_addr)."""
+    if len(packet) < _packet_header.size + _record_header.size:
+        raise ValueError("short etherbone packet ({} bytes)".format(len(packet)))
+    magic, version, sizes = _packet_header.unpack_from(packet)
+    if magic != ETHERBONE_MAGIC or version >> 4 != ETHERBONE_VERSION or sizes != 0x44:
+        raise ValueError("not a 32-bit etherbone packet: {}".format(bytes(packet[:4]).hex()))
+    pos = _packet_header.size
+    _, _, wcount, rcount = _record_header.unpack_from(packet, pos)
+    pos += _record_header.size
+    if len(packet) < pos + (4 + 4*wcount if wcount else 0) + (4 + 4*rcount if rcount else 0):
+        raise ValueError("truncated etherbone record")
+    writes = None
+    if wcount:
+        base = struct.unpack_from(">I", packet, pos)[0]
+        writes = (base, bytes(packet[pos + 4:pos + 4 + 4*wcount]))
+        pos += 4 + 4*wcount
+    reads, base_ret_addr = [], 0
+    if rcount:
+        base_ret_addr, *reads = struct.unpack_from(">I{}I".format(rcount), packet, pos)
+    return writes, reads, base_ret_addr
+
+
+class CommEtherbone(CommUART):
+    """CommUART interface over a LiteEth Etherbone bridge (UDP)."""
+    _tx_buffer = list
+
+    def __init__(self, host, port=ETHERBONE_PORT, debug=False, timeout=1.0, metrics=None):
+        CommUART.__init__(self, "udp://{}:{}".format(host, port), addressing="byte", debug=debug,
+                          metrics=metrics)
+        self.host = host
+        self.udp_port = port
+        self.timeout = timeout
+
+    def open(self):
+        if self.port is not None:
+            return
+        self.port = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.port.settimeout(self.timeout)
+        self.port.connect((self.host, self.udp_port))
+
+    def _encode_write(self, tx, addr, data):
+        nwords = len(data)//4
+        for offset in range(0, nwords, self.max_burst):
+            size = min(nwords - offset, self.max_burst)
+            tx.append((encode_packet(writes=(addr + 4*offset, data[4*offset:4*(offset + size)])), 0))
+
+    def _encode_read(self, tx, addr, nwords):
+        for offset in range(0, nwords, self.max_burst):
+            size = min(nwords - offset, self.max_burst)
+            reads = [addr + 4*(offset + i) for i in range(size)]
+            tx.append((encode_packet(reads=reads), size))
+
+    def _transact(self, packet, nwords):
+        self.port.send(packet)
+        if not nwords:
+            return b""
+        try:
+            writes, _, _ = decode_packet(self.port.recv(65536))
+        except socket.timeout:
+            raise TimeoutError("no etherbone reply from {}:{}".format(self.host, self.udp_port)) from None
+        if writes is None or len(writes[1]) != 4*nwords:
+            raise ValueError("etherbone reply does not match the {} word read".format(nwords))
+        return writes[1]
+
+    @staticmethod
+    def _wire_length(tx):
+        return sum(len(packet) for packet, _ in tx)
+
+    def _transfer(self, tx, rx):
+        """Send the queued packets one at a time, returns the read data."""
+        data = bytearray()
+        for packet, nwords in tx:
+            data += self._transact(packet, nwords)
+        return data
@@ -0,0 +1,249 @@
+import socket
+import struct
+import sys
+import time
+from array import array
+from contextlib import contextmanager
+
+
+class BridgeFrames:
+    """UARTWishboneBridge framing shared by CommUART and AsyncCommUART."""
+    # A frame is the message type, an 8-bit word count and the address
+    # (big-endian); a write is followed by its words, a read is answered
+    # by them, in the order the frames were sent.
+    msg_type = {
+        "write": 0x01,
+        "read":  0x02
+    }
+    # the bridge frame carries an 8-bit word count
+    max_burst = 255
+    # what _encode_write()/_encode_read() append the outgoing frames to
+    _tx_buffer = bytearray
+
+    def __init__(self, port, baudrate, addressing, debug, low_latency, metrics):
+        if addressing not in ("word", "byte"):
+            raise ValueError("addressing must be \"word\" or \"byte\"")
+        self.port_name = port
+        self.baudrate = baudrate
+        self.addressing = addressing
+        self.debug = debug
+        self.low_latency = baudrate > 115200 if low_latency is None else low_latency
+        self.metrics = metrics
+        self._tx = self._tx_buffer()
+        self._rx = []
+        # (op, address, first word written) of the queued accesses, with metrics
+        self._ops = []
+
+    def _frame(self, msg, length, addr):
+        if self.addressing == "word":
+            addr //= 4
+        return struct.pack(">BBI", self.msg_type[msg], length, addr)
+
+    def _encode_write(self, tx, addr, data):
+        nwords = len(data)//4
+        offset = 0
+        while offset < nwords:
+            size = min(nwords - offset, self.max_burst)
+            tx += self._frame("write", size, addr + 4*offset)
+            tx += data[4*offset:4*(offset + size)]
+            offset += size
+
+    def _encode_read(self, tx, addr, nwords):
+        offset = 0
+        while offset < nwords:
+            size = min(nwords - offset, self.max_burst)
+            tx += self._frame("read", size, addr + 4*offset)
+            offset += size
+
+    def _pack_words(self, addr, data):
+        data = data if isinstance(data, list) else [data]
+        if self.debug:
+            for i, value in enumerate(data):
+                print("write {:08x} @ {:08x}".format(value, addr + 4*i))
+        return struct.pack(">{}I".format(len(data)), *data)
+
+    def _pack_block(self, buf):
+        if isinstance(buf, array) and buf.typecode == "I":
+            if sys.byteorder == "little":
+                buf = array("I", buf)
+                buf.byteswap()
+        elif isinstance(buf, array) and buf.itemsize != 1:
+            # other widths would go out in host byte order
+            raise TypeError("word values must be an array(\"I\"), not array(\"{}\")".format(buf.typecode))
+        data = memoryview(buf).cast("B")
+        if len(data) % 4:
+            raise ValueError("block length must be a multiple of 4 bytes")
+        return data
+
+    def _decode(self, rx, buf):
+        view = memoryview(buf)
+        results = []
+        pos = 0
+        for addr, length, raw in rx:
+            length_int = 1 if length is None else length
+            if raw:
+                results.append(view[pos:pos + 4*length_int])
+            else:
+                values = struct.unpack_from(">{}I".format(length_int), buf, pos)
+                if self.debug:
+                    for i, value in enumerate(values):
+                        print("read {:08x} @ {:08x}".format(value, addr + 4*i))
+                results.append(values[0] if length is None else list(values))
+            pos += 4*length_int
+        return results
+
+    @staticmethod
+    def _reply_length(rx):
+        return 4*sum(1 if length is None else length for _, length, _ in rx)
+
+    @staticmethod
+    def _wire_length(tx):
+        return len(tx)
+
+    def _queue_read(self, queue, addr, length, raw):
+        tx, rx, ops = queue
+        self._encode_read(tx, addr, 1 if length is None else length)
+        rx.append((addr, length, raw))
+        if self.metrics is not None:
+            ops.append(("read", addr, None))
+
+    def _queue_write(self, queue, addr, data, raw):
+        tx, rx, ops = queue
+        if raw:
+            self._encode_write(tx, addr, self._pack_block(data))
+        else:
+            self._encode_write(tx, addr, self._pack_words(addr, data))
+        if self.metrics is not None:
+            ops.append(("write", addr, None if raw else data[0] if isinstance(data, list) else data))
+
+    def _record(self, start, t0, tx, data, ops):
+        self.metrics.record(start, time.perf_counter() - t0, self._wire_length(tx), len(data), ops)
+
+    def submit_read(self, addr, length=None):
+        """Queue a read, the value is returned by the next flush()."""
+        self._queue_read((self._tx, self._rx, self._ops), addr, length, False)
+
+    def submit_write(self, addr, data):
+        """Queue a write, it is sent on the wire by the next flush()."""
+        self._queue_write((self._tx, self._rx, self._ops), addr, data, False)
+
+    def submit_read_block(self, addr, nwords):
+        """Queue a raw block read, see read_block()."""
+        self._queue_read((self._tx, self._rx, self._ops), addr, nwords, True)
+
+    def submit_write_block(self, addr, buf):
+        """Queue a raw block write, see write_block()."""
+        self._queue_write((self._tx, self._rx, self._ops), addr, buf, True)
+
+
+class CommUART(BridgeFrames):
+    """Host side of LiteX's UARTWishboneBridge."""
+    def __init__(self, port, baudrate=115200, addressing="word", debug=False, low_latency=None,
+                 metrics=None):
+        BridgeFrames.__init__(self, port, baudrate, addressing, debug, low_latency, metrics)
+        self.port = None
+        self._batching = False
+        self._batches = []
+
+    def open(self):
+        if self.port is not None:
+            return
+        import serial
+        self.port = serial.serial_for_url(self.port_name, self.baudrate)
+        if self.port_name.startswith("socket://"):
+            # a write and the read after it would wait for the delayed ACK
+            self.port._socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        if self.low_latency and hasattr(self.port, "set_low_latency_mode"):
+            try:
+                self.port.set_low_latency_mode(True)
+            except (OSError, ValueError):
+                # not a serial driver with ASYNC_LOW_LATENCY (pty, ...)
+                pass
+
+    def close(self):
+        if self.port is None:
+            return
+        self.port.close()
+        self.port = None
+
+    def _read(self, length):
+        r = bytearray()
+        while len(r) < length:
+            r.extend(self.port.read(length - len(r)))
+        return r
+
+    def _write(self, data):
+        data = memoryview(data)
+        remaining = len(data)
+        pos = 0
+        while remaining:
+            written = self.port.write(data[pos:])
+            remaining -= written
+            pos += written
+
+    def _transfer(self, tx, rx):
+        """Put the queued frames on the wire, returns the reply bytes."""
+        self._write(tx)
+        return self._read(self._reply_length(rx))
+
+    def flush(self):
+        """Send all queued frames at once, returns the read replies."""
+        tx, rx, ops = self._tx, self._rx, self._ops
+        self._tx, self._rx, self._ops = self._tx_buffer(), [], []
+        if not tx:
+            return []
+        self.open()
+        if self.metrics is None:
+            return self._decode(rx, self._transfer(tx, rx))
+        start = time.time()
+        t0 = time.perf_counter()
+        data = self._transfer(tx, rx)
+        self._record(start, t0, tx, data, ops)
+        return self._decode(rx, data)
+
+    @contextmanager
+    def batch(self):
+        """Send every read/write issued in the block as one buffer."""
+        results = []
+        outer = not self._batching
+        start = len(self._rx)
+        self._batching = True
+        try:
+            yield results
+        except BaseException:
+            if outer:
+                self._tx, self._rx, self._ops, self._batches = self._tx_buffer(), [], [], []
+            raise
+        finally:
+            if outer:
+                self._batching = False
+        self._batches.append((results, start, len(self._rx)))
+        if outer:
+            batches, self._batches = self._batches, []
+            values = self.flush()
+            for results, start, end in batches:
+                results.extend(values[start:end])
+
+    def read(self, addr, length=None):
+        self.submit_read(addr, length)
+        if self._batching:
+            return None
+        return self.flush()[0]
+
+    def write(self, addr, data):
+        self.submit_write(addr, data)
+        if not self._batching:
+            self.flush()
+
+    def read_block(self, addr, nwords):
+        """Read nwords words as a memoryview of their big-endian bytes."""
+        self.submit_read_block(addr, nwords)
+        if self._batching:
+            return None
+        return self.flush()[0]
+
+    def write_block(self, addr, buf):
+        """Write big-endian words from a bytes-like object or an array("I")."""
+        self.submit_write_block(addr, buf)
+        if not self._batching:
+            self.flush()
@@ -0,0 +1,113 @@
+"""SD bus CRCs, bit-exact with verilog/sd_crc_7.v and sd_crc_16.v."""
+import binascii
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+# Both shift registers start at 0 and take the bits MSB first: CRC7 is
+# x^7 + x^3 + 1 over the first 40 bits of a command or response (the
+# 120 bits of an R2), CRC16 is the CCITT x^16 + x^12 + x^5 + 1 over each
+# DAT line of a data block. On a 4-bit bus every byte goes out as two
+# nibbles, high one first, and DAT[i] carries bit i of each nibble, so a
+# block has one CRC16 per lane (sd_data_serial_host.v).
+
+# below this many blocks per batch the translate() path is faster
+NUMPY_MIN_BLOCKS = 128
+
+def _crc7_byte(byte):
+    crc = 0
+    for i in range(7, -1, -1):
+        inv = ((byte >> i) & 1) ^ (crc >> 6)
+        crc = ((crc << 1) & 0x7f) ^ (0x09 if inv else 0)
+    return crc
+
+
+# CRC7 after a byte from 0, a byte b from crc c is _CRC7[(c << 1) ^ b]
+_CRC7 = bytes(_crc7_byte(byte) for byte in range(256))
+
+
+def crc7(data, crc=0):
+    """CRC7 of bytes, e.g. the first 5 bytes of a command frame."""
+    for byte in data:
+        crc = _CRC7[(crc << 1) ^ byte]
+    return crc
+
+
+def command_frame(index, arg):
+    """The 48 bits of a command as 6 bytes."""
+    frame = bytes([0x40 | index]) + arg.to_bytes(4, "big")
+    return frame + bytes([(crc7(frame) << 1) | 1])
+
+
+def crc16(data, crc=0):
+    """CRC16 of bytes sent on one line (DAT0 of a 1-bit bus)."""
+    return binascii.crc_hqx(data, crc)
+
+
+def _crc16_bits(crc, value, nbits):
+    for i in range(nbits - 1, -1, -1):
+        inv = ((value >> i) & 1) ^ (crc >> 15)
+        crc = ((crc << 1) & 0xffff) ^ (0x1021 if inv else 0)
+    return crc
+
+
+# _SPLIT[lane][k][b]: the two bits of byte b on DAT[lane], placed for
+# byte k of a group of 4 data bytes (which fill one byte of the lane)
+_SPLIT = [[bytes(((((b >> (4 + lane)) & 1) << 1) | ((b >> lane) & 1)) << (6 - 2*k) for b in range(256))
+           for k in range(4)] for lane in range(4)]
+
+
+def lanes(data):
+    """Split bytes sent on a 4-bit bus into the bits of each DAT line."""
+    data = bytes(data)
+    n = len(data)//4
+    tail = data[4*n:]
+    result = []
+    for split in _SPLIT:
+        value = 0
+        for k in range(4):
+            value |= int.from_bytes(data[k:4*n:4].translate(split[k]), "big")
+        rest = 0
+        for byte in tail:
+            rest = (rest << 2) | (split[3][byte])
+        result.append((value.to_bytes(n, "big"), (rest, 2*len(tail))))
+    return result
+
+
+def crc16_4bit(data):
+    """The CRC16 of DAT0..DAT3 for bytes sent on a 4-bit bus."""
+    crcs = []
+    for lane, (rest, nbits) in lanes(data):
+        crc = binascii.crc_hqx(lane, 0)
+        if nbits:
+            crc = _crc16_bits(crc, rest, nbits)
+        crcs.append(crc)
+    return tuple(crcs)
+
+
+def crc16_4bit_blocks(data, block_size=512):
+    """crc16_4bit() of every block_size bytes of data."""
+    data = memoryview(data).cast("B")
+    if len(data) % block_size:
+        raise ValueError("data is not a multiple of the block size")
+    if numpy is None or block_size % 4 or len(data) < NUMPY_MIN_BLOCKS*block_size:
+        return [crc16_4bit(data[i:i + block_size]) for i in range(0, len(data), block_size)]
+    blocks = numpy.frombuffer(data, numpy.uint8).reshape(-1, block_size)
+    nibbles = numpy.empty((len(blocks), 2*block_size), numpy.uint8)
+    nibbles[:, 0::2] = blocks >> 4
+    nibbles[:, 1::2] = blocks & 0xf
+    bits = (nibbles[:, None, :] >> numpy.arange(4, dtype=numpy.uint8)[None, :, None]) & 1
+    lane_bytes = numpy.packbits(bits, axis=2)
+    table = numpy.array([binascii.crc_hqx(bytes([byte]), 0) for byte in range(256)], numpy.uint32)
+    crc = numpy.zeros(lane_bytes.shape[:2], numpy.uint32)
+    for k in range(lane_bytes.shape[2]):
+        crc = ((crc << 8) & 0xffff) ^ table[(crc >> 8) ^ lane_bytes[:, :, k]]
+    return [tuple(int(c) for c in row) for row in crc]
+
+
+def crc_nibbles(crcs):
+    """The 16 DAT values that send the CRC16s of crc16_4bit()."""
+    return [sum(((crc >> i) & 1) << lane for lane, crc in enumerate(crcs)) for i in range(15, -1, -1)]
@@ -0,0 +1,133 @@
+import json
+import mmap
+import os
+import sys
+import time
+from contextlib import closing
+
+
+class _Checkpoint:
+    """Progress record next to the image so an interrupted run can resume."""
+    def __init__(self, path, job, interval=1.0):
+        self.path = path
+        self.job = job
+        self.interval = interval
+        self.last = 0
+
+    def load(self):
+        try:
+            with open(self.path) as f:
+                state = json.load(f)
+        except FileNotFoundError:
+            return 0
+        if state.get("job") != self.job:
+            raise ValueError("{} belongs to another job: {}".format(self.path, state.get("job")))
+        return state["done"]
+
+    def save(self, done, fd=None, force=False):
+        now = time.monotonic()
+        if not force and now - self.last < self.interval:
+            return
+        if fd is not None:
+            os.fsync(fd)
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump({"job": self.job, "done": done}, f)
+        os.replace(tmp, self.path)
+        self.last = now
+
+    def remove(self):
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+
+class _Progress:
+    def __init__(self, total, block_size, done=0, out=sys.stderr):
+        self.total = total
+        self.block_size = block_size
+        self.first = done
+        self.done = done
+        self.out = out
+        self.start = time.monotonic()
+
+    def rate(self):
+        elapsed = time.monotonic() - self.start
+        return (self.done - self.first)*self.block_size/elapsed if elapsed else 0
+
+    def update(self, blocks):
+        self.done += blocks
+        self.out.write("\r{}/{} blocks, {:.1f} KiB/s".format(self.done, self.total, self.rate()/1024))
+        self.out.flush()
+
+    def finish(self):
+        self.out.write("\n")
+
+
+def dump(card, path, start=0, count=None, resume=True, sparse=False, preallocate=False):
+    """Read count blocks from start LBA into the image file at path."""
+    if count is None:
+        count = card.nblocks - start
+    size = count*card.block_size
+    checkpoint = _Checkpoint(path + ".ckpt", {"op": "dump", "start": start, "count": count})
+    done = checkpoint.load() if resume else 0
+
+    fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o666)
+    try:
+        if not done:
+            # drop old contents, sparse holes must read back as zeros
+            os.ftruncate(fd, 0)
+        os.ftruncate(fd, size)
+        if preallocate:
+            os.posix_fallocate(fd, 0, size)
+        progress = _Progress(count, card.block_size, done)
+        try:
+            offset = done*card.block_size
+            # closed right away on Ctrl-C, not when the traceback goes
+            with closing(card.read_blocks(start + done, count - done)) as blocks:
+                for data in blocks:
+                    if not (sparse and not any(data)):
+                        os.pwrite(fd, data, offset)
+                    offset += len(data)
+                    done += len(data)//card.block_size
+                    progress.update(len(data)//card.block_size)
+                    checkpoint.save(done, fd)
+        finally:
+            checkpoint.save(done, fd, force=True)
+            progress.finish()
+    finally:
+        os.close(fd)
+    checkpoint.remove()
+    return progress.rate()
+
+
+def restore(card, path, start=0, resume=True):
+    """Write the image file at path to the card from start LBA."""
+    with open(path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        if size % card.block_size:
+            raise ValueError("{} is not a multiple of {} bytes".format(path, card.block_size))
+        count = size//card.block_size
+        if start + count > card.nblocks:
+            raise ValueError("image does not fit on the card")
+        checkpoint = _Checkpoint(path + ".restore.ckpt", {"op": "restore", "start": start, "count": count})
+        done = checkpoint.load() if resume else 0
+        progress = _Progress(count, card.block_size, done)
+        if not count:
+            return 0
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as image:
+            try:
+                while done < count:
+                    n = min(count - done, card.max_blocks)
+                    # a bytes copy: no view into the mmap outlives the write,
+                    # so closing it can't fail with BufferError
+                    card.write(start + done, image[done*card.block_size:(done + n)*card.block_size])
+                    done += n
+                    progress.update(n)
+                    checkpoint.save(done)
+            finally:
+                checkpoint.save(done, force=True)
+                progress.finish()
+    checkpoint.remove()
+    return progress.rate()
@@ -0,0 +1,189 @@
+import bisect
+from collections import OrderedDict, deque
+
+from sdcard_host.sd_defines import CMD_AUTO_CMD12, CMD_AUTO_CMD23, CMD_INDEX, registers
+
+
+# upper bounds (seconds) of the transaction time buckets, +Inf is implied
+BUCKETS = (50e-6, 100e-6, 250e-6, 500e-6, 1e-3, 2.5e-3, 5e-3, 10e-3, 25e-3, 50e-3, 100e-3,
+           250e-3, 500e-3, 1.0)
+
+
+class Histogram:
+    """Per-bucket (not cumulative) counts of a series of observations."""
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0]*(len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.min = None
+        self.max = None
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the q quantile."""
+        if not self.count:
+            return None
+        rank = q*self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def as_dict(self):
+        return OrderedDict([
+            ("count", self.count),
+            ("sum", self.sum),
+            ("min", self.min),
+            ("max", self.max),
+            ("p50", self.quantile(0.5)),
+            ("p99", self.quantile(0.99)),
+            ("buckets", OrderedDict(zip([str(b) for b in self.buckets] + ["+Inf"], self.counts))),
+        ])
+
+
+class Record:
+    """One flush() of the link."""
+    __slots__ = ("start", "seconds", "tx_bytes", "rx_bytes", "accesses", "cmd")
+
+    def __init__(self, start, seconds, tx_bytes, rx_bytes, accesses, cmd):
+        self.start = start
+        self.seconds = seconds
+        self.tx_bytes = tx_bytes
+        self.rx_bytes = rx_bytes
+        self.accesses = accesses
+        self.cmd = cmd
+
+    def as_dict(self):
+        return OrderedDict((name, getattr(self, name)) for name in self.__slots__)
+
+
+class TransportMetrics:
+    """Per-transaction timing of a CommUART, by SD command and register."""
+    def __init__(self, base=0x50000000, buckets=BUCKETS, keep=1000):
+        self.base = base
+        self.buckets = buckets
+        self._names = {offset: name for name, offset in registers.items()}
+        self._commands = {base + registers["command"]}
+        self.records = deque(maxlen=keep)
+        self.clear()
+
+    def watch_queue(self, addr):
+        """Take writes to addr, a command queue's command CSR, as commands."""
+        self._commands.add(addr)
+
+    def clear(self):
+        self.cmd = None
+        self._index = None
+        self.commands = OrderedDict()
+        self.auto_cmds = OrderedDict([("CMD12", 0), ("CMD23", 0)])
+        self.by_cmd = OrderedDict()
+        self.by_register = OrderedDict()
+        self.bytes = OrderedDict()
+        self.records.clear()
+
+    def register(self, addr):
+        return self._names.get(addr - self.base, "other")
+
+    def _cmd(self, op, addr, value):
+        """The label of the command a write sends, None for other accesses."""
+        if op != "write" or addr not in self._commands:
+            return None
+        index = (value >> CMD_INDEX) & 0x3f
+        cmd = "{}{}".format("ACMD" if self._index == 55 else "CMD", index)
+        self._index = index
+        # CMD23 wins over CMD12 (sd_auto_cmd.v)
+        for bit, auto in ((CMD_AUTO_CMD23, "CMD23"), (CMD_AUTO_CMD12, "CMD12")):
+            if value & (1 << bit):
+                self.auto_cmds[auto] += 1
+                cmd += " (auto {})".format(auto)
+                break
+        self.commands[cmd] = self.commands.get(cmd, 0) + 1
+        return cmd
+
+    def _histogram(self, table, key):
+        histogram = table.get(key)
+        if histogram is None:
+            histogram = table[key] = Histogram(self.buckets)
+        return histogram
+
+    def record(self, start, seconds, tx_bytes, rx_bytes, ops):
+        """Account one flush() of the link."""
+        accesses = []
+        cmds = []
+        for op, addr, value in ops:
+            cmd = self._cmd(op, addr, value)
+            if cmd is not None:
+                cmds.append(cmd)
+            access = (op, self.register(addr))
+            if access not in accesses:
+                accesses.append(access)
+        if cmds:
+            self.cmd = "+".join(cmds)
+        cmd = self.cmd or "none"
+        self._histogram(self.by_cmd, cmd).observe(seconds)
+        for access in accesses:
+            self._histogram(self.by_register, access).observe(seconds)
+        tx, rx = self.bytes.get(cmd, (0, 0))
+        self.bytes[cmd] = (tx + tx_bytes, rx + rx_bytes)
+        self.records.append(Record(start, seconds, tx_bytes, rx_bytes, accesses, cmd))
+
+    def as_dict(self, records=False):
+        d = OrderedDict()
+        d["by_cmd"] = OrderedDict()
+        for cmd, histogram in self.by_cmd.items():
+            entry = histogram.as_dict()
+            entry["tx_bytes"], entry["rx_bytes"] = self.bytes[cmd]
+            d["by_cmd"][cmd] = entry
+        d["commands"] = OrderedDict(self.commands)
+        d["auto_cmds"] = OrderedDict(self.auto_cmds)
+        d["by_register"] = OrderedDict(("{} {}".format(*access), histogram.as_dict())
+                                       for access, histogram in self.by_register.items())
+        if records:
+            d["records"] = [record.as_dict() for record in self.records]
+        return d
+
+    def prometheus(self, prefix="sdcard_host"):
+        """The histograms in the Prometheus text exposition format."""
+        lines = []
+
+        def histogram(name, help, series):
+            lines.append("# HELP {}_{} {}".format(prefix, name, help))
+            lines.append("# TYPE {}_{} histogram".format(prefix, name))
+            for labels, h in series:
+                cumulative = 0
+                for bound, count in zip([repr(b) for b in h.buckets] + ["+Inf"], h.counts):
+                    cumulative += count
+                    lines.append("{}_{}_bucket{{{},le=\"{}\"}} {}".format(
+                        prefix, name, labels, bound, cumulative))
+                lines.append("{}_{}_sum{{{}}} {!r}".format(prefix, name, labels, h.sum))
+                lines.append("{}_{}_count{{{}}} {}".format(prefix, name, labels, h.count))
+
+        histogram("transaction_seconds", "Bridge round trip time per SD command.",
+                  [("cmd=\"{}\"".format(cmd), h) for cmd, h in self.by_cmd.items()])
+        histogram("register_transaction_seconds", "Round trip time of the transactions accessing a register.",
+                  [("op=\"{}\",register=\"{}\"".format(*access), h) for access, h in self.by_register.items()])
+        lines.append("# HELP {}_commands_total SD commands sent, queue entries included.".format(prefix))
+        lines.append("# TYPE {}_commands_total counter".format(prefix))
+        for cmd, count in self.commands.items():
+            lines.append("{}_commands_total{{cmd=\"{}\"}} {}".format(prefix, cmd, count))
+        lines.append("# HELP {}_auto_commands_total CMD12/CMD23 sent by the controller itself.".format(prefix))
+        lines.append("# TYPE {}_auto_commands_total counter".format(prefix))
+        for cmd, count in self.auto_cmds.items():
+            lines.append("{}_auto_commands_total{{cmd=\"{}\"}} {}".format(prefix, cmd, count))
+        for i, direction in enumerate(("tx", "rx")):
+            lines.append("# HELP {}_{}_bytes_total Bytes {} over the bridge per SD command.".format(
+                prefix, direction, "sent" if direction == "tx" else "received"))
+            lines.append("# TYPE {}_{}_bytes_total counter".format(prefix, direction))
+            for cmd, counts in self.bytes.items():
+                lines.append("{}_{}_bytes_total{{cmd=\"{}\"}} {}".format(prefix, direction, cmd, counts[i]))
+        return "\n".join(lines) + "\n"
+
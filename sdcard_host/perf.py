@@ -0,0 +1,66 @@
+import csv
+from collections import OrderedDict
+
+
+def csr_registers(csr_csv, prefix):
+    """The CSRs of a bank in a csr.csv, name to (address, size in words)."""
+    registers = OrderedDict()
+    with open(csr_csv) as f:
+        for row in csv.reader(f):
+            if row and row[0] == "csr_register" and row[1].startswith(prefix):
+                registers[row[1][len(prefix):]] = (int(row[2], 0), int(row[3]))
+    return registers
+
+
+class PerfCounters:
+    """SDCARDPerf counter bank (see sdcard.py) behind a CommUART."""
+    controls = ("snapshot", "clear")
+
+    def __init__(self, comm, csr_csv, prefix="sdcard_perf_"):
+        self.comm = comm
+        self.registers = csr_registers(csr_csv, prefix)
+        for name in self.controls:
+            if name not in self.registers:
+                raise ValueError("no {}{} register in {}, design built without perf?".format(
+                    prefix, name, csr_csv))
+
+    @property
+    def counters(self):
+        return [name for name in self.registers if name not in self.controls]
+
+    def snapshot(self):
+        self.comm.write(self.registers["snapshot"][0], 1)
+
+    def clear(self):
+        self.comm.write(self.registers["clear"][0], 1)
+
+    def read(self, snapshot=True, clear=False):
+        """Return an OrderedDict of all counters."""
+        with self.comm.batch() as values:
+            if snapshot:
+                self.snapshot()
+            for name in self.counters:
+                addr, size = self.registers[name]
+                self.comm.read(addr, size)
+            if clear:
+                self.clear()
+        result = OrderedDict()
+        for name, words in zip(self.counters, values):
+            value = 0
+            for word in words:
+                value = (value << 32) | word
+            result[name] = value
+        return result
+
+
+def summary(counters, clk_freq):
+    """Derived figures from read()."""
+    data_cycles = counters["data_cycles"]
+    s = OrderedDict()
+    if counters["cmds"]:
+        s["cmd_latency_us"] = counters["cmd_cycles"]/counters["cmds"]*1e6/clk_freq
+    if data_cycles:
+        for name in ("write_busy", "rx_full", "rx_empty", "tx_full", "tx_empty"):
+            s[name + "_share"] = counters[name + "_cycles"]/data_cycles
+        s["data_kib_s"] = counters["words"]*4/(data_cycles/clk_freq)/1024
+    return s
@@ -0,0 +1,94 @@
+import time
+from collections import namedtuple
+
+from sdcard_host.card import R1
+from sdcard_host.perf import csr_registers
+from sdcard_host.sd_defines import CmdInt, DataInt
+from sdcard_host.sdc import SDCTimeout, command
+
+
+# entry flags above the command register bits (SDCARDCmdQueue)
+QUEUE_WAIT_DATA = 16
+QUEUE_KEEP_GOING = 17
+
+QueueResult = namedtuple("QueueResult", "index cmd_status data_status response")
+
+
+class CommandQueue:
+    """SDCARDCmdQueue (see sdcard.py) behind a CommUART."""
+    controls = ("command", "argument", "status", "result_status", "result_response",
+                "result_pop", "flush")
+
+    def __init__(self, comm, csr_csv, prefix="sdcard_cmd_queue_", depth=16,
+                 poll_interval=0.0005, poll_max_interval=0.05):
+        self.comm = comm
+        self.registers = csr_registers(csr_csv, prefix)
+        for name in self.controls:
+            if name not in self.registers:
+                raise ValueError("no {}{} register in {}, design built without the command queue?".format(
+                    prefix, name, csr_csv))
+        if getattr(comm, "metrics", None) is not None:
+            comm.metrics.watch_queue(self._addr("command"))
+        self.depth = depth
+        self.poll_interval = poll_interval
+        self.poll_max_interval = poll_max_interval
+
+    def _addr(self, name):
+        return self.registers[name][0]
+
+    def post(self, index, arg=0, resp=R1, data_xfer=0, wait_data=False, keep_going=False, **auto):
+        """Queue one command, see sdc.command() for the encoding."""
+        value = (command(index, data_xfer, **resp, **auto) |
+                 (int(wait_data) << QUEUE_WAIT_DATA) |
+                 (int(keep_going) << QUEUE_KEEP_GOING))
+        with self.comm.batch():
+            self.comm.write(self._addr("command"), value)
+            self.comm.write(self._addr("argument"), arg)
+
+    def status(self):
+        """Returns (busy, halted, queued entries, results)."""
+        value = self.comm.read(self._addr("status"))
+        return bool(value & 1), bool(value & 2), (value >> 8) & 0xff, (value >> 16) & 0xff
+
+    def wait(self, timeout=1.0):
+        """Poll until the queue is idle, returns status()."""
+        deadline = time.monotonic() + timeout
+        interval = self.poll_interval
+        while True:
+            status = self.status()
+            if not status[0]:
+                return status
+            if time.monotonic() >= deadline:
+                raise SDCTimeout("command queue still busy after {}s".format(timeout))
+            time.sleep(interval)
+            interval = min(2*interval, self.poll_max_interval)
+
+    def results(self, count):
+        """Pop count results in one batch."""
+        with self.comm.batch() as values:
+            for i in range(count):
+                self.comm.read(self._addr("result_status"))
+                self.comm.read(self._addr("result_response"), 4)
+                self.comm.write(self._addr("result_pop"), 1)
+        results = []
+        for status, response in zip(values[::2], values[1::2]):
+            results.append(QueueResult((status >> 16) & 0x3f, CmdInt(status & 0x1f),
+                                       DataInt((status >> 8) & 0x1f), list(response)))
+        return results
+
+    def flush(self):
+        """Drop the queued entries and resume a halted queue."""
+        self.comm.write(self._addr("flush"), 1)
+
+    def run(self, commands, timeout=1.0):
+        """Post commands, post() keyword dicts, in one burst and wait for them."""
+        if len(commands) > self.depth:
+            raise ValueError("{} commands for a {} entry queue".format(len(commands), self.depth))
+        with self.comm.batch():
+            for kwargs in commands:
+                self.post(**kwargs)
+        _, halted, _, count = self.wait(timeout)
+        results = self.results(count)
+        if halted:
+            self.flush()
+        return results
@@ -0,0 +1,108 @@
+# Python mirror of verilog/sd_defines.h
+from enum import IntFlag
+
+
+BLKSIZE_W = 12
+BLKCNT_W = 16
+CMD_TIMEOUT_W = 24
+DATA_TIMEOUT_W = 24
+
+# cmd module interrupts
+INT_CMD_SIZE = 5
+INT_CMD_CC = 0
+INT_CMD_EI = 1
+INT_CMD_CTE = 2
+INT_CMD_CCRCE = 3
+INT_CMD_CIE = 4
+
+# data module interrupts
+INT_DATA_SIZE = 5
+INT_DATA_CC = 0
+INT_DATA_EI = 1
+INT_DATA_CTE = 2
+INT_DATA_CCRCE = 3
+INT_DATA_CFE = 4
+
+# fifo status errors, sticky until cleared
+FIFO_STATUS_SIZE = 2
+FIFO_RX_OVERRUN = 0
+FIFO_TX_UNDERRUN = 1
+
+
+class CmdInt(IntFlag):
+    """Decoded cmd_isr value."""
+    CC = 1 << INT_CMD_CC        # command complete
+    EI = 1 << INT_CMD_EI        # error
+    CTE = 1 << INT_CMD_CTE      # timeout
+    CCRCE = 1 << INT_CMD_CCRCE  # response CRC error
+    CIE = 1 << INT_CMD_CIE      # response index error
+
+
+class DataInt(IntFlag):
+    """Decoded data_isr value."""
+    CC = 1 << INT_DATA_CC        # transfer complete
+    EI = 1 << INT_DATA_EI        # error
+    CTE = 1 << INT_DATA_CTE      # timeout
+    CCRCE = 1 << INT_DATA_CCRCE  # data CRC error
+    CFE = 1 << INT_DATA_CFE      # FIFO overrun/underrun
+
+
+class FifoStatus(IntFlag):
+    """Decoded fifo_status error bits."""
+    RX_OVERRUN = 1 << FIFO_RX_OVERRUN    # RX FIFO full while receiving
+    TX_UNDERRUN = 1 << FIFO_TX_UNDERRUN  # TX FIFO empty while sending
+
+
+# controller register fields
+CONTROLLER_4BIT = 0         # 4 bit data bus
+CONTROLLER_STREAM = 1       # data through the stream ports (SDCARD with_stream=True)
+CONTROLLER_DESC = 2         # dst_src_addr is a descriptor chain (SDCARD descriptors=True)
+
+# DMA descriptor: buffer address, blocks, next descriptor, status
+DESC_SIZE = 16
+DESC_BLOCKS = 0             # [15:0] blocks for the buffer
+DESC_LAST = 31              # last descriptor of the chain
+DESC_DONE = 31              # set in the status word once the buffer is done
+
+# command register fields
+CMD_RESPONSE_CHECK = 0      # [1:0] 00 none, 01 short (48 bit), 10 long (136 bit)
+CMD_BUSY_CHECK = 2
+CMD_CRC_CHECK = 3
+CMD_IDX_CHECK = 4
+CMD_WITH_DATA = 5           # [6:5] 00 none, 01 read, 10 write
+CMD_INDEX = 8               # [13:8]
+CMD_AUTO_CMD12 = 14         # CMD12 after the data phase (sd_auto_cmd.v)
+CMD_AUTO_CMD23 = 15         # CMD23 with blkcnt + 1 before the command, wins over CMD12
+
+# register addresses (byte offsets from the controller base)
+registers = {
+    "argument":     0x00,
+    "command":      0x04,
+    "resp0":        0x08,
+    "resp1":        0x0c,
+    "resp2":        0x10,
+    "resp3":        0x14,
+    "data_timeout": 0x18,
+    "controller":   0x1c,
+    "cmd_timeout":  0x20,
+    "clock_d":      0x24,
+    "reset":        0x28,
+    "voltage":      0x2c,
+    "capa":         0x30,
+    "cmd_isr":      0x34,
+    "cmd_iser":     0x38,
+    "data_isr":     0x3c,
+    "data_iser":    0x40,
+    "blksize":      0x44,
+    "blkcnt":       0x48,
+    "fifo_status":  0x4c,
+    "dst_src_addr": 0x60,
+}
+
+RESET_BLOCK_SIZE = 511
+RESET_CLK_DIV = 0
+SUPPLY_VOLTAGE_mV = 3300
+
+# mirror of sdcard.SLOT_WINDOW (not in sd_defines.h): slot i of a design
+# built with --sdcard-slots at the sdcard base + i*SLOT_WINDOW
+SLOT_WINDOW = 0x2000
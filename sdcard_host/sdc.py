@@ -0,0 +1,104 @@
+import time
+
+from sdcard_host.sd_defines import *
+
+
+class SDCTimeout(Exception):
+    pass
+
+
+def command(cmd_id, data_xfer=0, chk_id=0, chk_crc=0, chk_busy=0, wait_resp=0,
+            auto_cmd12=0, auto_cmd23=0):
+    """Encode a value for the command register."""
+    # data_xfer: 0 no data, 1 read data after command, 2 write data after command.
+    # wait_resp: 0 no response, 1 short (48 bit), 2 long (136 bit).
+    return ((auto_cmd23 << CMD_AUTO_CMD23) |
+            (auto_cmd12 << CMD_AUTO_CMD12) |
+            (cmd_id << CMD_INDEX) |
+            (data_xfer << CMD_WITH_DATA) |
+            (chk_id << CMD_IDX_CHECK) |
+            (chk_crc << CMD_CRC_CHECK) |
+            (chk_busy << CMD_BUSY_CHECK) |
+            (wait_resp << CMD_RESPONSE_CHECK))
+
+
+class SDController:
+    """Register level access to a sdc_controller behind a CommUART."""
+    def __init__(self, comm, base=0x50000000,
+                 poll_interval=0.0005, poll_backoff=2, poll_max_interval=0.05):
+        self.comm = comm
+        self.base = base
+        self.poll_interval = poll_interval
+        self.poll_backoff = poll_backoff
+        self.poll_max_interval = poll_max_interval
+
+    def _addr(self, reg):
+        if isinstance(reg, str):
+            reg = registers[reg]
+        return self.base + reg
+
+    def read(self, reg):
+        return self.comm.read(self._addr(reg))
+
+    def write(self, reg, value):
+        self.comm.write(self._addr(reg), value)
+
+    def dump(self):
+        """Read all registers in one batch, returns (name, value) pairs."""
+        with self.comm.batch() as values:
+            for name in registers:
+                self.read(name)
+        return list(zip(registers, values))
+
+    def setup(self, cmd_timeout=0xffff, data_timeout=0xffff, clock_divider=0,
+              bus_4bit=True, blksize=512, dma_addr=0x40000000):
+        with self.comm.batch():
+            self.write("reset", 1)
+            self.write("cmd_timeout", cmd_timeout)
+            self.write("data_timeout", data_timeout)
+            self.write("dst_src_addr", dma_addr)
+            self.write("clock_d", clock_divider)
+            self.write("reset", 0)
+            self.write("cmd_iser", 0x1f)
+            self.write("data_iser", 0x1f)
+            self.write("controller", int(bus_4bit) << CONTROLLER_4BIT)
+            # the block size register holds size - 1
+            self.write("blksize", blksize - 1)
+
+    def send_command(self, cmd, arg=0):
+        """Start a command, writing the argument register triggers it."""
+        with self.comm.batch():
+            self.write("command", cmd)
+            self.write("argument", arg)
+
+    def _wait(self, reg, timeout, clear):
+        deadline = time.monotonic() + timeout
+        interval = self.poll_interval
+        while True:
+            status = self.read(reg)
+            if status:
+                if clear:
+                    self.write(reg, 0)
+                return status
+            if time.monotonic() >= deadline:
+                raise SDCTimeout("{} still clear after {}s".format(reg, timeout))
+            time.sleep(interval)
+            interval = min(interval*self.poll_backoff, self.poll_max_interval)
+
+    def wait_cmd_done(self, timeout=1.0, clear=True):
+        """Poll cmd_isr with backoff until the command completes or fails."""
+        return CmdInt(self._wait("cmd_isr", timeout, clear))
+
+    def wait_data_done(self, timeout=1.0, clear=True):
+        """Poll data_isr with backoff until the data transfer completes or fails."""
+        return DataInt(self._wait("data_isr", timeout, clear))
+
+    def fifo_status(self, clear=True):
+        """Read the sticky FIFO errors, returns (FifoStatus, rx_depth, tx_depth)."""
+        with self.comm.batch() as values:
+            self.read("fifo_status")
+            if clear:
+                self.write("fifo_status", 0)
+        value = values[0]
+        status = FifoStatus(value & ((1 << FIFO_STATUS_SIZE) - 1))
+        return status, 1 << ((value >> 8) & 0xf), 1 << ((value >> 12) & 0xf)
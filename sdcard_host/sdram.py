@@ -0,0 +1,52 @@
+import time
+
+from sdcard_host.perf import csr_registers
+
+
+# LiteDRAM DFII injector bits (litedram/dfii.py)
+DFII_CONTROL_SEL = 0x01
+DFII_CONTROL_CKE = 0x02
+DFII_CONTROL_ODT = 0x04
+DFII_CONTROL_RESET_N = 0x08
+
+DFII_COMMAND_CS = 0x01
+DFII_COMMAND_WE = 0x02
+DFII_COMMAND_CAS = 0x04
+DFII_COMMAND_RAS = 0x08
+
+PRECHARGE_ALL = DFII_COMMAND_RAS | DFII_COMMAND_WE | DFII_COMMAND_CS
+AUTO_REFRESH = DFII_COMMAND_RAS | DFII_COMMAND_CAS | DFII_COMMAND_CS
+MODE_REGISTER = DFII_COMMAND_RAS | DFII_COMMAND_CAS | DFII_COMMAND_WE | DFII_COMMAND_CS
+
+
+def init_sdram(comm, csr_csv, prefix="sdram_dfii_", cl=2):
+    """Bring up the SDR SDRAM of a design built with --sdram."""
+    registers = csr_registers(csr_csv, prefix)
+    if "control" not in registers:
+        raise ValueError("no {}control register in {}, design built without --sdram?".format(
+            prefix, csr_csv))
+
+    def addr(name):
+        return registers[name][0]
+
+    def command(cmd, address=0):
+        comm.write(addr("pi0_address"), address)
+        comm.write(addr("pi0_baddress"), 0)
+        comm.write(addr("pi0_command"), cmd)
+        comm.write(addr("pi0_command_issue"), 1)
+
+    # the BIOS sequence (LiteDRAM's sdram_phy.h for GENSDRPHY): burst
+    # length 1, CAS latency cl
+    mode = cl << 4
+    comm.write(addr("control"), DFII_CONTROL_CKE | DFII_CONTROL_ODT | DFII_CONTROL_RESET_N)
+    time.sleep(0.001)
+    # the frames take longer on the wire than the delays between commands
+    with comm.batch():
+        command(PRECHARGE_ALL, 0x400)
+        # reset DLL
+        command(MODE_REGISTER, mode | 0x100)
+        command(PRECHARGE_ALL, 0x400)
+        command(AUTO_REFRESH)
+        command(AUTO_REFRESH)
+        command(MODE_REGISTER, mode)
+        comm.write(addr("control"), DFII_CONTROL_SEL)
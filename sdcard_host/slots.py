@@ -0,0 +1,146 @@
+from sdcard_host.card import SDCard
+from sdcard_host.sd_defines import SLOT_WINDOW
+from sdcard_host.sdc import SDController
+
+
+class SlotArray:
+    """The SDCards of a design built with --sdcard-slots, on one bridge."""
+    def __init__(self, cards):
+        if not cards:
+            raise ValueError("no slots")
+        self.cards = cards
+        self.comm = cards[0].comm
+        self.block_size = cards[0].block_size
+
+    @classmethod
+    def open(cls, comm, slots, clk_freq, base=0x50000000, dma_addr=0x40000000, dma_size=0x8000,
+             **kwargs):
+        """SDCards for slots slots, the DMA buffer split between them."""
+        size = dma_size//slots & ~(SDCard.block_size - 1)
+        return cls([SDCard(SDController(comm, base + i*SLOT_WINDOW), clk_freq,
+                           dma_addr + i*size, size, **kwargs) for i in range(slots)])
+
+    def __len__(self):
+        return len(self.cards)
+
+    def init(self, **kwargs):
+        for card in self.cards:
+            card.init(**kwargs)
+
+    def _requests(self, requests):
+        if len(requests) != len(self.cards):
+            raise ValueError("{} requests for {} slots".format(len(requests), len(self.cards)))
+        return [(card, request) for card, request in zip(self.cards, requests) if request is not None]
+
+    def read(self, requests, timeout=1.0):
+        """Read a (lba, count) per slot, None to leave a slot out."""
+        active = self._requests(requests)
+        with self.comm.batch():
+            for card, (lba, count) in active:
+                card.issue(lba, count)
+        for card, (lba, count) in active:
+            card.complete(count, timeout=timeout)
+        with self.comm.batch() as data:
+            for card, (lba, count) in active:
+                self.comm.read_block(card.dma_addr, count*self.block_size//4)
+        data = iter(data)
+        return [None if request is None else bytes(next(data)) for request in requests]
+
+    def write(self, requests, timeout=1.0):
+        """Write a (lba, data) per slot, see read()."""
+        active = self._requests(requests)
+        with self.comm.batch():
+            for card, (lba, data) in active:
+                count = len(data)//self.block_size
+                if len(data) % self.block_size or count > card.max_blocks:
+                    raise ValueError("{} bytes don't fit the slot DMA buffer".format(len(data)))
+                self.comm.write_block(card.dma_addr, data)
+                card.issue(lba, count, write=True)
+        for card, (lba, data) in active:
+            card.complete(len(data)//self.block_size, write=True, timeout=timeout)
+
+
+class StripedVolume:
+    """One logical volume striped over a SlotArray, RAID 0 style."""
+    def __init__(self, slots, stripe_blocks=8):
+        if stripe_blocks > min(card.max_blocks for card in slots.cards):
+            raise ValueError("stripe larger than a slot DMA buffer")
+        self.slots = slots
+        self.block_size = slots.block_size
+        self.stripe_blocks = stripe_blocks
+        # whole stripes per slot and per transfer
+        self.slot_blocks = min(card.max_blocks for card in slots.cards)//stripe_blocks*stripe_blocks
+        self.max_blocks = self.slot_blocks*len(slots)
+
+    @property
+    def nblocks(self):
+        stripes = min(card.nblocks for card in self.slots.cards)//self.stripe_blocks
+        return stripes*self.stripe_blocks*len(self.slots)
+
+    def _map(self, lba, count):
+        """Split a logical range in pieces (offset, slot, slot lba, n)."""
+        # logical stripe s is stripe s//len(slots) of slot s % len(slots)
+        pieces = []
+        offset = 0
+        while offset < count:
+            stripe, within = divmod(lba + offset, self.stripe_blocks)
+            n = min(self.stripe_blocks - within, count - offset)
+            slot, row = stripe % len(self.slots), stripe//len(self.slots)
+            pieces.append((offset, slot, row*self.stripe_blocks + within, n))
+            offset += n
+        return pieces
+
+    def _check(self, lba, count):
+        if lba < 0 or count < 0 or lba + count > self.nblocks:
+            raise ValueError("blocks {}-{} outside the volume".format(lba, lba + count - 1))
+
+    def _slot_ranges(self, pieces):
+        # the pieces of a slot are contiguous on it
+        ranges = [None]*len(self.slots)
+        for _, slot, slot_lba, n in pieces:
+            if ranges[slot] is None:
+                ranges[slot] = [slot_lba, 0]
+            ranges[slot][1] += n
+        return ranges
+
+    def read(self, lba, count=1, timeout=1.0):
+        """Read count blocks, with max_blocks per round of transfers."""
+        return b"".join(self.read_blocks(lba, count, timeout))
+
+    def read_blocks(self, lba, count, timeout=1.0):
+        """Yield the data of count blocks, one round of slot transfers at a time."""
+        self._check(lba, count)
+        while count:
+            n = min(count, self.max_blocks - lba % self.max_blocks)
+            pieces = self._map(lba, n)
+            ranges = self._slot_ranges(pieces)
+            data = self.slots.read([None if r is None else tuple(r) for r in ranges], timeout)
+            out = bytearray(n*self.block_size)
+            bs = self.block_size
+            for offset, slot, slot_lba, m in pieces:
+                pos = (slot_lba - ranges[slot][0])*bs
+                out[offset*bs:(offset + m)*bs] = data[slot][pos:pos + m*bs]
+            yield bytes(out)
+            lba += n
+            count -= n
+
+    def write(self, lba, data, timeout=1.0):
+        """Write whole blocks from a bytes-like object."""
+        data = memoryview(data).cast("B")
+        if len(data) % self.block_size:
+            raise ValueError("data is not a multiple of the block size")
+        count = len(data)//self.block_size
+        self._check(lba, count)
+        bs = self.block_size
+        done = 0
+        while done < count:
+            n = min(count - done, self.max_blocks - (lba + done) % self.max_blocks)
+            pieces = self._map(lba + done, n)
+            ranges = self._slot_ranges(pieces)
+            buffers = [None if r is None else bytearray(r[1]*bs) for r in ranges]
+            for offset, slot, slot_lba, m in pieces:
+                pos = (slot_lba - ranges[slot][0])*bs
+                buffers[slot][pos:pos + m*bs] = data[(done + offset)*bs:(done + offset + m)*bs]
+            self.slots.write([None if r is None else (r[0], buffers[slot])
+                              for slot, r in enumerate(ranges)], timeout)
+            done += n
@@ -0,0 +1,503 @@
+"""cocotb benches for sdc_controller against the SD card model.
+
+Runs the SDCard identification sequence, then single and multiple block
+reads and writes through the DMA port, checking the data and reporting
+command latency and transfer throughput in simulated time. Parameters
+come from the environment (see the Makefile); with RESULTS=<file> the
+measurements are also written as JSON.
+"""
+import json
+import os
+
+import cocotb
+from cocotb.clock import Clock
+from cocotb.triggers import ClockCycles, FallingEdge, ReadOnly
+from cocotb.utils import get_sim_time
+
+from sdcard_host.card import (R1, R1b, R2, R3, R6, R7, OCR_BUSY, OCR_HCS, OCR_VOLTAGE, SWITCH_CHECK,
+                               SWITCH_HIGH_SPEED, SWITCH_SET, descriptor_chain, parse_cid, parse_csd,
+                               parse_scr, parse_switch_status)
+from sdcard_host.sd_defines import DESC_SIZE, CmdInt, DataInt, FifoStatus, registers
+from sdcard_host.sdc import command
+
+from sdcard_model import SDCardModel
+from stream import StreamSink, StreamSource
+from wishbone import WishboneMaster, WishboneMemory
+
+
+DMA_ADDR = 0x40000000
+
+# measurements of every test in this run
+results = {}
+
+
+def _env(name, default):
+    return int(os.environ.get(name, str(default)), 0)
+
+
+class PerfMonitor:
+    """Counts the controller's perf_* events on every clock, the bench
+    side of SDCARDPerf."""
+    events = ("data_busy", "write_busy", "rx_full", "rx_empty", "tx_full", "tx_empty", "xfer")
+
+    def __init__(self, dut):
+        self.dut = dut
+        self.counters = dict.fromkeys(self.events, 0)
+
+    def start(self):
+        cocotb.start_soon(self._run())
+
+    def snapshot(self):
+        return dict(self.counters)
+
+    async def _run(self):
+        signals = [(name, getattr(self.dut, "perf_" + name)) for name in self.events]
+        while True:
+            # settled values of the second half cycle, what the counters
+            # see at the next rising edge
+            await FallingEdge(self.dut.clk)
+            await ReadOnly()
+            for name, signal in signals:
+                if signal.value.binstr == "1":
+                    self.counters[name] += 1
+
+
+class Bench:
+    """Drives the register port the way sdcard_host.card.SDCard does."""
+    def __init__(self, dut):
+        self.dut = dut
+        self.block_size = _env("BLOCK_SIZE", 512)
+        self.clk_period = _env("CLK_PERIOD_NS", 10)
+        self.clock_divider = _env("SD_CLK_DIV", 0)
+        self.bus_width = _env("SD_BUS_WIDTH", 4)
+        self.bus = WishboneMaster(dut)
+        self.mem = WishboneMemory(dut, DMA_ADDR, _env("MEM_SIZE", 0x8000),
+                                  _env("MEM_LATENCY", 0), _env("MEM_GRANT_LATENCY", 1))
+        self.rx_stream = StreamSink(dut)
+        self.tx_stream = StreamSource(dut)
+        self.perf = PerfMonitor(dut)
+        self.card = SDCardModel(dut,
+                                nblocks=_env("SD_NBLOCKS", 0x10000),
+                                ncr=_env("SD_NCR", 2),
+                                nac=_env("SD_NAC", 8),
+                                ncrc=_env("SD_NCRC", 2),
+                                busy=_env("SD_BUSY", 16))
+        self.rca = 0
+        self.results = results
+        self.results.update({
+            "clk_period_ns": self.clk_period,
+            "clock_divider": self.clock_divider,
+            "block_size":    self.block_size,
+            "bus_width":     self.bus_width,
+            "mem_latency":   self.mem.latency,
+            "grant_latency": self.mem.grant_latency,
+            "nac":           self.card.nac,
+            "busy":          self.card.busy,
+            "rx_fifo_depth": 1 << _env("RX_FIFO_ADR_SIZE", 4),
+            "tx_fifo_depth": 1 << _env("TX_FIFO_ADR_SIZE", 4),
+            "burst":         _env("BURST", 0),
+        })
+
+    async def start(self):
+        cocotb.start_soon(Clock(self.dut.clk, self.clk_period, units="ns").start())
+        self.mem.start()
+        self.rx_stream.start()
+        self.tx_stream.start()
+        self.perf.start()
+        self.card.start()
+        self.dut.rst.value = 1
+        await ClockCycles(self.dut.clk, 10)
+        self.dut.rst.value = 0
+        await ClockCycles(self.dut.clk, 10)
+
+    def save(self):
+        path = os.environ.get("RESULTS")
+        if path:
+            with open(path, "w") as f:
+                json.dump(self.results, f, indent=2)
+
+    async def read(self, reg):
+        return await self.bus.read(registers[reg])
+
+    async def write(self, reg, value):
+        await self.bus.write(registers[reg], value)
+
+    async def _wait(self, signal, reg, timeout):
+        for _ in range(timeout):
+            await FallingEdge(self.dut.clk)
+            if signal.value.binstr == "1":
+                break
+        else:
+            raise TimeoutError("{} still clear after {} cycles".format(reg, timeout))
+        status = await self.read(reg)
+        await self.write(reg, 0)
+        # the clear crosses to sd_clk and back, don't let the next
+        # command see the old status
+        while signal.value.binstr == "1":
+            await FallingEdge(self.dut.clk)
+        return status
+
+    async def wait_cmd_done(self, timeout=200000):
+        return CmdInt(await self._wait(self.dut.int_cmd, "cmd_isr", timeout))
+
+    async def wait_data_done(self, timeout=2000000):
+        return DataInt(await self._wait(self.dut.int_data, "data_isr", timeout))
+
+    async def cmd(self, index, arg=0, resp=R1, data_xfer=0, **auto):
+        await self.write("command", command(index, data_xfer, **resp, **auto))
+        start = get_sim_time("ns")
+        await self.write("argument", arg)
+        status = await self.wait_cmd_done()
+        self.last_latency = get_sim_time("ns") - start
+        if status & CmdInt.EI:
+            raise AssertionError("CMD{} failed: {!r}".format(index, status))
+        if resp.get("wait_resp") == 2:
+            return [await self.read(reg) for reg in ("resp0", "resp1", "resp2", "resp3")]
+        elif resp.get("wait_resp"):
+            return [await self.read("resp0")]
+        return []
+
+    async def app_cmd(self, index, arg=0, resp=R1, data_xfer=0):
+        await self.cmd(55, self.rca << 16)
+        return await self.cmd(index, arg, resp, data_xfer)
+
+    async def set_clock_divider(self, divider):
+        await self.write("reset", 1)
+        await self.write("clock_d", divider)
+        await self.write("reset", 0)
+
+    async def init(self):
+        await self.write("reset", 1)
+        await self.write("cmd_timeout", 0xffff)
+        await self.write("data_timeout", 0xffffff)
+        await self.write("dst_src_addr", DMA_ADDR)
+        await self.write("clock_d", self.clock_divider)
+        await self.write("reset", 0)
+        await self.write("cmd_iser", 0x1f)
+        await self.write("data_iser", 0x1f)
+        await self.write("controller", 0)
+        await self.write("blksize", self.block_size - 1)
+        fifo = await self.read("fifo_status")
+        assert 1 << (fifo >> 8 & 0xf) == self.results["rx_fifo_depth"], hex(fifo)
+        assert 1 << (fifo >> 12 & 0xf) == self.results["tx_fifo_depth"], hex(fifo)
+
+        await self.cmd(0, resp={})
+        assert (await self.cmd(8, 0x1aa, R7))[0] & 0xfff == 0x1aa
+        while True:
+            ocr = (await self.app_cmd(41, OCR_VOLTAGE | OCR_HCS, R3))[0]
+            if ocr & OCR_BUSY:
+                break
+        assert ocr & OCR_HCS
+        cid = parse_cid(await self.cmd(2, 0, R2))
+        self.rca = (await self.cmd(3, 0, R6))[0] >> 16
+        csd = parse_csd(await self.cmd(9, self.rca << 16, R2))
+        assert csd["capacity"] == self.card.nblocks*self.card.block_size, csd
+        await self.cmd(7, self.rca << 16, R1b)
+        self.results["cmd_latency_ns"] = self.last_latency
+        await self.cmd(16, self.block_size)
+        if self.bus_width == 4:
+            await self.app_cmd(6, 2)
+            await self.write("controller", 1)
+        return cid
+
+    async def _transfer(self, index, lba, count, data_xfer, addr=DMA_ADDR, **auto):
+        await self.write("dst_src_addr", addr)
+        await self.write("blkcnt", count - 1)
+        start = get_sim_time("ns")
+        cyc_cycles = self.mem.cyc_cycles
+        perf = self.perf.snapshot()
+        await self.cmd(index, lba, R1, data_xfer, **auto)
+        status = await self.wait_data_done()
+        elapsed = get_sim_time("ns") - start
+        self.last_bus_cycles = self.mem.cyc_cycles - cyc_cycles
+        self.last_perf = {name: value - perf[name] for name, value in self.perf.snapshot().items()}
+        fifo = await self.read("fifo_status")
+        if status & DataInt.EI:
+            raise AssertionError("CMD{} data failed: {!r} {!r}".format(index, status, FifoStatus(fifo & 3)))
+        assert not fifo & 3, FifoStatus(fifo & 3)
+        if count > 1 and not auto:
+            await self.cmd(12, 0, R1b)
+        return elapsed
+
+    async def fifo_error(self, index, lba, data_xfer):
+        """Run a one block transfer expected to fail on the FIFO, returns
+        the sticky fifo_status errors and checks they clear."""
+        await self.write("dst_src_addr", DMA_ADDR)
+        await self.write("blkcnt", 0)
+        await self.cmd(index, lba, R1, data_xfer)
+        status = await self.wait_data_done()
+        assert status & DataInt.CFE, status
+        fifo = FifoStatus(await self.read("fifo_status") & 3)
+        await self.write("fifo_status", 0)
+        await ClockCycles(self.dut.clk, 20)
+        assert not await self.read("fifo_status") & 3
+        return fifo
+
+    async def stream_blocks(self, lba, count, data_xfer):
+        """Transfer through the stream ports instead of the DMA master."""
+        controller = int(self.bus_width == 4)
+        await self.write("controller", controller | 2)
+        index = {1: 18, 2: 25}[data_xfer] if count > 1 else {1: 17, 2: 24}[data_xfer]
+        try:
+            return await self._transfer(index, lba, count, data_xfer)
+        finally:
+            await self.write("controller", controller)
+
+    async def desc_blocks(self, lba, buffers, table, data_xfer):
+        """Transfer through a descriptor chain at table over buffers, a
+        list of (address, blocks), returns the status words."""
+        count = sum(blocks for _, blocks in buffers)
+        words = descriptor_chain(table, buffers)
+        self.mem.load(table, b"".join(word.to_bytes(4, "big") for word in words))
+        controller = int(self.bus_width == 4)
+        await self.write("controller", controller | 4)
+        index = {1: 18, 2: 25}[data_xfer] if count > 1 else {1: 17, 2: 24}[data_xfer]
+        try:
+            elapsed = await self._transfer(index, lba, count, data_xfer, table)
+        finally:
+            await self.write("controller", controller)
+        status = [int.from_bytes(self.mem.dump(table + i*DESC_SIZE + 12, 4), "big")
+                  for i in range(len(buffers))]
+        return elapsed, status
+
+    async def read_data(self, index, arg, nbytes, app=False):
+        """Read a short data block (SCR, switch status) like
+        SDCard._read_data(), returns its bytes."""
+        if app:
+            await self.cmd(55, self.rca << 16)
+        await self.write("blksize", nbytes - 1)
+        await self.write("dst_src_addr", DMA_ADDR)
+        await self.write("blkcnt", 0)
+        await self.cmd(index, arg, R1, 1)
+        status = await self.wait_data_done()
+        await self.write("blksize", self.block_size - 1)
+        assert not status & DataInt.EI, status
+        return self.mem.dump(DMA_ADDR, nbytes)
+
+    async def read_blocks(self, lba, count, **auto):
+        return await self._transfer(18 if count > 1 else 17, lba, count, 1, **auto)
+
+    async def write_blocks(self, lba, count, **auto):
+        return await self._transfer(25 if count > 1 else 24, lba, count, 2, **auto)
+
+    def report(self, name, count, elapsed):
+        rate = count*self.block_size/(elapsed*1e-9)
+        # DMA bus occupancy, cycles with cyc raised per word moved and
+        # their share of the transfer
+        bus = self.last_bus_cycles/(count*self.block_size//4)
+        utilization = self.last_bus_cycles*self.clk_period/elapsed
+        self.results[name] = {"blocks": count, "ns": elapsed, "bytes_per_s": rate,
+                              "bus_cycles_per_word": bus, "bus_utilization": utilization,
+                              "perf": self.last_perf}
+        self.dut._log.info("{}: {} blocks in {} ns, {:.2f} MB/s, {:.2f} bus cycles/word".format(
+            name, count, elapsed, rate/1e6, bus))
+        self.dut._log.info("{}: {}".format(name, " ".join(
+            "{}={}".format(k, v) for k, v in self.last_perf.items())))
+
+
+async def _setup(dut):
+    bench = Bench(dut)
+    await bench.start()
+    cid = await bench.init()
+    assert cid["pnm"] == "SD32G"
+    return bench
+
+
+@cocotb.test()
+async def test_read(dut):
+    bench = await _setup(dut)
+    count = _env("BLOCKS", 8)
+    image = bytes(i*7 & 0xff for i in range(count*bench.block_size))
+    bench.card.image[100*bench.block_size:(100 + count)*bench.block_size] = image
+
+    elapsed = await bench.read_blocks(100, 1)
+    assert bench.mem.dump(DMA_ADDR, bench.block_size) == image[:bench.block_size]
+    bench.report("read_single", 1, elapsed)
+
+    elapsed = await bench.read_blocks(100, count)
+    assert bench.mem.dump(DMA_ADDR, len(image)) == image
+    assert bench.last_perf["xfer"] == len(image)//4, bench.last_perf
+    assert not bench.last_perf["write_busy"]
+    bench.report("read_multiple", count, elapsed)
+    bench.save()
+
+
+@cocotb.test()
+async def test_write(dut):
+    bench = await _setup(dut)
+    count = _env("BLOCKS", 8)
+    image = bytes((i*13 + 5) & 0xff for i in range(count*bench.block_size))
+    bench.mem.load(DMA_ADDR, image)
+
+    elapsed = await bench.write_blocks(200, 1)
+    assert bench.card.image[200*bench.block_size:201*bench.block_size] == image[:bench.block_size]
+    bench.report("write_single", 1, elapsed)
+
+    elapsed = await bench.write_blocks(200, count)
+    assert bench.card.image[200*bench.block_size:(200 + count)*bench.block_size] == image
+    assert not bench.card.crc_errors
+    assert bench.last_perf["write_busy"]
+    bench.report("write_multiple", count, elapsed)
+    bench.save()
+
+
+@cocotb.test()
+async def test_auto_cmd(dut):
+    bench = await _setup(dut)
+    count = _env("BLOCKS", 8)
+    size = count*bench.block_size
+    for i, auto in enumerate(("auto_cmd12", "auto_cmd23")):
+        image = bytes((i*31 + j*11 + 3) & 0xff for j in range(size))
+        lba = 300 + 2*i*count
+        bench.card.image[lba*bench.block_size:lba*bench.block_size + size] = image
+        sent = len(bench.card.commands)
+        elapsed = await bench.read_blocks(lba, count, **{auto: 1})
+        assert bench.mem.dump(DMA_ADDR, size) == image
+        indexes = [index for _, index, _ in bench.card.commands[sent:]]
+        expected = [18, 12] if auto == "auto_cmd12" else [23, 18]
+        assert indexes == expected, indexes
+        if auto == "auto_cmd23":
+            assert bench.card.commands[sent][2] == count
+        bench.report("read_" + auto, count, elapsed)
+
+        image = bytes(reversed(image))
+        bench.mem.load(DMA_ADDR, image)
+        sent = len(bench.card.commands)
+        elapsed = await bench.write_blocks(lba + count, count, **{auto: 1})
+        indexes = [index for _, index, _ in bench.card.commands[sent:]]
+        expected = [25, 12] if auto == "auto_cmd12" else [23, 25]
+        assert indexes == expected, indexes
+        await bench.cmd(13, bench.rca << 16)
+        assert bench.card.image[(lba + count)*bench.block_size:(lba + count)*bench.block_size + size] == image
+        assert not bench.card.crc_errors
+        bench.report("write_" + auto, count, elapsed)
+    bench.save()
+
+
+@cocotb.test()
+async def test_negotiate(dut):
+    bench = await _setup(dut)
+    scr = parse_scr(await bench.read_data(51, 0, 8, app=True))
+    assert scr["sd_spec"] == 2 and scr["bus_widths"] == [1, 4], scr
+    status = parse_switch_status(await bench.read_data(6, SWITCH_CHECK | SWITCH_HIGH_SPEED, 64))
+    assert status["group1_support"] & 1 << SWITCH_HIGH_SPEED, status
+    assert status["group1_function"] == SWITCH_HIGH_SPEED and not bench.card.high_speed
+    status = parse_switch_status(await bench.read_data(6, SWITCH_SET | SWITCH_HIGH_SPEED, 64))
+    assert status["group1_function"] == SWITCH_HIGH_SPEED and bench.card.high_speed
+
+    # full blocks are unaffected by the short ones
+    image = bytes(i*3 & 0xff for i in range(2*bench.block_size))
+    bench.card.image[300*bench.block_size:302*bench.block_size] = image
+    await bench.read_blocks(300, 2)
+    assert bench.mem.dump(DMA_ADDR, len(image)) == image
+
+
+def _stall_dma(bench):
+    # the DMA bus stalls for longer than a FIFO takes to fill/drain
+    word_cycles = 32//bench.bus_width*2*(bench.clock_divider + 1)
+    depth = max(bench.results["rx_fifo_depth"], bench.results["tx_fifo_depth"])
+    bench.mem.latency = 2*depth*word_cycles
+
+
+@cocotb.test()
+async def test_rx_overrun(dut):
+    bench = await _setup(dut)
+    _stall_dma(bench)
+    assert await bench.fifo_error(17, 100, 1) == FifoStatus.RX_OVERRUN
+
+
+@cocotb.test()
+async def test_tx_underrun(dut):
+    bench = await _setup(dut)
+    _stall_dma(bench)
+    assert await bench.fifo_error(24, 200, 2) == FifoStatus.TX_UNDERRUN
+
+
+def _words(data):
+    return [int.from_bytes(data[i:i + 4], "big") for i in range(0, len(data), 4)]
+
+
+@cocotb.test()
+async def test_stream_read(dut):
+    bench = await _setup(dut)
+    count = _env("BLOCKS", 8)
+    image = bytes((i*11 + 3) & 0xff for i in range(count*bench.block_size))
+    bench.card.image[300*bench.block_size:(300 + count)*bench.block_size] = image
+    bench.rx_stream.ready_prob = 0.75
+
+    elapsed = await bench.stream_blocks(300, count, 1)
+    assert bench.rx_stream.words == _words(image)
+    assert [len(block) for block in bench.rx_stream.blocks] == [bench.block_size//4]*count + [0]
+    assert bench.mem.writes == 0
+    bench.report("stream_read", count, elapsed)
+
+
+@cocotb.test()
+async def test_stream_write(dut):
+    bench = await _setup(dut)
+    count = _env("BLOCKS", 8)
+    image = bytes((i*17 + 9) & 0xff for i in range(count*bench.block_size))
+    # the word past the transfer must be left for the next one
+    bench.tx_stream.queue = _words(image) + [0xdeadbeef]
+    bench.tx_stream.valid_prob = 0.75
+
+    elapsed = await bench.stream_blocks(400, count, 2)
+    assert bench.card.image[400*bench.block_size:(400 + count)*bench.block_size] == image
+    assert not bench.card.crc_errors
+    assert bench.tx_stream.queue == [0xdeadbeef]
+    assert bench.mem.reads == 0
+    bench.report("stream_write", count, elapsed)
+
+
+def _fragments(count, table, block_size):
+    # buffers of 1, 2, 3, 1, ... blocks laid out backwards below the
+    # descriptor table with a block gap after each
+    sizes = []
+    while sum(sizes) < count:
+        sizes.append(min(len(sizes) % 3 + 1, count - sum(sizes)))
+    buffers = []
+    addr = table
+    for blocks in sizes:
+        addr -= (blocks + 1)*block_size
+        buffers.append((addr, blocks))
+    assert addr >= DMA_ADDR, "BLOCKS too large for the scatter test"
+    return buffers
+
+
+@cocotb.test()
+async def test_desc_read(dut):
+    bench = await _setup(dut)
+    count = _env("BLOCKS", 8)
+    image = bytes((i*19 + 1) & 0xff for i in range(count*bench.block_size))
+    bench.card.image[500*bench.block_size:(500 + count)*bench.block_size] = image
+    table = DMA_ADDR + bench.mem.size - 0x400
+    buffers = _fragments(count, table, bench.block_size)
+
+    elapsed, status = await bench.desc_blocks(500, buffers, table, 1)
+    pos = 0
+    for addr, blocks in buffers:
+        size = blocks*bench.block_size
+        assert bench.mem.dump(addr, size) == image[pos:pos + size], hex(addr)
+        assert not any(bench.mem.dump(addr + size, bench.block_size)), hex(addr)
+        pos += size
+    assert status == [0x80000000 | blocks for _, blocks in buffers], status
+    bench.report("desc_read", count, elapsed)
+
+
+@cocotb.test()
+async def test_desc_write(dut):
+    bench = await _setup(dut)
+    count = _env("BLOCKS", 8)
+    image = bytes((i*23 + 7) & 0xff for i in range(count*bench.block_size))
+    table = DMA_ADDR + bench.mem.size - 0x400
+    buffers = _fragments(count, table, bench.block_size)
+    pos = 0
+    for addr, blocks in buffers:
+        bench.mem.load(addr, image[pos:pos + blocks*bench.block_size])
+        pos += blocks*bench.block_size
+
+    elapsed, status = await bench.desc_blocks(600, buffers, table, 2)
+    assert bench.card.image[600*bench.block_size:(600 + count)*bench.block_size] == image
+    assert not bench.card.crc_errors
+    assert status == [0x80000000 | blocks for _, blocks in buffers], status
+    bench.report("desc_write", count, elapsed)
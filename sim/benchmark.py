@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+"""Throughput and latency sweeps of sdc_controller in simulation.
+
+Runs the bench.py tests (test_read and test_write by default) through
+the Makefile for every combination of the swept parameters and collects
+MB/s, command latency and DMA bus utilization of each run in one JSON
+file:
+
+    python3 benchmark.py --sim verilator --bus-width 1 4 --clock-divider 0 1 \\
+        --fifo-depth 16 64 --output bench.json
+    python3 benchmark.py --sim verilator --bus-width 1 4 --clock-divider 0 1 \\
+        --fifo-depth 16 64 --compare bench.json
+
+With --compare the figures are checked against a stored output and the
+exit status is 1 if any of them got worse by more than --tolerance.
+FIFO depth and burst are RTL parameters, each combination of them gets
+its own build directory under --work-dir; the other parameters only
+change the bench environment.
+"""
+import argparse
+import itertools
+import json
+import os
+import subprocess
+import sys
+import xml.etree.ElementTree as ET
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+
+SIM_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# swept parameter: bench/Makefile variable
+PARAMETERS = OrderedDict([
+    ("block_size",    "BLOCK_SIZE"),
+    ("blocks",        "BLOCKS"),
+    ("bus_width",     "SD_BUS_WIDTH"),
+    ("clock_divider", "SD_CLK_DIV"),
+    ("fifo_depth",    None),
+    ("burst",         "BURST"),
+])
+# parameters that change the RTL, each combination is built once
+BUILD_PARAMETERS = ("fifo_depth", "burst")
+
+# metric suffix: True if higher is better
+DIRECTIONS = {
+    "mb_s":                True,
+    "latency_ns":          False,
+    "bus_cycles_per_word": False,
+}
+
+
+def _log2(depth):
+    if depth < 2 or depth & (depth - 1):
+        raise ValueError("FIFO depth must be a power of two, got {}".format(depth))
+    return depth.bit_length() - 1
+
+
+def config_key(config):
+    return " ".join("{}={}".format(name, config[name]) for name in PARAMETERS)
+
+
+def metrics(results):
+    """Flatten the bench results of one run into name: value."""
+    m = OrderedDict()
+    if "cmd_latency_ns" in results:
+        m["cmd_latency_ns"] = results["cmd_latency_ns"]
+    for name, result in results.items():
+        if isinstance(result, dict) and "bytes_per_s" in result:
+            m[name + ".mb_s"] = result["bytes_per_s"]/1e6
+            m[name + ".bus_cycles_per_word"] = result["bus_cycles_per_word"]
+            m[name + ".bus_utilization"] = result["bus_utilization"]
+    return m
+
+
+class Runner:
+    def __init__(self, sim="icarus", tests=("test_read", "test_write"), work_dir="benchmark_build",
+                 make_args=(), verbose=False):
+        self.sim = sim
+        self.tests = tests
+        self.work_dir = os.path.abspath(work_dir)
+        self.make_args = list(make_args)
+        self.verbose = verbose
+
+    def _dir(self, config, *names):
+        build = "fifo{}_burst{}".format(config["fifo_depth"], config["burst"])
+        return os.path.join(self.work_dir, build, *names)
+
+    def run(self, config):
+        """Simulate one configuration, returns its entry of the output."""
+        name = config_key(config).replace(" ", "_").replace("=", "")
+        results_json = self._dir(config, name + ".json")
+        results_xml = self._dir(config, name + ".xml")
+        os.makedirs(self._dir(config), exist_ok=True)
+        for path in (results_json, results_xml):
+            if os.path.exists(path):
+                os.remove(path)
+        env = dict(os.environ)
+        for param, var in PARAMETERS.items():
+            if var is not None:
+                env[var] = str(int(config[param]))
+        adr_size = str(_log2(config["fifo_depth"]))
+        env.update(RX_FIFO_ADR_SIZE=adr_size, TX_FIFO_ADR_SIZE=adr_size,
+                   RESULTS=results_json, COCOTB_RESULTS_FILE=results_xml)
+        cmd = ["make", "-C", SIM_DIR, "SIM=" + self.sim, "SIM_BUILD=" + self._dir(config, "sim_build"),
+               "TESTCASE=" + ",".join(self.tests)] + self.make_args
+        proc = subprocess.run(cmd, env=env, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                              universal_newlines=True)
+        if self.verbose:
+            sys.stdout.write(proc.stdout)
+        entry = OrderedDict([("config", config)])
+        failures = self._failures(results_xml)
+        if proc.returncode or failures is None or failures or not os.path.exists(results_json):
+            entry["failed"] = failures or ["make exited with {}".format(proc.returncode)]
+            entry["log"] = proc.stdout[-4000:]
+            return entry
+        with open(results_json) as f:
+            entry["metrics"] = metrics(json.load(f))
+        return entry
+
+    @staticmethod
+    def _failures(results_xml):
+        """Names of the failed tests, None without a results file."""
+        if not os.path.exists(results_xml):
+            return None
+        failed = []
+        for testcase in ET.parse(results_xml).iter("testcase"):
+            if testcase.find("failure") is not None or testcase.find("error") is not None:
+                failed.append(testcase.get("name"))
+        return failed
+
+    def sweep(self, configs, jobs=1):
+        """Run all configurations, the first one of each build alone so
+        the simulator is only built once, the rest jobs at a time."""
+        builds = OrderedDict()
+        for config in configs:
+            builds.setdefault(tuple(config[p] for p in BUILD_PARAMETERS), []).append(config)
+        entries = {}
+        with ThreadPoolExecutor(max(jobs, 1)) as pool:
+            for group in builds.values():
+                entries[config_key(group[0])] = self._report(self.run(group[0]))
+                for entry in pool.map(self.run, group[1:]):
+                    entries[config_key(entry["config"])] = self._report(entry)
+        return [entries[config_key(config)] for config in configs]
+
+    @staticmethod
+    def _report(entry):
+        key = config_key(entry["config"])
+        if "failed" in entry:
+            print("{}: FAILED {}".format(key, ", ".join(entry["failed"])), flush=True)
+        else:
+            m = entry["metrics"]
+            figures = ["{}={:.2f}".format(name, value) for name, value in m.items()
+                       if name.endswith(".mb_s")]
+            print("{}: {} cmd_latency_ns={}".format(key, " ".join(figures), m.get("cmd_latency_ns")),
+                  flush=True)
+        return entry
+
+
+def compare(runs, baseline, tolerance):
+    """Returns (regressions, improvements, missing), the first two lists
+    of (config, metric, baseline value, value)."""
+    reference = {config_key(run["config"]): run for run in baseline["runs"]}
+    regressions, improvements, missing = [], [], []
+    for run in runs:
+        key = config_key(run["config"])
+        base = reference.get(key)
+        if base is None or "metrics" not in base or "metrics" not in run:
+            missing.append(key)
+            continue
+        for name, value in run["metrics"].items():
+            higher = next((h for suffix, h in DIRECTIONS.items() if name.endswith(suffix)), None)
+            old = base["metrics"].get(name)
+            if higher is None or not old:
+                continue
+            change = (value - old)/old
+            if not higher:
+                change = -change
+            if change < -tolerance:
+                regressions.append((key, name, old, value))
+            elif change > tolerance:
+                improvements.append((key, name, old, value))
+    return regressions, improvements, missing
+
+
+def main():
+    parser = argparse.ArgumentParser(description="sdc_controller simulation benchmark")
+    parser.add_argument("--sim", default="icarus", choices=["icarus", "verilator"])
+    parser.add_argument("--tests", nargs="+", default=["test_read", "test_write"],
+                        help="bench.py tests to run for every configuration")
+    parser.add_argument("--block-size", nargs="+", type=int, default=[512], help="bytes per block")
+    parser.add_argument("--blocks", nargs="+", type=int, default=[8], help="blocks per multiple block transfer")
+    parser.add_argument("--bus-width", nargs="+", type=int, default=[4], choices=[1, 4])
+    parser.add_argument("--clock-divider", nargs="+", type=int, default=[0],
+                        help="clock_d values, sd_clk = clk/(2*(N+1))")
+    parser.add_argument("--fifo-depth", nargs="+", type=int, default=[16], help="DMA FIFO depths in words")
+    parser.add_argument("--burst", nargs="+", type=int, default=[0], choices=[0, 1])
+    parser.add_argument("--jobs", "-j", type=int, default=1, help="simulations run in parallel")
+    parser.add_argument("--work-dir", default="benchmark_build")
+    parser.add_argument("--make-arg", action="append", default=[], metavar="VAR=VALUE",
+                        help="extra make variable, can be repeated")
+    parser.add_argument("--output", help="write the runs as JSON")
+    parser.add_argument("--compare", metavar="BASELINE", help="check the runs against a stored output")
+    parser.add_argument("--tolerance", type=float, default=0.05,
+                        help="relative change tolerated by --compare")
+    parser.add_argument("--verbose", action="store_true", help="show the simulator output")
+    args = parser.parse_args()
+
+    values = [getattr(args, name) for name in PARAMETERS]
+    configs = [OrderedDict(zip(PARAMETERS, combination)) for combination in itertools.product(*values)]
+    runner = Runner(args.sim, args.tests, args.work_dir, args.make_arg, args.verbose)
+    runs = runner.sweep(configs, args.jobs)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"sim": args.sim, "tests": args.tests, "runs": runs}, f, indent=2)
+
+    status = 0
+    if any("failed" in run for run in runs):
+        status = 1
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions, improvements, missing = compare(runs, baseline, args.tolerance)
+        for key, name, old, value in improvements:
+            print("improved   {}: {} {:.3f} -> {:.3f}".format(key, name, old, value))
+        for key, name, old, value in regressions:
+            print("REGRESSION {}: {} {:.3f} -> {:.3f}".format(key, name, old, value))
+        for key in missing:
+            print("no baseline for {}".format(key))
+        if regressions:
+            status = 1
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,502 @@
+#!/usr/bin/env python3
+"""Local stand-in for a board: UARTWishboneBridge, sdc_controller and card.
+
+Decodes the bridge frames CommUART sends (0x01 write / 0x02 read, word
+count, big-endian address) from a pty or a TCP socket, and answers them
+from the sdc_controller registers of sd_defines.h, an emulated
+integrated_main_ram the controller DMAs to and from, and an SDHC card
+whose blocks are an mmap'd disk image:
+
+    python3 sim/board_emulator.py --image card.img --size 64M --tcp 2000 &
+    python3 -m sdcard_host --port socket://127.0.0.1:2000 info
+    python3 sim/board_emulator.py --image card.img --pty &
+    python3 -m sdcard_host --port /dev/pts/N --baudrate 3000000 dump copy.img
+
+Commands complete at once and blocks move at memory speed unless
+--cmd-latency/--block-latency say otherwise; --link-latency and
+--baudrate do the same for the link. Stream ports, the command queue
+and the perf counters are not emulated.
+"""
+import argparse
+import mmap
+import os
+import socket
+import struct
+import sys
+import time
+import tty
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from sdcard_host.crc import crc7
+from sdcard_host.sd_defines import *
+
+
+# card states (R1 CURRENT_STATE)
+IDLE, READY, IDENT, STBY, TRAN, DATA, RCV, PRG = range(8)
+
+R1_APP_CMD = 1 << 5
+R1_READY_FOR_DATA = 1 << 8
+R1_ADDRESS_ERROR = 1 << 30
+
+_names = {offset: name for name, offset in registers.items()}
+
+
+def _r2(value):
+    # 128 bit CID/CSD as the controller keeps it: bits [127:8], CRC7, end bit
+    value &= ~0xff
+    return value | crc7(value.to_bytes(16, "big")[:15]) << 1 | 1
+
+
+class EmulatedCard:
+    """SDHC card protocol over an image, see sim/sdcard_model.py for
+    the bus level version. The SCR lists CMD23."""
+    block_size = 512
+
+    def __init__(self, image, power_up_polls=2):
+        if len(image) < 1024*self.block_size or len(image) % (1024*self.block_size):
+            raise ValueError("image size must be a multiple of 512 KiB")
+        self.image = image
+        self.nblocks = len(image)//self.block_size
+        self.power_up_polls = power_up_polls
+        self.rca = 0x1234
+        self.cid = _r2(0x03534453443332478012345678012300)
+        self.scr = (0x02 << 56) | (0x05 << 48) | (1 << 47) | (1 << 33)
+        c_size = self.nblocks//1024 - 1
+        self.csd = _r2((1 << 126) |     # CSD_STRUCTURE 1
+                       (0x0e << 112) |  # TAAC
+                       (0x32 << 96) |   # TRAN_SPEED 25 MHz
+                       (0x5b5 << 84) |  # CCC
+                       (9 << 80) |      # READ_BL_LEN 512
+                       (c_size << 48) |
+                       (1 << 46) |      # ERASE_BLK_EN
+                       (0x7f << 39) |   # SECTOR_SIZE
+                       (2 << 26) |      # R2W_FACTOR
+                       (9 << 22))       # WRITE_BL_LEN 512
+        self.reset()
+
+    def reset(self):
+        self.state = IDLE
+        self.app = False
+        self.polls = 0
+        self.high_speed = False
+        self.block_count = None
+        # ("read", bytes or lba) or ("write", lba) for the data phase
+        self.transfer = None
+
+    def _status(self):
+        return (self.state << 9) | R1_READY_FOR_DATA | (R1_APP_CMD if self.app else 0)
+
+    def command(self, index, arg):
+        """Execute a command, returns the response (32 or 128 bits) or
+        None if the card doesn't answer."""
+        app, self.app = self.app, False
+        self.transfer = None
+        if app and index == 41:
+            self.polls += 1
+            ocr = 0x00ff8000
+            if self.polls > self.power_up_polls:
+                ocr |= 1 << 31 | (1 << 30 if arg & (1 << 30) else 0)
+                self.state = READY
+            return ocr
+        if app and index == 6:
+            return self._status() | R1_APP_CMD
+        if app and index == 51:
+            self.transfer = ("read", self.scr.to_bytes(8, "big"))
+            return self._status() | R1_APP_CMD
+        if index == 0:
+            self.reset()
+            return None
+        if index == 8:
+            return arg & 0xfff
+        if index == 55:
+            self.app = True
+            return self._status() | R1_APP_CMD
+        if index == 2:
+            self.state = IDENT
+            return self.cid
+        if index == 3:
+            self.state = STBY
+            return (self.rca << 16) | (self.state << 9) | R1_READY_FOR_DATA
+        if index == 9:
+            return self.csd
+        if index == 10:
+            return self.cid
+        if index == 7:
+            status = self._status()
+            self.state = TRAN if arg >> 16 == self.rca else STBY
+            return status
+        if index in (13, 16):
+            return self._status()
+        if index == 23:
+            self.block_count = arg & 0xffff
+            return self._status()
+        if index == 6:
+            if arg >> 31 and arg & 0xf == 1:
+                self.high_speed = True
+            status = bytearray(64)
+            status[0:2] = (100).to_bytes(2, "big")     # max current
+            status[12:14] = (0x8003).to_bytes(2, "big")
+            status[16] = 1 if self.high_speed or arg & 0xf == 1 else 0
+            self.transfer = ("read", bytes(status))
+            return self._status()
+        if index == 12:
+            status = self._status()
+            self.state = TRAN
+            return status
+        if index in (17, 18, 24, 25):
+            if arg >= self.nblocks:
+                return self._status() | R1_ADDRESS_ERROR
+            status = self._status()
+            self.state = DATA if index in (17, 18) else RCV
+            self.transfer = ("read" if index in (17, 18) else "write", arg)
+            return status
+        return None
+
+    def end_transfer(self, multiple):
+        """The controller is done with the data, a multiple block
+        transfer without CMD23 goes on until CMD12."""
+        if not multiple or self.block_count is not None:
+            self.state = TRAN
+        self.block_count = None
+        self.transfer = None
+
+    def read(self, nbytes):
+        source = self.transfer[1]
+        if isinstance(source, bytes):
+            return source[:nbytes]
+        start = source*self.block_size
+        return bytes(self.image[start:min(start + nbytes, len(self.image))])
+
+    def write(self, data):
+        start = self.transfer[1]*self.block_size
+        end = min(start + len(data), len(self.image))
+        self.image[start:end] = data[:end - start]
+
+
+class BoardEmulator:
+    """The bus behind the bridge: sdc_controller registers at base, main
+    RAM at ram_base, everything else a sparse word memory. The
+    BoardEmulators in slots answer in the next register windows
+    (--sdcard-slots), sharing ram.
+
+    feed() takes bytes from the link and returns the reply bytes. Status
+    flags show up in cmd_isr cmd_latency seconds after the argument
+    write, in data_isr block_latency seconds per block after that.
+    """
+    def __init__(self, card, base=0x50000000, ram_base=0x40000000, ram_size=0x8000,
+                 addressing="word", cmd_latency=0.0, block_latency=0.0, debug=False, ram=None):
+        self.card = card
+        self.base = base
+        self.ram_base = ram_base
+        self.ram = bytearray(ram_size) if ram is None else ram
+        self.slots = []
+        self.addressing = addressing
+        self.cmd_latency = cmd_latency
+        self.block_latency = block_latency
+        self.debug = debug
+        self.memory = {}
+        self._rx = bytearray()
+        self.reset()
+
+    def reset(self):
+        self.regs = dict.fromkeys(registers, 0)
+        self.regs["blksize"] = RESET_BLOCK_SIZE
+        self.regs["clock_d"] = RESET_CLK_DIV
+        self.regs["voltage"] = SUPPLY_VOLTAGE_mV
+        self._clear_isr()
+
+    def _clear_isr(self):
+        # (value, time it shows up) of the interrupt status registers
+        self._isr = {"cmd_isr": (0, 0.0), "data_isr": (0, 0.0)}
+
+    # bus
+
+    def _ram(self, addr, nbytes):
+        offset = addr - self.ram_base
+        if offset < 0 or offset + nbytes > len(self.ram):
+            return None
+        return offset
+
+    def _slot(self, addr):
+        i = (addr - self.base)//SLOT_WINDOW
+        return self.slots[i - 1] if 0 < i <= len(self.slots) else None
+
+    def read(self, addr):
+        slot = self._slot(addr)
+        if slot is not None:
+            return slot.read(addr)
+        offset = addr - self.base
+        if offset in _names:
+            name = _names[offset]
+            if name in self._isr:
+                value, at = self._isr[name]
+                return value if time.monotonic() >= at else 0
+            return self.regs[name]
+        ram = self._ram(addr, 4)
+        if ram is not None:
+            return int.from_bytes(self.ram[ram:ram + 4], "big")
+        return self.memory.get(addr & ~3, 0)
+
+    def write(self, addr, value):
+        slot = self._slot(addr)
+        if slot is not None:
+            return slot.write(addr, value)
+        offset = addr - self.base
+        if offset in _names:
+            name = _names[offset]
+            if name in self._isr:
+                self._isr[name] = (0, 0.0)
+            elif name == "reset" and value & 1:
+                self._clear_isr()
+                self.regs[name] = value
+            elif name == "argument":
+                self.regs[name] = value
+                self._command(value)
+            elif name != "fifo_status":
+                self.regs[name] = value
+            return
+        ram = self._ram(addr, 4)
+        if ram is not None:
+            self.ram[ram:ram + 4] = value.to_bytes(4, "big")
+        else:
+            self.memory[addr & ~3] = value
+
+    # bridge
+
+    def feed(self, data):
+        """Decode bridge frames, returns the replies to the reads."""
+        self._rx += data
+        reply = bytearray()
+        pos = 0
+        while len(self._rx) - pos >= 6:
+            msg, length, addr = struct.unpack_from(">BBI", self._rx, pos)
+            if self.addressing == "word":
+                addr *= 4
+            if msg == 0x01:
+                if len(self._rx) - pos < 6 + 4*length:
+                    break
+                values = struct.unpack_from(">{}I".format(length), self._rx, pos + 6)
+                for i, value in enumerate(values):
+                    if self.debug:
+                        print("write {:08x} @ {:08x}".format(value, addr + 4*i))
+                    self.write(addr + 4*i, value)
+                pos += 6 + 4*length
+            elif msg == 0x02:
+                for i in range(length):
+                    value = self.read(addr + 4*i)
+                    if self.debug:
+                        print("read {:08x} @ {:08x}".format(value, addr + 4*i))
+                    reply += struct.pack(">I", value)
+                pos += 6
+            else:
+                # out of sync, drop everything like the bridge's timeout would
+                print("bad bridge frame {:02x}, dropping {} bytes".format(msg, len(self._rx) - pos),
+                      file=sys.stderr)
+                pos = len(self._rx)
+        del self._rx[:pos]
+        return reply
+
+    # controller
+
+    def _set_isr(self, name, value, at):
+        self._isr[name] = (value, at)
+
+    def _command(self, arg):
+        cmd = self.regs["command"]
+        index = (cmd >> CMD_INDEX) & 0x3f
+        data_xfer = (cmd >> CMD_WITH_DATA) & 3
+        wait_resp = (cmd >> CMD_RESPONSE_CHECK) & 3
+        count = (self.regs["blkcnt"] & ((1 << BLKCNT_W) - 1)) + 1
+        now = time.monotonic()
+        cmd_done = now + self.cmd_latency
+        if data_xfer and count > 1 and cmd >> CMD_AUTO_CMD23 & 1:
+            self.card.command(23, count)
+        response = self.card.command(index, arg)
+        if response is None:
+            if wait_resp:
+                self._set_isr("cmd_isr", CmdInt.CTE | CmdInt.EI, cmd_done)
+            else:
+                self._set_isr("cmd_isr", CmdInt.CC, cmd_done)
+            return
+        words = [response >> 96, response >> 64, response >> 32, response] if wait_resp == 2 else [response]
+        for i, word in enumerate(words):
+            self.regs["resp{}".format(i)] = word & 0xffffffff
+        self._set_isr("cmd_isr", CmdInt.CC, cmd_done)
+        if not data_xfer:
+            return
+        kind = "read" if data_xfer == 1 else "write"
+        if self.card.transfer is None or self.card.transfer[0] != kind:
+            self._set_isr("data_isr", DataInt.CTE | DataInt.EI, cmd_done)
+            return
+        size = (self.regs["blksize"] & ((1 << BLKSIZE_W) - 1)) + 1
+        ok = self._dma(kind, size, count)
+        self.card.end_transfer(index in (18, 25))
+        if count > 1 and cmd >> CMD_AUTO_CMD12 & 1 and not cmd >> CMD_AUTO_CMD23 & 1:
+            self.card.command(12, 0)
+        data_done = cmd_done + count*self.block_latency
+        self._set_isr("data_isr", DataInt.CC if ok else DataInt.CFE | DataInt.EI, data_done)
+
+    def _buffers(self, size, count):
+        """(address, blocks, descriptor address) of the DMA buffers."""
+        addr = self.regs["dst_src_addr"]
+        if not self.regs["controller"] >> CONTROLLER_DESC & 1:
+            return [(addr, count, None)]
+        buffers = []
+        while count > 0:
+            buf, flags, next_desc = (self.read(addr + 4*i) for i in range(3))
+            blocks = min(flags >> DESC_BLOCKS & 0xffff, count)
+            buffers.append((buf, blocks, addr))
+            count -= blocks
+            if flags >> DESC_LAST & 1:
+                break
+            addr = next_desc
+        return buffers
+
+    def _dma(self, kind, size, count):
+        if self.regs["controller"] >> CONTROLLER_STREAM & 1:
+            return False
+        buffers = self._buffers(size, count)
+        if sum(blocks for _, blocks, _ in buffers) < count:
+            # no buffer left for the rest, the FIFO overruns/underruns
+            return False
+        if kind == "read":
+            data = self.card.read(size*count)
+        else:
+            data = bytearray()
+        pos = 0
+        for addr, blocks, desc in buffers:
+            nbytes = blocks*size
+            ram = self._ram(addr, nbytes)
+            if ram is None:
+                return False
+            if kind == "read":
+                self.ram[ram:ram + nbytes] = data[pos:pos + nbytes].ljust(nbytes, b"\0")
+            else:
+                data += self.ram[ram:ram + nbytes]
+            pos += nbytes
+            if desc is not None:
+                self.write(desc + 12, 1 << DESC_DONE | blocks)
+        if kind == "write":
+            self.card.write(bytes(data))
+        return True
+
+
+class Link:
+    """Runs a BoardEmulator on a byte stream, delaying each reply by
+    the wire time at baudrate (0: none) plus link_latency."""
+    def __init__(self, board, baudrate=0, link_latency=0.0):
+        self.board = board
+        self.baudrate = baudrate
+        self.link_latency = link_latency
+
+    def _delay(self, nin, nout, start):
+        delay = 0.0
+        if self.baudrate:
+            delay += (nin + nout)*10/self.baudrate
+        if nout:
+            delay += self.link_latency
+        delay -= time.monotonic() - start
+        if delay > 0:
+            time.sleep(delay)
+
+    def serve(self, recv, send):
+        while True:
+            data = recv()
+            if not data:
+                return
+            start = time.monotonic()
+            reply = self.board.feed(data)
+            self._delay(len(data), len(reply), start)
+            if reply:
+                send(reply)
+
+    def serve_pty(self):
+        master, slave = os.openpty()
+        tty.setraw(slave)
+        # the slave end stays open here, so clients can come and go
+        print(os.ttyname(slave), flush=True)
+        self.serve(lambda: os.read(master, 65536), lambda data: os.write(master, data))
+
+    def serve_tcp(self, host, port):
+        server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        server.bind((host, port))
+        server.listen(1)
+        print("socket://{}:{}".format(host, port), flush=True)
+        while True:
+            conn, _ = server.accept()
+            conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            with conn:
+                self.board._rx.clear()
+                try:
+                    self.serve(lambda: conn.recv(65536), conn.sendall)
+                except ConnectionError:
+                    pass
+
+
+def _size(s):
+    units = {"K": 1 << 10, "M": 1 << 20, "G": 1 << 30}
+    if s[-1:].upper() in units:
+        return int(s[:-1], 0)*units[s[-1:].upper()]
+    return int(s, 0)
+
+
+def open_image(path, size=None):
+    """mmap an image file, created (sparse) or grown to size if given."""
+    flags = os.O_RDWR | (os.O_CREAT if size else 0)
+    fd = os.open(path, flags, 0o644)
+    try:
+        if size and os.fstat(fd).st_size < size:
+            os.ftruncate(fd, size)
+        return mmap.mmap(fd, 0)
+    finally:
+        os.close(fd)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="board stand-in: UART bridge, sdc_controller and card")
+    parser.add_argument("--image", help="card image file (default: an anonymous one of --size)")
+    parser.add_argument("--size", type=_size, help="create or grow the image to this size (K/M/G suffixes)")
+    link = parser.add_mutually_exclusive_group()
+    link.add_argument("--pty", action="store_true", help="serve on a new pty (default), its path is printed")
+    link.add_argument("--tcp", type=int, metavar="PORT", help="serve on a TCP port (socket:// URL)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--addressing", default="word", choices=["word", "byte"], help="bridge address format")
+    parser.add_argument("--base", default=0x50000000, type=lambda s: int(s, 0), help="sdcard core base address")
+    parser.add_argument("--ram-base", default=0x40000000, type=lambda s: int(s, 0), help="main RAM address")
+    parser.add_argument("--ram-size", default=0x8000, type=_size, help="main RAM size")
+    parser.add_argument("--slots", default=1, type=int,
+                        help="SD card slots, the further ones with anonymous images of the same size")
+    parser.add_argument("--baudrate", default=0, type=int, help="emulate the wire time at this rate")
+    parser.add_argument("--link-latency", default=0.0, type=float, help="seconds added to every reply")
+    parser.add_argument("--cmd-latency", default=0.0, type=float, help="seconds until a command completes")
+    parser.add_argument("--block-latency", default=0.0, type=float, help="seconds per transferred block")
+    parser.add_argument("--debug", action="store_true", help="print every access")
+    args = parser.parse_args()
+
+    if args.image:
+        image = open_image(args.image, args.size)
+    else:
+        image = mmap.mmap(-1, args.size or 64 << 20)
+    board = BoardEmulator(EmulatedCard(image), args.base, args.ram_base, args.ram_size, args.addressing,
+                          args.cmd_latency, args.block_latency, args.debug)
+    for i in range(1, args.slots):
+        card = EmulatedCard(mmap.mmap(-1, len(image)))
+        board.slots.append(BoardEmulator(card, args.base + i*SLOT_WINDOW, args.ram_base, args.ram_size,
+                                         args.addressing, args.cmd_latency, args.block_latency,
+                                         args.debug, board.ram))
+    link = Link(board, args.baudrate, args.link_latency)
+    try:
+        if args.tcp is not None:
+            link.serve_tcp(args.host, args.tcp)
+        else:
+            link.serve_pty()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        image.flush()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+import mmap
+import os
+import socket
+import sys
+import threading
+
+import pytest
+
+# the tests import sdcard_host from the checkout, like the Makefile's PYTHONPATH
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from board_emulator import BoardEmulator, EmulatedCard, Link
+from sdcard_host.sd_defines import SLOT_WINDOW
+
+
+def serve(handler):
+    """Run handler(conn) for the first connection to a new local TCP
+    port, returns the listening socket and its socket:// URL."""
+    server = socket.create_server(("127.0.0.1", 0))
+
+    def run():
+        conn, _ = server.accept()
+        conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        with conn:
+            try:
+                handler(conn)
+            except ConnectionError:
+                pass
+
+    threading.Thread(target=run, daemon=True).start()
+    return server, "socket://127.0.0.1:{}".format(server.getsockname()[1])
+
+
+@pytest.fixture
+def emulators():
+    """emulators(image_size, slots, **BoardEmulator kwargs) serves a new
+    board emulator, returns it and its URL."""
+    servers = []
+
+    def start(image_size=1 << 20, slots=1, **kwargs):
+        board = BoardEmulator(EmulatedCard(mmap.mmap(-1, image_size)), **kwargs)
+        for i in range(1, slots):
+            board.slots.append(BoardEmulator(EmulatedCard(mmap.mmap(-1, image_size)),
+                                             board.base + i*SLOT_WINDOW, ram=board.ram, **kwargs))
+        link = Link(board)
+        server, url = serve(lambda conn: link.serve(lambda: conn.recv(65536), conn.sendall))
+        servers.append(server)
+        return board, url
+
+    yield start
+    for server in servers:
+        server.close()
+
+
+@pytest.fixture
+def emulator(emulators):
+    return emulators()
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""Local UDP stand-in for the LiteEth Etherbone bridge.
+
+Answers CommEtherbone packets from a sparse word memory, so the host
+side can be exercised without a board or lab network:
+
+    python3 sim/etherbone_server.py --port 1234 &
+    python3 -m sdcard_host --bridge etherbone --ip 127.0.0.1 write 0x40000000 1 2 3
+    python3 -m sdcard_host --bridge etherbone --ip 127.0.0.1 read 0x40000000 3
+
+Subclass and override read()/write() to put a model behind it.
+"""
+import argparse
+import os
+import socket
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from sdcard_host.comm_etherbone import ETHERBONE_PORT, decode_packet, encode_packet
+
+
+class EtherboneServer:
+    def __init__(self, host="127.0.0.1", port=ETHERBONE_PORT, debug=False):
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind((host, port))
+        self.debug = debug
+        self.memory = {}
+        self.packets = 0
+
+    def read(self, addr):
+        return self.memory.get(addr & ~3, 0)
+
+    def write(self, addr, value):
+        self.memory[addr & ~3] = value
+
+    def handle(self, packet):
+        """Apply one packet, returns the reply or None."""
+        writes, reads, base_ret_addr = decode_packet(packet)
+        self.packets += 1
+        if writes:
+            base, data = writes
+            for i in range(len(data)//4):
+                value = int.from_bytes(data[4*i:4*i + 4], "big")
+                if self.debug:
+                    print("write {:08x} @ {:08x}".format(value, base + 4*i))
+                self.write(base + 4*i, value)
+        if not reads:
+            return None
+        data = bytearray()
+        for addr in reads:
+            value = self.read(addr)
+            if self.debug:
+                print("read {:08x} @ {:08x}".format(value, addr))
+            data += value.to_bytes(4, "big")
+        return encode_packet(writes=(base_ret_addr, bytes(data)))
+
+    def serve_forever(self):
+        while True:
+            packet, peer = self.sock.recvfrom(65536)
+            try:
+                reply = self.handle(packet)
+            except ValueError as e:
+                print("dropped packet from {}: {}".format(peer, e), file=sys.stderr)
+                continue
+            if reply is not None:
+                self.sock.sendto(reply, peer)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Etherbone bridge stand-in")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", default=ETHERBONE_PORT, type=int)
+    parser.add_argument("--debug", action="store_true", help="print every access")
+    args = parser.parse_args()
+    server = EtherboneServer(args.host, args.port, args.debug)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,377 @@
+"""Behavioral SD card for the cocotb testbench.
+
+The card samples and drives the bus on the falling edge of sd_clk, the
+controller works on the rising edge. It understands the commands used by
+sdcard_host.card.SDCard (identification, selection, bus width, single and
+multiple block transfers, CMD12/CMD23, CMD6 switch, ACMD51 SCR), checks
+the CRC7 of commands and the CRC16 of written blocks and generates both
+for its responses and read blocks.
+
+Latencies are given in sd_clk cycles: ncr before a response, nac before
+each read block, ncrc before the CRC status token of a write and busy
+for the programming time that follows it.
+
+Unlike a real SDHC card, the model honors CMD16: the block length it
+sets is the size of the data blocks and the unit of their addresses, so
+benches can vary the transfer block size. It defaults to 512.
+"""
+import cocotb
+from cocotb.triggers import Event, FallingEdge
+
+from sdcard_host.crc import crc7, crc16, crc16_4bit, crc_nibbles
+
+
+def to_bits(value, width):
+    return [(value >> i) & 1 for i in range(width - 1, -1, -1)]
+
+
+def from_bits(bits):
+    value = 0
+    for bit in bits:
+        value = (value << 1) | bit
+    return value
+
+
+def _bytes(bits):
+    return from_bits(bits).to_bytes(len(bits)//8, "big")
+
+
+# card states (R1 CURRENT_STATE)
+IDLE, READY, IDENT, STBY, TRAN, DATA, RCV, PRG = range(8)
+
+R1_APP_CMD = 1 << 5
+R1_READY_FOR_DATA = 1 << 8
+R1_ADDRESS_ERROR = 1 << 30
+
+
+class SDCardModel:
+    block_size = 512
+
+    def __init__(self, dut, nblocks=0x10000, high_capacity=True,
+                 ncr=2, nac=8, ncrc=2, busy=16, power_up_polls=2, log=None):
+        self.clk = dut.sd_clk
+        self.cmd = dut.sd_cmd
+        self.dat = dut.sd_dat
+        self.cmd_o = dut.card_cmd_o
+        self.cmd_oe = dut.card_cmd_oe
+        self.dat_o = dut.card_dat_o
+        self.dat_oe = dut.card_dat_oe
+        self.log = log or dut._log
+
+        self.nblocks = nblocks
+        self.high_capacity = high_capacity
+        self.ncr = max(ncr, 2)
+        self.nac = max(nac, 2)
+        self.ncrc = max(ncrc, 1)
+        self.busy = max(busy, 1)
+        self.power_up_polls = power_up_polls
+        self.image = bytearray(nblocks*self.block_size)
+        self.block_len = self.block_size
+
+        self.rca = 0x1234
+        self.cid = 0x03534453443332478012345678012300
+        self.state = IDLE
+        self.app = False
+        self.bus_width = 1
+        self.high_speed = False
+        self.block_count = None
+        self.polls = 0
+        self.crc_errors = 0
+        self.commands = []
+
+        self._stop = Event()
+        self._data = None
+        self._pending = None
+
+        self.cmd_oe.value = 0
+        self.cmd_o.value = 1
+        self.dat_oe.value = 0
+        self.dat_o.value = 0xf
+
+    def start(self):
+        return cocotb.start_soon(self._command_loop())
+
+    @property
+    def _nblocks(self):
+        # in blocks of the current block length
+        return len(self.image)//self.block_len
+
+    @property
+    def csd(self):
+        if not self.high_capacity:
+            raise NotImplementedError("only CSD version 2.0 is modelled")
+        c_size = self.nblocks//1024 - 1
+        return ((1 << 126) |            # CSD_STRUCTURE 1
+                (0x0e << 112) |         # TAAC
+                (0x32 << 96) |          # TRAN_SPEED 25 MHz
+                (0x5b5 << 84) |         # CCC
+                (9 << 80) |             # READ_BL_LEN 512
+                (c_size << 48) |
+                (1 << 46) |             # ERASE_BLK_EN
+                (0x7f << 39) |          # SECTOR_SIZE
+                (2 << 26) |             # R2W_FACTOR
+                (9 << 22))              # WRITE_BL_LEN 512
+
+    @property
+    def scr(self):
+        # SCR_STRUCTURE 0, SD_SPEC 2, DATA_STAT_AFTER_ERASE 0, SD_SECURITY 0,
+        # SD_BUS_WIDTHS 1 and 4 bit, SD_SPEC3
+        return (0x02 << 56) | (0x05 << 48) | (1 << 47)
+
+    def _status(self):
+        return (self.state << 9) | R1_READY_FOR_DATA | (R1_APP_CMD if self.app else 0)
+
+    # command line
+
+    async def _command_loop(self):
+        while True:
+            await FallingEdge(self.clk)
+            if self.cmd.value.binstr != "0":
+                continue
+            bits = [0]
+            for _ in range(47):
+                await FallingEdge(self.clk)
+                bits.append(int(self.cmd.value))
+            if bits[1] != 1 or bits[47] != 1 or crc7(_bytes(bits[:40])) != from_bits(bits[40:47]):
+                self.log.warning("SD card: bad command frame {}".format("".join(map(str, bits))))
+                continue
+            index = from_bits(bits[2:8])
+            arg = from_bits(bits[8:40])
+            self.commands.append((cocotb.utils.get_sim_time("ns"), index, arg))
+            response = self._execute(index, arg)
+            if response is not None:
+                await self._respond(*response)
+            if self._pending is not None:
+                # data follows the response
+                self._data = cocotb.start_soon(self._pending)
+                self._pending = None
+
+    async def _respond(self, kind, index, value, busy=False):
+        for _ in range(self.ncr - 1):
+            await FallingEdge(self.clk)
+        if kind == "R2":
+            bits = [0, 0] + [1]*6 + to_bits(value, 120)
+            bits += to_bits(crc7(value.to_bytes(15, "big")), 7) + [1]
+        elif kind == "R3":
+            bits = [0, 0] + [1]*6 + to_bits(value, 32) + [1]*7 + [1]
+        else:
+            bits = [0, 0] + to_bits(index, 6) + to_bits(value, 32)
+            bits += to_bits(crc7(_bytes(bits)), 7) + [1]
+        for bit in bits:
+            await FallingEdge(self.clk)
+            self.cmd_oe.value = 1
+            self.cmd_o.value = bit
+        await FallingEdge(self.clk)
+        self.cmd_oe.value = 0
+        if busy:
+            await self._drive_busy()
+
+    def _execute(self, index, arg):
+        app, self.app = self.app, False
+        if app and index == 41:
+            if self.state != IDLE:
+                return None
+            self.polls += 1
+            ocr = 0x00ff8000
+            if self.polls > self.power_up_polls:
+                ocr |= 1 << 31
+                if arg & (1 << 30) and self.high_capacity:
+                    ocr |= 1 << 30
+                self.state = READY
+            return ("R3", 0x3f, ocr)
+        if app and index == 6:
+            self.bus_width = 4 if arg & 3 == 2 else 1
+            return ("R1", index, self._status() | R1_APP_CMD)
+        if app and index == 51:
+            self._start_read([self.scr.to_bytes(8, "big")])
+            return ("R1", index, self._status() | R1_APP_CMD)
+
+        if index == 0:
+            self._abort()
+            self.state = IDLE
+            self.bus_width = 1
+            self.high_speed = False
+            self.polls = 0
+            return None
+        if index == 8:
+            return ("R1", index, arg & 0xfff)
+        if index == 55:
+            self.app = True
+            return ("R1", index, self._status() | R1_APP_CMD)
+        if index == 2:
+            self.state = IDENT
+            return ("R2", 0x3f, self.cid >> 8)
+        if index == 3:
+            self.state = STBY
+            return ("R1", index, (self.rca << 16) | (self.state << 9) | R1_READY_FOR_DATA)
+        if index == 9:
+            return ("R2", 0x3f, self.csd >> 8)
+        if index == 10:
+            return ("R2", 0x3f, self.cid >> 8)
+        if index == 7:
+            selected = arg >> 16 == self.rca
+            status = self._status()
+            self.state = TRAN if selected else STBY
+            return ("R1", index, status, selected)
+        if index == 13:
+            return ("R1", index, self._status())
+        if index == 16:
+            if 0 < arg <= self.block_size:
+                self.block_len = arg
+            return ("R1", index, self._status())
+        if index == 23:
+            self.block_count = arg & 0xffff
+            return ("R1", index, self._status())
+        if index == 6:
+            if arg >> 31 and arg & 0xf == 1:
+                self.high_speed = True
+            status = bytearray(64)
+            status[0:2] = (100).to_bytes(2, "big")     # max current
+            status[12:14] = (0x8003).to_bytes(2, "big")
+            status[16] = 1 if self.high_speed or arg & 0xf == 1 else 0
+            self._start_read([bytes(status)])
+            return ("R1", index, self._status())
+        if index == 12:
+            writing = self.state == RCV
+            self._abort()
+            status = self._status()
+            self.state = TRAN
+            return ("R1", index, status, writing)
+        if index in (17, 18, 24, 25):
+            lba = arg if self.high_capacity else arg//self.block_len
+            if lba >= self._nblocks:
+                return ("R1", index, self._status() | R1_ADDRESS_ERROR)
+            status = self._status()
+            count = 1 if index in (17, 24) else self.block_count
+            self.block_count = None
+            if index in (17, 18):
+                self._start_read(self._blocks(lba, count))
+            else:
+                self._start_write(lba, count)
+            return ("R1", index, status)
+        self.log.info("SD card: illegal command CMD{} {:08x}".format(index, arg))
+        return None
+
+    # data lines
+
+    def _blocks(self, lba, count):
+        while count is None or count:
+            if lba >= self._nblocks:
+                return
+            yield bytes(self.image[lba*self.block_len:(lba + 1)*self.block_len])
+            lba += 1
+            if count is not None:
+                count -= 1
+
+    def _abort(self):
+        if self._data is not None and not self._data.done():
+            self._stop.set()
+        if self._pending is not None:
+            self._pending.close()
+        self._data = None
+        self._pending = None
+
+    def _start_read(self, blocks):
+        self._abort()
+        self._stop = Event()
+        self.state = DATA
+        self._pending = self._read(blocks, self._stop)
+
+    def _start_write(self, lba, count):
+        self._abort()
+        self._stop = Event()
+        self.state = RCV
+        self._pending = self._write(lba, count, self._stop)
+
+    def _values(self, data):
+        """The per-cycle DAT values of data."""
+        if self.bus_width == 4:
+            values = []
+            for byte in data:
+                values += [byte >> 4, byte & 0xf]
+            return values
+        return [0xe | bit for byte in data for bit in to_bits(byte, 8)]
+
+    def _crc_values(self, data):
+        if self.bus_width == 4:
+            return crc_nibbles(crc16_4bit(data))
+        return [0xe | bit for bit in to_bits(crc16(data), 16)]
+
+    async def _drive(self, values, stop=None):
+        for value in values:
+            await FallingEdge(self.clk)
+            if stop is not None and stop.is_set():
+                return False
+            self.dat_oe.value = 1
+            self.dat_o.value = value
+        return True
+
+    async def _release(self):
+        await FallingEdge(self.clk)
+        self.dat_oe.value = 0
+        self.dat_o.value = 0xf
+
+    async def _read(self, blocks, stop):
+        try:
+            for block in blocks:
+                for _ in range(self.nac - 1):
+                    await FallingEdge(self.clk)
+                    if stop.is_set():
+                        return
+                start = 0x0 if self.bus_width == 4 else 0xe
+                if not await self._drive([start] + self._values(block) + self._crc_values(block) + [0xf],
+                                         stop):
+                    return
+                await self._release()
+        finally:
+            self.dat_oe.value = 0
+            if not stop.is_set():
+                self.state = TRAN
+
+    async def _drive_busy(self):
+        for _ in range(self.busy):
+            await FallingEdge(self.clk)
+            self.dat_oe.value = 1
+            self.dat_o.value = 0xe
+        await self._release()
+
+    async def _write(self, lba, count, stop):
+        cycles = self.block_len*8//self.bus_width
+        try:
+            while count is None or count:
+                while True:
+                    await FallingEdge(self.clk)
+                    if stop.is_set():
+                        return
+                    if not int(self.dat.value) & 1:
+                        break
+                values = []
+                for _ in range(cycles + 16 + 1):
+                    await FallingEdge(self.clk)
+                    values.append(int(self.dat.value))
+                if self.bus_width == 4:
+                    data = bytes((values[i] << 4) | values[i + 1] for i in range(0, cycles, 2))
+                    received = values[cycles:cycles + 16]
+                else:
+                    data = bytes(from_bits([v & 1 for v in values[i:i + 8]]) for i in range(0, cycles, 8))
+                    received = [0xe | (v & 1) for v in values[cycles:cycles + 16]]
+                ok = received == self._crc_values(data) and values[-1] & 1
+                for _ in range(self.ncrc - 1):
+                    await FallingEdge(self.clk)
+                token = [0, 0, 1, 0, 1] if ok else [0, 1, 0, 1, 1]
+                await self._drive([0xe | bit for bit in token])
+                if ok and lba < self._nblocks:
+                    self.image[lba*self.block_len:(lba + 1)*self.block_len] = data
+                elif not ok:
+                    self.crc_errors += 1
+                    self.log.warning("SD card: CRC error writing block {}".format(lba))
+                self.state = PRG
+                await self._drive_busy()
+                self.state = RCV
+                lba += 1
+                if count is not None:
+                    count -= 1
+        finally:
+            self.dat_oe.value = 0
+            if not stop.is_set():
+                self.state = TRAN
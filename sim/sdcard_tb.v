@@ -0,0 +1,131 @@
+// Simulation top for sdc_controller: resolves the CMD/DAT tristates
+// between the controller and the card model (with pull-ups) and brings
+// both wishbone ports, the data streams and the perf events out to cocotb. Stream and
+// descriptor DMA are built in, enabled by the controller register.
+
+module sdcard_tb(
+    input clk,
+    input rst,
+
+    // wishbone slave (registers), byte address
+    input [7:0] wb_adr,
+    input [31:0] wb_dat_w,
+    output [31:0] wb_dat_r,
+    input [3:0] wb_sel,
+    input wb_we,
+    input wb_cyc,
+    input wb_stb,
+    output wb_ack,
+
+    // wishbone master (DMA), byte address
+    output [31:0] m_wb_adr,
+    output [31:0] m_wb_dat_w,
+    input [31:0] m_wb_dat_r,
+    output [3:0] m_wb_sel,
+    output m_wb_we,
+    output m_wb_cyc,
+    output m_wb_stb,
+    input m_wb_ack,
+    output [2:0] m_wb_cti,
+    output [1:0] m_wb_bte,
+
+    // SD bus as seen on the pads, driven by the card model
+    output sd_clk,
+    output sd_cmd,
+    output [3:0] sd_dat,
+    input card_cmd_o,
+    input card_cmd_oe,
+    input [3:0] card_dat_o,
+    input card_dat_oe,
+
+    output int_cmd,
+    output int_data,
+
+    // performance counter events (levels, xfer a strobe)
+    output perf_data_busy,
+    output perf_write_busy,
+    output perf_rx_full,
+    output perf_rx_empty,
+    output perf_tx_full,
+    output perf_tx_empty,
+    output perf_xfer,
+
+    // data streams (controller register stream bit)
+    output [31:0] rx_stream_data,
+    output rx_stream_valid,
+    input rx_stream_ready,
+    output rx_stream_last,
+    input [31:0] tx_stream_data,
+    input tx_stream_valid,
+    output tx_stream_ready
+);
+
+parameter RX_FIFO_ADR_SIZE = 4;
+parameter TX_FIFO_ADR_SIZE = 4;
+parameter BURST = 0;
+
+wire host_cmd_o;
+wire host_cmd_oe;
+wire [3:0] host_dat_o;
+wire host_dat_oe;
+
+assign sd_cmd = host_cmd_oe ? host_cmd_o : card_cmd_oe ? card_cmd_o : 1'b1;
+assign sd_dat = host_dat_oe ? host_dat_o : card_dat_oe ? card_dat_o : 4'hf;
+
+sdc_controller #(
+    .RX_FIFO_ADR_SIZE(RX_FIFO_ADR_SIZE),
+    .TX_FIFO_ADR_SIZE(TX_FIFO_ADR_SIZE),
+    .BURST(BURST),
+    .STREAM(1),
+    .DESC(1)
+    ) sdc_controller0(
+    .wb_clk_i     (clk),
+    .wb_rst_i     (rst),
+    .wb_dat_i     (wb_dat_w),
+    .wb_dat_o     (wb_dat_r),
+    .wb_adr_i     (wb_adr),
+    .wb_sel_i     (wb_sel),
+    .wb_we_i      (wb_we),
+    .wb_cyc_i     (wb_cyc),
+    .wb_stb_i     (wb_stb),
+    .wb_ack_o     (wb_ack),
+    .m_wb_dat_o   (m_wb_dat_w),
+    .m_wb_dat_i   (m_wb_dat_r),
+    .m_wb_adr_o   (m_wb_adr),
+    .m_wb_sel_o   (m_wb_sel),
+    .m_wb_we_o    (m_wb_we),
+    .m_wb_cyc_o   (m_wb_cyc),
+    .m_wb_stb_o   (m_wb_stb),
+    .m_wb_ack_i   (m_wb_ack),
+    .m_wb_cti_o   (m_wb_cti),
+    .m_wb_bte_o   (m_wb_bte),
+    .sd_cmd_dat_i (sd_cmd),
+    .sd_cmd_out_o (host_cmd_o),
+    .sd_cmd_oe_o  (host_cmd_oe),
+    .sd_dat_dat_i (sd_dat),
+    .sd_dat_out_o (host_dat_o),
+    .sd_dat_oe_o  (host_dat_oe),
+    .sd_clk_o_pad (sd_clk),
+    .sd_clk_i_pad (clk),
+    .int_cmd      (int_cmd),
+    .int_data     (int_data),
+    .rx_stream_data_o  (rx_stream_data),
+    .rx_stream_valid_o (rx_stream_valid),
+    .rx_stream_ready_i (rx_stream_ready),
+    .rx_stream_last_o  (rx_stream_last),
+    .tx_stream_data_i  (tx_stream_data),
+    .tx_stream_valid_i (tx_stream_valid),
+    .tx_stream_ready_o (tx_stream_ready),
+    .perf_cmd_start_o  (),
+    .perf_cmd_int_o    (),
+    .perf_data_int_o   (),
+    .perf_data_busy_o  (perf_data_busy),
+    .perf_write_busy_o (perf_write_busy),
+    .perf_rx_full_o    (perf_rx_full),
+    .perf_rx_empty_o   (perf_rx_empty),
+    .perf_tx_full_o    (perf_tx_full),
+    .perf_tx_empty_o   (perf_tx_empty),
+    .perf_xfer_o       (perf_xfer)
+);
+
+endmodule
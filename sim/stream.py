@@ -0,0 +1,71 @@
+"""Valid/ready stream models for the controller's data stream ports.
+
+Like the wishbone models, both work on the falling edge of clk: valid
+and ready do not depend on each other in the RTL, so what is set and
+seen there is what the next rising edge transfers.
+"""
+import random
+
+import cocotb
+from cocotb.triggers import FallingEdge
+
+
+class StreamSink:
+    """Takes the words of the RX stream, ready with probability
+    ready_prob. words collects the data, blocks the words of each
+    packet ended by last."""
+    def __init__(self, dut, prefix="rx_stream_", ready_prob=1.0, seed=0):
+        self.clk = dut.clk
+        self.data = getattr(dut, prefix + "data")
+        self.valid = getattr(dut, prefix + "valid")
+        self.ready = getattr(dut, prefix + "ready")
+        self.last = getattr(dut, prefix + "last")
+        self.ready_prob = ready_prob
+        self.random = random.Random(seed)
+        self.words = []
+        self.blocks = [[]]
+        self.ready.value = 0
+
+    def start(self):
+        return cocotb.start_soon(self._run())
+
+    async def _run(self):
+        while True:
+            await FallingEdge(self.clk)
+            ready = self.random.random() < self.ready_prob
+            self.ready.value = int(ready)
+            if ready and self.valid.value.binstr == "1":
+                word = int(self.data.value)
+                self.words.append(word)
+                self.blocks[-1].append(word)
+                if self.last.value.binstr == "1":
+                    self.blocks.append([])
+
+
+class StreamSource:
+    """Feeds words into the TX stream, valid with probability
+    valid_prob while words are queued."""
+    def __init__(self, dut, prefix="tx_stream_", valid_prob=1.0, seed=0):
+        self.clk = dut.clk
+        self.data = getattr(dut, prefix + "data")
+        self.valid = getattr(dut, prefix + "valid")
+        self.ready = getattr(dut, prefix + "ready")
+        self.valid_prob = valid_prob
+        self.random = random.Random(seed)
+        self.queue = []
+        self.valid.value = 0
+        self.data.value = 0
+
+    def start(self):
+        return cocotb.start_soon(self._run())
+
+    async def _run(self):
+        while True:
+            await FallingEdge(self.clk)
+            if self.queue and self.random.random() < self.valid_prob:
+                self.data.value = self.queue[0]
+                self.valid.value = 1
+                if self.ready.value.binstr == "1":
+                    self.queue.pop(0)
+            else:
+                self.valid.value = 0
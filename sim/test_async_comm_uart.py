@@ -0,0 +1,144 @@
+"""AsyncCommUART over socket:// against board_emulator.py, run with
+pytest from this directory."""
+import asyncio
+import struct
+import threading
+from array import array
+
+import pytest
+
+from conftest import serve
+from sdcard_host.async_comm_uart import AsyncCommUART
+from sdcard_host.comm_uart import CommUART
+from sdcard_host.metrics import TransportMetrics
+from sdcard_host.sd_defines import SUPPLY_VOLTAGE_mV, registers
+from sdcard_host.sdc import command
+
+
+RAM = 0x40000000
+
+
+def run(url, test, **kwargs):
+    async def main():
+        comm = AsyncCommUART(url, **kwargs)
+        try:
+            return await test(comm)
+        finally:
+            await comm.close()
+    return asyncio.run(main())
+
+
+def test_read_write(emulator):
+    board, url = emulator
+
+    async def test(comm):
+        await comm.write(RAM, 0x12345678)
+        await comm.write(RAM + 4, [1, 2, 3])
+        return (await comm.read(RAM), await comm.read(RAM + 4, 3),
+                await comm.read(board.base + registers["voltage"]))
+
+    assert run(url, test) == (0x12345678, [1, 2, 3], SUPPLY_VOLTAGE_mV)
+    assert board.ram[:8] == bytes.fromhex("1234567800000001")
+
+
+def test_block(emulator):
+    board, url = emulator
+    data = bytes(range(256))*8
+
+    async def test(comm):
+        await comm.write_block(RAM, data)
+        await comm.write_block(RAM + len(data), array("I", [0x01020304]))
+        with pytest.raises(TypeError):
+            await comm.write_block(RAM, array("H", [1, 2]))
+        return bytes(await comm.read_block(RAM, len(data)//4 + 1))
+
+    assert run(url, test) == data + bytes([1, 2, 3, 4])
+
+
+def test_batch(emulator):
+    board, url = emulator
+
+    async def test(comm):
+        async with comm.batch() as results:
+            await comm.write(RAM, 7)
+            assert await comm.read(RAM) is None
+            await comm.write(RAM + 4, [8, 9])
+            await comm.read(RAM, 3)
+            await comm.read_block(RAM, 1)
+        return results
+
+    results = run(url, test)
+    assert results[:2] == [7, [7, 8, 9]]
+    assert bytes(results[2]) == struct.pack(">I", 7)
+
+
+def test_concurrent_tasks(emulator):
+    board, url = emulator
+
+    async def task(comm, i):
+        addr = RAM + 4*i
+        for value in range(i, i + 20):
+            if i % 2:
+                async with comm.batch() as results:
+                    await comm.write(addr, value)
+                    await comm.read(addr)
+                assert results == [value]
+            else:
+                await comm.write(addr, value)
+                assert await comm.read(addr) == value
+        return i
+
+    async def test(comm):
+        return await asyncio.gather(*(task(comm, i) for i in range(16)))
+
+    assert run(url, test) == list(range(16))
+
+
+def test_close_fails_pending_reads():
+    received = bytearray()
+    frames = threading.Event()
+
+    def swallow(conn):
+        # a bridge that takes the frames but never answers
+        for data in iter(lambda: conn.recv(65536), b""):
+            received.extend(data)
+            if len(received) >= 3*6:
+                frames.set()
+
+    server, url = serve(swallow)
+
+    async def test():
+        comm = AsyncCommUART(url)
+        reads = [asyncio.ensure_future(comm.read(RAM + 4*i)) for i in range(3)]
+        await asyncio.get_running_loop().run_in_executor(None, frames.wait, 5)
+        await comm.close()
+        return await asyncio.gather(*reads, return_exceptions=True)
+
+    try:
+        results = asyncio.run(asyncio.wait_for(test(), 5))
+    finally:
+        server.close()
+    assert [type(result) for result in results] == [ConnectionError]*3
+
+
+def test_metrics(emulator):
+    board, url = emulator
+    metrics = TransportMetrics()
+
+    async def test(comm):
+        async with comm.batch():
+            await comm.write(board.base + registers["command"], command(8, wait_resp=1))
+            await comm.write(board.base + registers["argument"], 0x1aa)
+        await asyncio.gather(*(comm.read(board.base + registers["cmd_isr"]) for _ in range(3)))
+        await comm.read_block(RAM, 4)
+
+    run(url, test, metrics=metrics)
+    assert list(metrics.by_cmd) == ["CMD8"]
+    assert metrics.by_cmd["CMD8"].count == 5
+    assert metrics.bytes["CMD8"] == (2*(6 + 4) + 4*6, 3*4 + 16)
+    assert metrics.by_register[("read", "cmd_isr")].count == 3
+
+
+def test_not_a_comm_uart():
+    # the coroutines can't stand in for CommUART's methods
+    assert not isinstance(AsyncCommUART("socket://127.0.0.1:1"), CommUART)
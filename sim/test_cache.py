@@ -0,0 +1,102 @@
+"""CachedBlockDevice on an SDCard against board_emulator.py."""
+import pytest
+
+from sdcard_host.cache import CachedBlockDevice
+from sdcard_host.card import SDCardError
+from test_card import expected, fill, open_card
+
+
+class Recorder:
+    """An SDCard that logs the (lba, blocks) of its reads and writes."""
+    def __init__(self, card):
+        self.card = card
+        self.reads = []
+        self.writes = []
+        self.fail_writes = 0
+
+    def __getattr__(self, name):
+        return getattr(self.card, name)
+
+    def read(self, lba, count=1):
+        self.reads.append((lba, count))
+        return self.card.read(lba, count)
+
+    def write(self, lba, data):
+        if self.fail_writes:
+            self.fail_writes -= 1
+            raise SDCardError("CMD24 failed")
+        self.writes.append((lba, len(data)//self.block_size))
+        self.card.write(lba, data)
+
+
+@pytest.fixture
+def card(emulator):
+    board, url = emulator
+    fill(board, 0, 256)
+    return board, Recorder(open_card(url))
+
+
+def test_hits(card):
+    board, card = card
+    cache = CachedBlockDevice(card, capacity=16, readahead=4, sequential_threshold=8)
+    assert cache.read(5, 3) == expected(5, 3)
+    assert cache.read(6, 3) == expected(6, 3)
+    assert card.reads == [(5, 3), (8, 1)]
+    assert cache.stats()["hits"] == 2 and cache.stats()["misses"] == 4
+
+
+def test_readahead(card):
+    board, card = card
+    cache = CachedBlockDevice(card, capacity=64, readahead=16, sequential_threshold=2)
+    for lba in range(3):
+        assert cache.read(lba) == expected(lba, 1)
+    assert card.reads == [(0, 1), (1, 1), (2, 17)]
+    assert cache.readahead_blocks == 16
+    assert cache.read(3, 8) == expected(3, 8)
+    assert card.reads[3:] == []
+
+
+def test_dirty_eviction(card):
+    board, card = card
+    cache = CachedBlockDevice(card, capacity=4, readahead=1, sequential_threshold=8)
+    cache.write(0, b"\xaa"*1024)
+    assert card.writes == []
+    assert cache.read(0) == b"\xaa"*512
+    # the read of three more blocks pushes block 1, the oldest, out
+    cache.read(10, 3)
+    assert card.writes == [(1, 1)]
+    assert board.card.image[512:1024] == b"\xaa"*512
+    assert board.card.image[:512] == expected(0, 1)
+    assert cache.stats()["dirty"] == 1
+
+
+def test_failed_eviction_keeps_block(card):
+    board, card = card
+    cache = CachedBlockDevice(card, capacity=2, readahead=1, sequential_threshold=8)
+    cache.write(0, b"\x55"*512)
+    cache.read(1)
+    card.fail_writes = 1
+    with pytest.raises(SDCardError):
+        cache.read(2)
+    assert cache.stats()["dirty"] == 1
+    assert cache.read(0) == b"\x55"*512
+    cache.flush()
+    assert card.writes == [(0, 1)]
+    assert board.card.image[:512] == b"\x55"*512
+
+
+def test_flush_merges_runs(card):
+    board, card = card
+    cache = CachedBlockDevice(card, capacity=128, readahead=4, sequential_threshold=8)
+    cache.write(3, b"\x01"*3*512)
+    cache.write(8, b"\x02"*2*512)
+    cache.write(7, b"\x03"*512)
+    cache.write(40, b"\x04"*40*512)
+    cache.flush()
+    # runs of contiguous blocks, split at the DMA buffer size
+    assert card.writes == [(3, 3), (7, 3), (40, 32), (72, 8)]
+    assert cache.stats()["dirty"] == 0
+    assert board.card.image[3*512:10*512] == b"\x01"*3*512 + expected(6, 1) + b"\x03"*512 + b"\x02"*2*512
+    assert board.card.image[40*512:80*512] == b"\x04"*40*512
+    cache.flush()
+    assert len(card.writes) == 4
@@ -0,0 +1,155 @@
+"""SDCard against board_emulator.py over socket://."""
+import pytest
+
+from board_emulator import DATA, TRAN
+from sdcard_host.card import SCR_CMD23, SDCard, parse_csd, parse_scr, parse_switch_status
+from sdcard_host.sd_defines import CONTROLLER_4BIT
+from sdcard_host.comm_uart import CommUART
+from sdcard_host.sdc import SDController
+
+
+def open_card(url, negotiate=True, **kwargs):
+    kwargs.setdefault("dma_size", 0x4000)
+    card = SDCard(SDController(CommUART(url)), 100e6, **kwargs)
+    card.init(negotiate=negotiate)
+    return card
+
+
+def fill(board, lba, count):
+    for i in range(count):
+        start = (lba + i)*512
+        board.card.image[start:start + 512] = (lba + i).to_bytes(4, "big")*128
+
+
+def expected(lba, count):
+    return b"".join((lba + i).to_bytes(4, "big")*128 for i in range(count))
+
+
+def test_read_blocks(emulator):
+    board, url = emulator
+    fill(board, 10, 40)
+    card = open_card(url, auto_stop=False)
+    windows = list(card.read_blocks(10, 40))
+    assert [len(window) for window in windows] == [16*512, 16*512, 8*512]
+    assert b"".join(bytes(window) for window in windows) == expected(10, 40)
+    assert board.card.state == TRAN
+
+
+@pytest.mark.parametrize("auto_stop", [False, True])
+def test_read_blocks_stopped_early(emulator, auto_stop):
+    board, url = emulator
+    fill(board, 0, 64)
+    card = open_card(url, auto_stop=auto_stop)
+    blocks = card.read_blocks(0, 64)
+    assert bytes(next(blocks)) == expected(0, 16)
+    # the CMD18 of the second window is running now
+    assert board.card.state == (TRAN if auto_stop else DATA)
+    blocks.close()
+    assert board.card.state == TRAN
+    assert card.read(20, 2) == expected(20, 2)
+
+
+def test_read_blocks_consumer_error(emulator):
+    board, url = emulator
+    card = open_card(url, auto_stop=False)
+    with pytest.raises(KeyError):
+        for _ in card.read_blocks(0, 64):
+            raise KeyError
+    assert board.card.state == TRAN
+
+
+def r2(value):
+    return [(value >> shift) & 0xffffffff for shift in (96, 64, 32, 0)]
+
+
+def test_identification(emulator):
+    board, url = emulator
+    card = open_card(url)
+    assert card.version == 2 and card.high_capacity
+    assert card.rca == 0x1234
+    assert card.cid == {"mid": 0x03, "oid": "SD", "pnm": "SD32G", "prv": "8.0",
+                        "psn": 0x12345678, "mdt": "2018/03"}
+    assert card.csd == {"version": 2, "tran_speed": 25000000, "ccc": 0x5b5, "read_bl_len": 512,
+                        "capacity": 1 << 20, "c_size": 1}
+    assert card.nblocks == 2048
+    assert card.scr == {"version": 0, "sd_spec": 2, "bus_widths": [1, 4], "sd_spec3": 1,
+                        "cmd_support": SCR_CMD23}
+
+
+def test_parse_csd_v1():
+    # 2 GB standard capacity card: (4095 + 1)*2^(7 + 2) blocks of 1024 bytes
+    csd = (0x32 << 96) | (0x1f5 << 84) | (10 << 80) | (4095 << 62) | (7 << 47)
+    assert parse_csd(r2(csd)) == {"version": 1, "tran_speed": 25000000, "ccc": 0x1f5,
+                                  "read_bl_len": 1024, "capacity": 2 << 30, "c_size": 4095}
+    # TRAN_SPEED 0x5a: 10 Mbit/s x 5.0
+    assert parse_csd(r2(0x5a << 96))["tran_speed"] == 50000000
+
+
+def test_parse_scr():
+    assert parse_scr(bytes.fromhex("0135000000000000")) == {
+        "version": 0, "sd_spec": 1, "bus_widths": [1, 4], "sd_spec3": 0, "cmd_support": 0}
+    assert parse_scr(bytes.fromhex("0201800300000000"))["bus_widths"] == [1]
+    assert parse_scr(bytes.fromhex("0201800300000000"))["cmd_support"] == 3
+
+
+def test_parse_switch_status():
+    status = bytearray(64)
+    status[0:2] = (200).to_bytes(2, "big")
+    status[12:14] = (0x8003).to_bytes(2, "big")
+    status[16] = 0x01
+    assert parse_switch_status(status) == {"max_current": 200, "group1_support": 0x8003,
+                                           "group1_function": 1}
+    # the function is the low nibble of byte 16, the high one is group 2
+    status[16] = 0xf0
+    assert parse_switch_status(status)["group1_function"] == 0
+
+
+def test_negotiate(emulator):
+    board, url = emulator
+    card = open_card(url)
+    assert (card.bus_width, card.high_speed, card.clock) == (4, True, 50e6)
+    assert board.regs["controller"] >> CONTROLLER_4BIT & 1
+    assert board.regs["clock_d"] == 0
+    assert board.card.high_speed
+    fill(board, 0, 4)
+    assert card.read(0, 4) == expected(0, 4)
+
+
+def test_negotiate_limits(emulator):
+    board, url = emulator
+    card = open_card(url, negotiate=False)
+    assert (card.bus_width, card.high_speed, card.clock) == (1, False, 25e6)
+    assert card.negotiate(bus_width=1, high_speed=False, max_clock=10e6) == 10e6
+    assert card.bus_width == 1
+    assert not board.regs["controller"] >> CONTROLLER_4BIT & 1
+    assert board.regs["clock_d"] == 4
+    assert not board.card.high_speed
+
+
+def test_negotiate_old_card(emulator):
+    board, url = emulator
+    # SD 1.0, 1-bit only: no ACMD6, no CMD6
+    board.card.scr = 0x0001 << 48
+    card = open_card(url)
+    assert (card.bus_width, card.high_speed, card.clock) == (1, False, 25e6)
+    assert not board.card.high_speed
+
+
+def test_negotiate_no_high_speed(emulator):
+    board, url = emulator
+    command = board.card.command
+
+    def no_high_speed(index, arg):
+        app = board.card.app
+        response = command(index, arg)
+        if index == 6 and not app:
+            # only the default function in group 1
+            status = bytearray(board.card.transfer[1])
+            status[12:14] = (0x8001).to_bytes(2, "big")
+            status[16] = 0x0f
+            board.card.transfer = ("read", bytes(status))
+        return response
+    board.card.command = no_high_speed
+    card = open_card(url)
+    assert (card.bus_width, card.high_speed, card.clock) == (4, False, 25e6)
+    assert not board.card.high_speed
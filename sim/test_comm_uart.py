@@ -0,0 +1,130 @@
+"""CommUART against board_emulator.py over socket://."""
+import struct
+import sys
+from array import array
+
+import pytest
+
+from sdcard_host.comm_uart import CommUART
+from sdcard_host.sd_defines import SUPPLY_VOLTAGE_mV, registers
+
+
+RAM = 0x40000000
+
+
+def open_comm(url, **kwargs):
+    """A CommUART counting its round trips in transfers."""
+    comm = CommUART(url, **kwargs)
+    comm.transfers = 0
+
+    def transfer(tx, rx, transfer=comm._transfer):
+        comm.transfers += 1
+        return transfer(tx, rx)
+    comm._transfer = transfer
+    return comm
+
+
+def frames(board):
+    """The (type, length, address) of every bridge frame the board
+    gets from now on."""
+    received = []
+
+    def feed(data, feed=board.feed):
+        received.append(bytes(data))
+        return feed(data)
+    board.feed = feed
+
+    def decode():
+        data = b"".join(received)
+        headers = []
+        pos = 0
+        while pos < len(data):
+            msg, length, addr = struct.unpack_from(">BBI", data, pos)
+            headers.append((msg, length, 4*addr))
+            pos += 6 + (4*length if msg == 0x01 else 0)
+        return headers
+    return decode
+
+
+def test_submit_flush(emulator):
+    board, url = emulator
+    comm = open_comm(url)
+    comm.submit_write(RAM, 0x12345678)
+    comm.submit_write(RAM + 4, [1, 2, 3])
+    comm.submit_read(RAM)
+    comm.submit_read(RAM + 4, 3)
+    comm.submit_read(board.base + registers["voltage"])
+    assert comm.transfers == 0
+    assert comm.flush() == [0x12345678, [1, 2, 3], SUPPLY_VOLTAGE_mV]
+    assert comm.transfers == 1
+    assert comm.flush() == []
+    assert comm.transfers == 1
+
+
+def test_batch(emulator):
+    board, url = emulator
+    comm = open_comm(url)
+    with comm.batch() as outer:
+        comm.write(RAM, [5, 6])
+        assert comm.read(RAM) is None
+        with comm.batch() as inner:
+            comm.read(RAM + 4)
+            comm.read(RAM, 2)
+        assert inner == []
+        comm.read(RAM + 4)
+    assert comm.transfers == 1
+    assert outer == [5, 6, [5, 6], 6]
+    assert inner == [6, [5, 6]]
+
+
+def test_batch_exception(emulator):
+    board, url = emulator
+    comm = open_comm(url)
+    comm.write(RAM, 1)
+    with pytest.raises(KeyError):
+        with comm.batch():
+            comm.write(RAM, 2)
+            comm.read(RAM)
+            with comm.batch():
+                comm.read(RAM, 2)
+                raise KeyError
+    # nothing of the batch went out, or is left for the next flush
+    assert comm.transfers == 1
+    assert comm.read(RAM) == 1
+    with comm.batch() as values:
+        comm.read(RAM)
+    assert values == [1]
+    assert comm.transfers == 3
+
+
+def test_block_bursts(emulator):
+    board, url = emulator
+    comm = CommUART(url)
+    data = bytes(i & 0xff for i in range(4*600))
+    sent = frames(board)
+    comm.write_block(RAM, data)
+    assert bytes(comm.read_block(RAM, 600)) == data
+    assert sent() == [(0x01, 255, RAM), (0x01, 255, RAM + 4*255), (0x01, 90, RAM + 4*510),
+                      (0x02, 255, RAM), (0x02, 255, RAM + 4*255), (0x02, 90, RAM + 4*510)]
+    assert board.ram[:4*600] == data
+
+
+def test_block_words(emulator):
+    board, url = emulator
+    comm = CommUART(url)
+    words = array("I", [0x01020304, 0xa0b0c0d0])
+    comm.write_block(RAM, words)
+    # big-endian on the wire whatever the host byte order, words unchanged
+    assert bytes(comm.read_block(RAM, 2)) == bytes.fromhex("01020304a0b0c0d0")
+    assert list(words) == [0x01020304, 0xa0b0c0d0]
+    values = array("I", bytes(comm.read_block(RAM, 2)))
+    if sys.byteorder == "little":
+        values.byteswap()
+    assert list(values) == [0x01020304, 0xa0b0c0d0]
+    # bytes and array("B") go out as they are
+    comm.write_block(RAM, array("B", [9, 8, 7, 6]))
+    assert comm.read(RAM) == 0x09080706
+    with pytest.raises(TypeError):
+        comm.write_block(RAM, array("H", [1, 2]))
+    with pytest.raises(ValueError):
+        comm.write_block(RAM, b"\x01\x02")
@@ -0,0 +1,84 @@
+"""sdcard_host.crc against the SD spec's examples and a bit-serial
+model of verilog/sd_crc_7.v and sd_crc_16.v."""
+import random
+
+import pytest
+
+from sdcard_host import crc
+
+
+def serial_crc7(bits):
+    value = 0
+    for bit in bits:
+        inv = bit ^ (value >> 6)
+        value = ((value << 1) & 0x7f) ^ (0x09 if inv else 0)
+    return value
+
+
+def serial_crc16(bits):
+    value = 0
+    for bit in bits:
+        inv = bit ^ (value >> 15)
+        value = ((value << 1) & 0xffff) ^ (0x1021 if inv else 0)
+    return value
+
+
+def bits(data):
+    return [(byte >> i) & 1 for byte in data for i in range(7, -1, -1)]
+
+
+def serial_crc16_4bit(data):
+    nibbles = [nibble for byte in data for nibble in (byte >> 4, byte & 0xf)]
+    return tuple(serial_crc16([(nibble >> lane) & 1 for nibble in nibbles]) for lane in range(4))
+
+
+@pytest.mark.parametrize("index, arg, frame", [
+    (0, 0, "400000000095"),
+    (8, 0x1aa, "48000001aa87"),
+    (17, 0, "510000000055"),
+])
+def test_command_frame(index, arg, frame):
+    assert crc.command_frame(index, arg).hex() == frame
+
+
+def test_crc7():
+    # R1 of CMD17 in the spec
+    assert crc.crc7(bytes.fromhex("1100000900")) == 0x33
+    data = bytes(random.Random(7).getrandbits(8) for _ in range(15))
+    assert crc.crc7(data) == serial_crc7(bits(data))
+    assert crc.crc7(data[5:], crc.crc7(data[:5])) == crc.crc7(data)
+
+
+def test_crc16():
+    assert crc.crc16(b"\xff"*512) == 0x7fa1
+    data = bytes(random.Random(16).getrandbits(8) for _ in range(64))
+    assert crc.crc16(data) == serial_crc16(bits(data))
+
+
+def test_crc16_4bit():
+    assert crc.crc16_4bit(b"\xff"*512) == (0xeda9,)*4
+    assert crc.crc_nibbles((0xeda9,)*4) == [0xf*((0xeda9 >> i) & 1) for i in range(15, -1, -1)]
+    rng = random.Random(4)
+    for length in (512, 8, 7, 6, 5, 1):
+        data = bytes(rng.getrandbits(8) for _ in range(length))
+        assert crc.crc16_4bit(data) == serial_crc16_4bit(data)
+
+
+def test_crc16_4bit_blocks():
+    data = bytes(random.Random(512).getrandbits(8) for _ in range(4*512))
+    assert crc.crc16_4bit_blocks(data) == [crc.crc16_4bit(data[i:i + 512]) for i in range(0, len(data), 512)]
+    with pytest.raises(ValueError):
+        crc.crc16_4bit_blocks(data[:-4])
+
+
+def test_crc16_4bit_blocks_numpy(monkeypatch):
+    pytest.importorskip("numpy")
+    rng = random.Random(128)
+    for block_size in (512, 64):
+        data = bytes(rng.getrandbits(8) for _ in range(crc.NUMPY_MIN_BLOCKS*block_size))
+        data = data[:-block_size] + b"\xff"*block_size
+        result = crc.crc16_4bit_blocks(data, block_size)
+        with monkeypatch.context() as m:
+            m.setattr(crc, "numpy", None)
+            assert crc.crc16_4bit_blocks(data, block_size) == result
+        assert result[-1] == serial_crc16_4bit(b"\xff"*block_size)
@@ -0,0 +1,53 @@
+"""image.dump()/restore() against board_emulator.py."""
+import os
+
+import pytest
+
+from sdcard_host import image
+from sdcard_host.card import SDCardError
+from test_card import expected, fill, open_card
+
+
+def test_dump_restore(emulator, tmp_path):
+    board, url = emulator
+    fill(board, 0, 100)
+    card = open_card(url)
+    path = str(tmp_path/"card.img")
+    image.dump(card, path, 0, 100, sparse=True)
+    with open(path, "rb") as f:
+        assert f.read() == expected(0, 100)
+    assert not os.path.exists(path + ".ckpt")
+
+    board.card.image[:100*512] = bytes(100*512)
+    image.restore(card, path, 0)
+    assert board.card.image[:100*512] == expected(0, 100)
+
+
+def test_dump_resume(emulator, tmp_path):
+    board, url = emulator
+    fill(board, 0, 64)
+    card = open_card(url)
+    path = str(tmp_path/"card.img")
+    with open(path + ".ckpt", "w") as f:
+        f.write('{"job": {"op": "dump", "start": 0, "count": 64}, "done": 40}')
+    with open(path, "wb") as f:
+        f.write(bytes(64*512))
+    image.dump(card, path, 0, 64)
+    with open(path, "rb") as f:
+        data = f.read()
+    # only the missing range was read
+    assert data[:40*512] == bytes(40*512)
+    assert data[40*512:] == expected(40, 24)
+
+
+def test_restore_error(emulator, tmp_path):
+    board, url = emulator
+    card = open_card(url)
+    path = str(tmp_path/"card.img")
+    with open(path, "wb") as f:
+        f.write(bytes(64*512))
+    # the write of the second DMA buffer is refused
+    card.write = lambda lba, data, write=card.write: (
+        write(lba, data) if lba < 32 else write(board.card.nblocks, data))
+    with pytest.raises(SDCardError):
+        image.restore(card, path, 0)
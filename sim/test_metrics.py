@@ -0,0 +1,111 @@
+"""TransportMetrics, on a CommUART to board_emulator.py and fed directly."""
+import json
+
+from sdcard_host.card import SDCard
+from sdcard_host.comm_uart import CommUART
+from sdcard_host.metrics import TransportMetrics
+from sdcard_host.queue import QUEUE_WAIT_DATA
+from sdcard_host.sd_defines import registers
+from sdcard_host.sdc import SDController, command
+from test_card import expected, fill
+
+
+QUEUE_COMMAND = 0xe0003000
+QUEUE_ARGUMENT = 0xe0003004
+
+
+def card_metrics(url, **kwargs):
+    metrics = TransportMetrics()
+    card = SDCard(SDController(CommUART(url, metrics=metrics)), 100e6, dma_size=0x4000, **kwargs)
+    card.init()
+    return card, metrics
+
+
+def test_auto_stop(emulator):
+    board, url = emulator
+    fill(board, 0, 8)
+    card, metrics = card_metrics(url)
+    assert card.read(0, 4) == expected(0, 4)
+    assert card.read(4, 1) == expected(4, 1)
+    auto = [cmd for cmd in metrics.commands if cmd.startswith("CMD18 (auto ")]
+    assert len(auto) == 1 and metrics.commands[auto[0]] == 1
+    assert sum(metrics.auto_cmds.values()) == 1
+    assert metrics.commands["CMD17"] == 1
+    assert "CMD18" not in metrics.commands
+    assert metrics.commands["ACMD41"] >= 1
+    assert metrics.by_cmd[auto[0]].count > 1
+
+
+def test_host_stop(emulator):
+    board, url = emulator
+    card, metrics = card_metrics(url, auto_stop=False)
+    card.read(0, 4)
+    assert metrics.commands["CMD18"] == 1
+    assert metrics.commands["CMD12"] == 1
+    assert metrics.auto_cmds == {"CMD12": 0, "CMD23": 0}
+
+
+def test_queue_entries():
+    metrics = TransportMetrics()
+    metrics.watch_queue(QUEUE_COMMAND)
+    ops = []
+    for index, arg in ((55, 0x10000), (6, 2), (18, 0)):
+        value = command(index, auto_cmd12=int(index == 18)) | (1 << QUEUE_WAIT_DATA)
+        ops += [("write", QUEUE_COMMAND, value), ("write", QUEUE_ARGUMENT, arg)]
+    metrics.record(0.0, 0.002, 60, 0, ops)
+    metrics.record(0.0, 0.001, 6, 4, [("read", QUEUE_COMMAND + 8, None)])
+    cmd = "CMD55+ACMD6+CMD18 (auto CMD12)"
+    assert list(metrics.by_cmd) == [cmd]
+    assert metrics.by_cmd[cmd].count == 2
+    assert metrics.bytes[cmd] == (66, 4)
+    assert metrics.commands == {"CMD55": 1, "ACMD6": 1, "CMD18 (auto CMD12)": 1}
+    assert metrics.auto_cmds == {"CMD12": 1, "CMD23": 0}
+    # the queue isn't the controller's command register
+    assert metrics.register(QUEUE_COMMAND) == "other"
+
+
+def test_as_dict():
+    metrics = TransportMetrics(buckets=(1e-3, 10e-3))
+    command_addr = metrics.base + registers["command"]
+    metrics.record(0.0, 0.0005, 10, 0, [("write", command_addr, command(8))])
+    metrics.record(1.0, 0.005, 6, 4, [("read", metrics.base + registers["cmd_isr"], None)])
+    metrics.record(2.0, 0.05, 6, 4, [("read", metrics.base + registers["cmd_isr"], None)])
+    d = json.loads(json.dumps(metrics.as_dict(records=True)))
+    cmd8 = d["by_cmd"]["CMD8"]
+    assert cmd8["count"] == 3
+    assert cmd8["buckets"] == {"0.001": 1, "0.01": 1, "+Inf": 1}
+    assert (cmd8["tx_bytes"], cmd8["rx_bytes"]) == (22, 8)
+    assert cmd8["min"] == 0.0005 and cmd8["max"] == 0.05
+    assert cmd8["p50"] == 0.01
+    assert d["commands"] == {"CMD8": 1}
+    assert d["auto_cmds"] == {"CMD12": 0, "CMD23": 0}
+    assert d["by_register"]["read cmd_isr"]["count"] == 2
+    assert d["by_register"]["write command"]["count"] == 1
+    assert [r["cmd"] for r in d["records"]] == ["CMD8"]*3
+    assert d["records"][1]["accesses"] == [["read", "cmd_isr"]]
+    assert "records" not in metrics.as_dict()
+
+
+def test_prometheus():
+    metrics = TransportMetrics(buckets=(1e-3, 10e-3))
+    command_addr = metrics.base + registers["command"]
+    metrics.record(0.0, 0.0005, 10, 0, [("write", command_addr, command(25, auto_cmd23=1))])
+    metrics.record(1.0, 0.005, 6, 4, [("read", metrics.base + registers["data_isr"], None)])
+    lines = metrics.prometheus("sd").splitlines()
+    samples = dict(line.rsplit(" ", 1) for line in lines if not line.startswith("#"))
+    cmd = 'cmd="CMD25 (auto CMD23)"'
+    assert samples['sd_transaction_seconds_bucket{' + cmd + ',le="0.001"}'] == "1"
+    assert samples['sd_transaction_seconds_bucket{' + cmd + ',le="0.01"}'] == "2"
+    assert samples['sd_transaction_seconds_bucket{' + cmd + ',le="+Inf"}'] == "2"
+    assert samples['sd_transaction_seconds_count{' + cmd + '}'] == "2"
+    assert float(samples['sd_transaction_seconds_sum{' + cmd + '}']) == 0.0055
+    assert samples['sd_register_transaction_seconds_count{op="read",register="data_isr"}'] == "1"
+    assert samples['sd_commands_total{' + cmd + '}'] == "1"
+    assert samples['sd_auto_commands_total{cmd="CMD23"}'] == "1"
+    assert samples['sd_auto_commands_total{cmd="CMD12"}'] == "0"
+    assert samples['sd_tx_bytes_total{' + cmd + '}'] == "16"
+    assert samples['sd_rx_bytes_total{' + cmd + '}'] == "4"
+    for name in ("transaction_seconds", "register_transaction_seconds"):
+        assert "# TYPE sd_{} histogram".format(name) in lines
+    for name in ("commands_total", "auto_commands_total", "tx_bytes_total", "rx_bytes_total"):
+        assert "# TYPE sd_{} counter".format(name) in lines
@@ -0,0 +1,77 @@
+"""SDController status polling against board_emulator.py."""
+import time
+import types
+
+import pytest
+
+from sdcard_host import sdc as sdc_module
+from sdcard_host.comm_uart import CommUART
+from sdcard_host.sd_defines import CmdInt, DataInt
+from sdcard_host.sdc import SDController, SDCTimeout, command
+from test_card import open_card
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    """The intervals SDController sleeps for."""
+    sleeps = []
+
+    def sleep(seconds):
+        sleeps.append(seconds)
+        time.sleep(seconds)
+    monkeypatch.setattr(sdc_module, "time", types.SimpleNamespace(monotonic=time.monotonic, sleep=sleep))
+    return sleeps
+
+
+def controller(url):
+    return SDController(CommUART(url), poll_interval=0.001, poll_backoff=2, poll_max_interval=0.008)
+
+
+def test_wait_cmd_done(emulators, sleeps):
+    board, url = emulators(cmd_latency=0.05)
+    sdc = controller(url)
+    sdc.send_command(command(8, wait_resp=1), 0x1aa)
+    assert sdc.wait_cmd_done() == CmdInt.CC
+    assert sleeps[:4] == [0.001, 0.002, 0.004, 0.008]
+    assert set(sleeps[4:]) <= {0.008}
+    assert sdc.read("resp0") == 0x1aa
+    # cleared once read
+    assert sdc.read("cmd_isr") == 0
+
+
+def test_wait_no_clear(emulator, sleeps):
+    board, url = emulator
+    sdc = controller(url)
+    sdc.send_command(command(8, wait_resp=1), 0x1aa)
+    assert sdc.wait_cmd_done(clear=False) == CmdInt.CC
+    assert sleeps == []
+    assert sdc.read("cmd_isr") == CmdInt.CC
+    # no card answer: the error flags are returned, not raised
+    sdc.send_command(command(5, wait_resp=1))
+    assert sdc.wait_cmd_done() == CmdInt.CTE | CmdInt.EI
+
+
+def test_wait_data_done(emulators, sleeps):
+    board, url = emulators(block_latency=0.01)
+    card = open_card(url)
+    card.sdc.poll_interval, card.sdc.poll_max_interval = 0.001, 0.004
+    del sleeps[:]
+    card.issue(0, 4)
+    assert card.sdc.wait_cmd_done() == CmdInt.CC
+    assert card.sdc.wait_data_done() == DataInt.CC
+    assert sleeps[:3] == [0.001, 0.002, 0.004]
+    assert set(sleeps[3:]) <= {0.004}
+    assert card.sdc.read("data_isr") == 0
+
+
+@pytest.mark.parametrize("wait", ["wait_cmd_done", "wait_data_done"])
+def test_wait_timeout(emulator, sleeps, wait):
+    board, url = emulator
+    sdc = controller(url)
+    start = time.monotonic()
+    with pytest.raises(SDCTimeout):
+        getattr(sdc, wait)(timeout=0.05)
+    assert 0.05 <= time.monotonic() - start < 0.5
+    # the backoff bounds the number of status reads
+    assert sleeps[:4] == [0.001, 0.002, 0.004, 0.008]
+    assert len(sleeps) <= 12
@@ -0,0 +1,54 @@
+"""SlotArray and StripedVolume against a board emulator with one
+BoardEmulator per slot, all behind one link."""
+import pytest
+
+from sdcard_host.comm_uart import CommUART
+from sdcard_host.slots import SlotArray, StripedVolume
+from test_card import expected
+
+
+@pytest.fixture
+def slots(emulators):
+    board, url = emulators(slots=3)
+    slots = SlotArray.open(CommUART(url), 3, 100e6)
+    slots.init()
+    return [board] + board.slots, slots
+
+
+def block(slot, lba):
+    return bytes([slot + 1])*4 + lba.to_bytes(4, "big")*127
+
+
+def test_slot_array(slots):
+    boards, slots = slots
+    # 0x8000 of DMA buffer shared by three slots
+    assert [card.max_blocks for card in slots.cards] == [21]*3
+    slots.write([(i, b"".join(block(i, i + j) for j in range(3))) for i in range(3)])
+    for i, board in enumerate(boards):
+        assert board.card.image[i*512:(i + 3)*512] == b"".join(block(i, i + j) for j in range(3))
+    data = slots.read([(0, 3), None, (2, 21)])
+    assert data[0] == b"".join(block(0, j) for j in range(3))
+    assert data[1] is None
+    assert data[2][:3*512] == b"".join(block(2, 2 + j) for j in range(3))
+    with pytest.raises(ValueError):
+        slots.read([(0, 1)])
+
+
+def test_striping(slots):
+    boards, slots = slots
+    volume = StripedVolume(slots, stripe_blocks=4)
+    assert volume.max_blocks == 60
+    assert volume.nblocks == 3*2048
+    volume.write(0, expected(0, 150))
+    # logical stripe s is stripe s//3 of slot s % 3
+    for lba in range(150):
+        stripe, within = divmod(lba, 4)
+        slot_lba = stripe//3*4 + within
+        image = boards[stripe % 3].card.image
+        assert image[slot_lba*512:(slot_lba + 1)*512] == expected(lba, 1), lba
+    assert volume.read(0, 150) == expected(0, 150)
+    # unaligned, across rounds of slot transfers
+    assert volume.read(57, 70) == expected(57, 70)
+    assert [len(data) for data in volume.read_blocks(57, 70)] == [3*512, 60*512, 7*512]
+    with pytest.raises(ValueError):
+        volume.read(volume.nblocks - 1, 2)
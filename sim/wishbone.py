@@ -0,0 +1,145 @@
+"""Wishbone bus functional models for the cocotb testbench.
+
+Both sides work on the falling edge of clk: the RTL only changes its
+outputs on the rising edge, so signals sampled there are stable.
+"""
+import cocotb
+from cocotb.triggers import FallingEdge
+
+
+class WishboneMaster:
+    """Classic cycles on the controller's register port."""
+    def __init__(self, dut, prefix="wb_"):
+        self.clk = dut.clk
+        self.adr = getattr(dut, prefix + "adr")
+        self.dat_w = getattr(dut, prefix + "dat_w")
+        self.dat_r = getattr(dut, prefix + "dat_r")
+        self.sel = getattr(dut, prefix + "sel")
+        self.we = getattr(dut, prefix + "we")
+        self.cyc = getattr(dut, prefix + "cyc")
+        self.stb = getattr(dut, prefix + "stb")
+        self.ack = getattr(dut, prefix + "ack")
+        self.cyc.value = 0
+        self.stb.value = 0
+        self.we.value = 0
+        self.adr.value = 0
+        self.dat_w.value = 0
+        self.sel.value = 0
+
+    async def _cycle(self, addr, we, value=0):
+        await FallingEdge(self.clk)
+        self.adr.value = addr
+        self.dat_w.value = value
+        self.sel.value = 0xf
+        self.we.value = we
+        self.cyc.value = 1
+        self.stb.value = 1
+        while True:
+            await FallingEdge(self.clk)
+            if self.ack.value.binstr == "1":
+                break
+        data = int(self.dat_r.value)
+        self.cyc.value = 0
+        self.stb.value = 0
+        self.we.value = 0
+        return data
+
+    async def read(self, addr):
+        return await self._cycle(addr, 0)
+
+    async def write(self, addr, value):
+        await self._cycle(addr, 1, value)
+
+
+class WishboneMemory:
+    """Word memory answering the controller's DMA master port.
+
+    latency is the number of wait states added to each access (or each
+    burst), grant_latency the cycles lost in the interconnect arbiter
+    when the master raises cyc. Incrementing bursts (CTI 010) are acked every cycle. The
+    counters give the bus cycles spent in and between DMA accesses.
+    """
+    def __init__(self, dut, base=0x40000000, size=0x8000, latency=0, grant_latency=1,
+                 prefix="m_wb_"):
+        self.clk = dut.clk
+        self.adr = getattr(dut, prefix + "adr")
+        self.dat_w = getattr(dut, prefix + "dat_w")
+        self.dat_r = getattr(dut, prefix + "dat_r")
+        self.sel = getattr(dut, prefix + "sel")
+        self.we = getattr(dut, prefix + "we")
+        self.cyc = getattr(dut, prefix + "cyc")
+        self.stb = getattr(dut, prefix + "stb")
+        self.ack = getattr(dut, prefix + "ack")
+        self.cti = getattr(dut, prefix + "cti")
+        self.base = base
+        self.size = size
+        self.latency = latency
+        self.grant_latency = grant_latency
+        self.mem = bytearray(size)
+        self.reads = 0
+        self.writes = 0
+        self.cyc_cycles = 0
+        self.wait_cycles = 0
+        self.ack.value = 0
+        self.dat_r.value = 0
+
+    def start(self):
+        return cocotb.start_soon(self._run())
+
+    def load(self, addr, data):
+        offset = addr - self.base
+        self.mem[offset:offset + len(data)] = data
+
+    def dump(self, addr, length):
+        offset = addr - self.base
+        return bytes(self.mem[offset:offset + length])
+
+    def _offset(self):
+        offset = (int(self.adr.value) & ~3) - self.base
+        if not 0 <= offset < self.size:
+            raise ValueError("DMA access outside the memory: {:08x}".format(int(self.adr.value)))
+        return offset
+
+    def _access(self):
+        offset = self._offset()
+        if self.we.value.binstr == "1":
+            word = int(self.dat_w.value).to_bytes(4, "big")
+            sel = int(self.sel.value)
+            for i in range(4):
+                if sel & (8 >> i):
+                    self.mem[offset + i] = word[i]
+            self.writes += 1
+        else:
+            self.dat_r.value = int.from_bytes(self.mem[offset:offset + 4], "big")
+            self.reads += 1
+
+    async def _run(self):
+        ack = False
+        burst = False
+        cycles = 0
+        wait = self.latency
+        while True:
+            await FallingEdge(self.clk)
+            cyc = self.cyc.value.binstr == "1"
+            active = cyc and self.stb.value.binstr == "1"
+            cycles = cycles + 1 if cyc else 0
+            self.cyc_cycles += cyc
+            # like a registered slave (LiteX SRAM) behind the arbiter, the
+            # first ack comes 1 + grant_latency cycles after cyc and the
+            # following ones a cycle after the previous ack. The master
+            # holds the transfer until it sees ack, so it is performed
+            # when ack is raised.
+            if active and (burst or not ack):
+                if not burst and (cycles <= 1 + self.grant_latency or wait):
+                    if cycles > 1 + self.grant_latency:
+                        wait -= 1
+                        self.wait_cycles += 1
+                    ack = False
+                else:
+                    self._access()
+                    ack = True
+                    burst = int(self.cti.value) == 0b010
+                    wait = self.latency
+            else:
+                ack = burst = False
+            self.ack.value = int(ack)
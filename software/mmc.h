@@ -46,6 +46,8 @@
 #define MMC_MODE_8BIT		0x200
 #define MMC_MODE_SPI		0x400
 #define MMC_MODE_HC		0x800
+/* the host stops multiple block reads itself (CMD12) */
+#define MMC_MODE_AUTO_CMD12	0x1000
 
 #define MMC_MODE_MASK_WIDTH_BITS (MMC_MODE_4BIT | MMC_MODE_8BIT)
 #define MMC_MODE_WIDTH_BITS_SHIFT 8
@@ -67,6 +67,7 @@
 #define OCSDC_DAT_INT_ENABLE     0x40
 #define OCSDC_BLOCK_SIZE         0x44
 #define OCSDC_BLOCK_COUNT        0x48
+#define OCSDC_FIFO_STATUS        0x4C
 #define OCSDC_DST_SRC_ADDR       0x60
 
 // OCSDC_CMD_INT_STATUS bits
@@ -81,6 +82,29 @@
 #define SDCMSC_DAT_INT_STATUS_CRC 0x02
 #define SDCMSC_DAT_INT_STATUS_OV  0x04
 
+// OCSDC_FIFO_STATUS bits, [11:8]/[15:12] hold log2 of the RX/TX FIFO depths
+#define OCSDC_FIFO_STATUS_RX_OVERRUN  0x0001
+#define OCSDC_FIFO_STATUS_TX_UNDERRUN 0x0002
+
+// OCSDC_CONTROL bits
+#define OCSDC_CONTROL_4BIT   0x0001
+#define OCSDC_CONTROL_STREAM 0x0002
+#define OCSDC_CONTROL_DESC   0x0004
+
+/* command register auto commands */
+#define OCSDC_COMMAND_AUTO_CMD12 0x4000
+#define OCSDC_COMMAND_AUTO_CMD23 0x8000
+
+// DMA descriptor (OCSDC_CONTROL_DESC), OCSDC_DST_SRC_ADDR points to the first
+struct ocsdc_desc {
+	uint32_t buf;
+	uint32_t blocks;	// [15:0] blocks, OCSDC_DESC_LAST
+	uint32_t next;
+	uint32_t status;	// OCSDC_DESC_DONE | blocks, written by the controller
+};
+#define OCSDC_DESC_LAST 0x80000000
+#define OCSDC_DESC_DONE 0x80000000
+
 struct ocsdc {
 	int iobase;
 	int clk_freq;
@@ -212,7 +236,7 @@ static inline void ocsdc_write(struct ocsdc *dev, int offset, uint32_t data)
 
 static void ocsdc_set_buswidth(struct ocsdc * dev, uint width) {
 	if (width == 4)
-		ocsdc_write(dev, OCSDC_CONTROL, 1);
+		ocsdc_write(dev, OCSDC_CONTROL, OCSDC_CONTROL_4BIT);
 	else if (width == 1)
 		ocsdc_write(dev, OCSDC_CONTROL, 0);
 }
@@ -325,6 +349,8 @@ static int ocsdc_send_cmd(struct mmc *mmc, struct mmc_cmd *cmd, struct mmc_data
 			command |= (1 << 5);
 		if (data->flags & MMC_DATA_WRITE)
 			command |= (1 << 6);
+		if (data->blocks > 1 && (mmc->host_caps & MMC_MODE_AUTO_CMD12))
+			command |= OCSDC_COMMAND_AUTO_CMD12;
 		ocsdc_setup_data_xfer(dev, cmd, data);
 	}
 
@@ -402,7 +428,7 @@ struct mmc * ocsdc_mmc_init(int base_addr, int clk_freq)
 	mmc->f_min = priv->clk_freq/6; /*maximum clock division 64 */
 	mmc->f_max = priv->clk_freq/2; /*minimum clock division 2 */
 	mmc->voltages = MMC_VDD_32_33 | MMC_VDD_33_34;
-	mmc->host_caps = MMC_MODE_4BIT;//MMC_MODE_HS | MMC_MODE_HS_52MHz | MMC_MODE_4BIT;
+	mmc->host_caps = MMC_MODE_4BIT | MMC_MODE_AUTO_CMD12;//MMC_MODE_HS | MMC_MODE_HS_52MHz | MMC_MODE_4BIT;
 
 	mmc->b_max = 256;
 
@@ -92,6 +92,9 @@ rd_level	indicates the FIFO level:
 		2'b10	50-75%	 empty
 		2'b11	%75-100% empty
 
+wr_count	words in the FIFO as seen from the write side (wr_clk)
+rd_count	words in the FIFO as seen from the read side (rd_clk)
+
 Status Timing
 -------------
 All status outputs are registered. They are asserted immediately
@@ -121,7 +124,8 @@ empty will place the FIFO in an undefined state.
 
 
 module generic_fifo_dc_gray(	rd_clk, wr_clk, rst, clr, din, we,
-		dout, re, full, empty, wr_level, rd_level );
+		dout, re, full, empty, wr_level, rd_level,
+		wr_count, rd_count );
 
 parameter dw=16;
 parameter aw=8;
@@ -135,6 +139,8 @@ output			full;
 output			empty;
 output	[1:0]		wr_level;
 output	[1:0]		rd_level;
+output	[aw:0]		wr_count;
+output	[aw:0]		rd_count;
 
 ////////////////////////////////////////////////////////////////////
 //
@@ -305,6 +311,18 @@ always @(posedge rd_clk)	d2 <= rp_bin[aw-1:0] + wp_bin_xr[aw-1:0];
 always @(posedge rd_clk)	full_rc <= full;
 always @(posedge rd_clk)	rd_level <= full_rc ? 2'h0 : {d2[aw-1] | empty, d2[aw-2] | empty};
 
+////////////////////////////////////////////////////////////////////
+//
+// Word Counts
+//
+// Exact for the own side's accesses, the other side's pointer lags by
+// the synchronizer, so wr_count never under- and rd_count never
+// over-estimates the words in the fifo
+//
+
+assign wr_count = wp_bin - rp_bin_x;
+assign rd_count = wp_bin_x - rp_bin;
+
 ////////////////////////////////////////////////////////////////////
 //
 // Sanity Check
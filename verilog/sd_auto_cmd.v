@@ -0,0 +1,200 @@
+//////////////////////////////////////////////////////////////////////
+////                                                              ////
+//// WISHBONE SD Card Controller IP Core                          ////
+////                                                              ////
+//// sd_auto_cmd.v                                                ////
+////                                                              ////
+//// This file is part of the WISHBONE SD Card                    ////
+//// Controller IP Core project                                   ////
+//// http://opencores.org/project,sd_card_controller              ////
+////                                                              ////
+//// Description                                                  ////
+//// Sends CMD23 (SET_BLOCK_COUNT) before or CMD12                ////
+//// (STOP_TRANSMISSION) after a data command on its own, as      ////
+//// selected by the command register, and holds the interrupt    ////
+//// status back until the whole sequence is done                 ////
+////                                                              ////
+//////////////////////////////////////////////////////////////////////
+////                                                              ////
+//// Copyright (C) 2013 Authors                                   ////
+////                                                              ////
+//// This source file may be used and distributed without         ////
+//// restriction provided that this copyright statement is not    ////
+//// removed from the file and that any derivative work contains  ////
+//// the original copyright notice and the associated disclaimer. ////
+////                                                              ////
+//// This source file is free software; you can redistribute it   ////
+//// and/or modify it under the terms of the GNU Lesser General   ////
+//// Public License as published by the Free Software Foundation; ////
+//// either version 2.1 of the License, or (at your option) any   ////
+//// later version.                                               ////
+////                                                              ////
+//// This source is distributed in the hope that it will be       ////
+//// useful, but WITHOUT ANY WARRANTY; without even the implied   ////
+//// warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR      ////
+//// PURPOSE. See the GNU Lesser General Public License for more  ////
+//// details.                                                     ////
+////                                                              ////
+//// You should have received a copy of the GNU Lesser General    ////
+//// Public License along with this source; if not, download it   ////
+//// from http://www.opencores.org/lgpl.shtml                     ////
+////                                                              ////
+//////////////////////////////////////////////////////////////////////
+`include "sd_defines.h"
+
+//Sits between the registers and sd_cmd_master. A start with
+//CMD_AUTO_CMD23 on a data command first sends CMD23 with blkcnt + 1
+//blocks (R1) and only then the command itself, a CMD23 error ends the
+//sequence. With CMD_AUTO_CMD12 the data phase is followed by CMD12
+//(R1b), whatever its outcome. cmd_isr shows the status of the last
+//command sent and data_isr is held until the sequence is done, so the
+//host polls them as for a single command.
+module sd_auto_cmd(
+           input sd_clk,
+           input rst,
+           input start_i,
+           input [`CMD_REG_SIZE-1:0] command_i,
+           input [31:0] argument_i,
+           input [`BLKCNT_W-1:0] blkcnt_i,
+           //to sd_cmd_master
+           output cmd_start_o,
+           output reg [`CMD_REG_SIZE-1:0] command_o,
+           output reg [31:0] argument_o,
+           input [`INT_CMD_SIZE-1:0] cmd_int_status_i,
+           //start of the data command, for sd_data_xfer_trig
+           output data_start_o,
+           input data_busy_i,
+           input [`INT_DATA_SIZE-1:0] data_int_status_i,
+           //status seen by the host
+           output [`INT_CMD_SIZE-1:0] cmd_int_status_o,
+           output [`INT_DATA_SIZE-1:0] data_int_status_o
+       );
+
+parameter SIZE = 3;
+reg [SIZE-1:0] state;
+reg [SIZE-1:0] next_state;
+parameter IDLE      = 3'b000;
+parameter PRE       = 3'b001;
+parameter PRE_WAIT  = 3'b010;
+parameter MAIN      = 3'b011;
+parameter MAIN_WAIT = 3'b100;
+parameter DATA_WAIT = 3'b101;
+parameter POST      = 3'b110;
+parameter POST_WAIT = 3'b111;
+
+reg auto_cmd12;
+reg data_seen;
+wire with_data = command_i[`CMD_WITH_DATA] != 2'b00;
+//cmd_int_status_i is only non zero while sd_cmd_master is idle
+wire cmd_done = cmd_int_status_i != 0;
+
+always @(state or start_i or with_data or command_i or cmd_done or cmd_int_status_i or
+         auto_cmd12 or data_seen or data_busy_i)
+begin: FSM_COMBO
+    case(state)
+        IDLE: begin
+            if (start_i && with_data && command_i[`CMD_AUTO_CMD23])
+                next_state <= PRE;
+            else if (start_i)
+                next_state <= MAIN;
+            else
+                next_state <= IDLE;
+        end
+        PRE: next_state <= PRE_WAIT;
+        PRE_WAIT: begin
+            if (cmd_done && cmd_int_status_i[`INT_CMD_EI])
+                next_state <= IDLE;
+            else if (cmd_done)
+                next_state <= MAIN;
+            else
+                next_state <= PRE_WAIT;
+        end
+        MAIN: next_state <= MAIN_WAIT;
+        MAIN_WAIT: begin
+            if (cmd_done && (cmd_int_status_i[`INT_CMD_EI] || !auto_cmd12))
+                next_state <= IDLE;
+            else if (cmd_done)
+                next_state <= DATA_WAIT;
+            else
+                next_state <= MAIN_WAIT;
+        end
+        DATA_WAIT: begin
+            if (data_seen && !data_busy_i)
+                next_state <= POST;
+            else
+                next_state <= DATA_WAIT;
+        end
+        POST: next_state <= POST_WAIT;
+        POST_WAIT: begin
+            if (cmd_done)
+                next_state <= IDLE;
+            else
+                next_state <= POST_WAIT;
+        end
+        default: next_state <= IDLE;
+    endcase
+end
+
+always @(posedge sd_clk or posedge rst)
+begin: FSM_SEQ
+    if (rst) begin
+        state <= IDLE;
+    end
+    else begin
+        state <= next_state;
+    end
+end
+
+always @(posedge sd_clk or posedge rst)
+begin
+    if (rst) begin
+        auto_cmd12 <= 0;
+        data_seen <= 0;
+    end
+    else begin
+        if (state == IDLE) begin
+            auto_cmd12 <= with_data && command_i[`CMD_AUTO_CMD12] && !command_i[`CMD_AUTO_CMD23];
+            data_seen <= 0;
+        end
+        //reads start the data master along with the command, writes
+        //once the response is in
+        else if (data_busy_i)
+            data_seen <= 1;
+    end
+end
+
+//sd_cmd_master takes the command and argument with the start
+always @(state or command_i or argument_i or blkcnt_i)
+begin
+    command_o = 0;
+    argument_o = 0;
+    case(state)
+        PRE, PRE_WAIT: begin
+            command_o[`CMD_INDEX] = 6'd23;
+            command_o[`CMD_IDX_CHECK] = 1;
+            command_o[`CMD_CRC_CHECK] = 1;
+            command_o[`CMD_RESPONSE_CHECK] = 2'b01;
+            argument_o = blkcnt_i + 1'b1;
+        end
+        POST, POST_WAIT: begin
+            command_o[`CMD_INDEX] = 6'd12;
+            command_o[`CMD_IDX_CHECK] = 1;
+            command_o[`CMD_CRC_CHECK] = 1;
+            command_o[`CMD_BUSY_CHECK] = 1;
+            command_o[`CMD_RESPONSE_CHECK] = 2'b01;
+        end
+        default: begin
+            command_o[`CMD_INDEX] = command_i[`CMD_INDEX];
+            command_o[`CMD_WITH_DATA] = command_i[`CMD_WITH_DATA];
+            command_o[4:0] = command_i[4:0];
+            argument_o = argument_i;
+        end
+    endcase
+end
+
+assign cmd_start_o = state == PRE || state == MAIN || state == POST;
+assign data_start_o = state == MAIN && with_data;
+assign cmd_int_status_o = state == IDLE ? cmd_int_status_i : 0;
+assign data_int_status_o = state != IDLE && auto_cmd12 ? 0 : data_int_status_i;
+
+endmodule
@@ -62,6 +62,7 @@ module sd_controller_wb(
            cmd_start,
            data_int_rst,
            cmd_int_rst,
+           fifo_status_rst,
            argument_reg,
            command_reg,
            response_0_reg,
@@ -79,7 +80,8 @@ module sd_controller_wb(
            block_count_reg,
            dma_addr_reg,
            data_int_status_reg,
-           data_int_enable_reg
+           data_int_enable_reg,
+           fifo_status_reg
        );
 
 // WISHBONE common
@@ -108,7 +110,7 @@ output [0:0] software_reset_reg;
 output [`CMD_TIMEOUT_W-1:0] cmd_timeout_reg;
 output [`DATA_TIMEOUT_W-1:0] data_timeout_reg;
 output [`BLKSIZE_W-1:0] block_size_reg;
-output [0:0] controll_setting_reg;
+output [`CONTROLLER_W-1:0] controll_setting_reg;
 input wire [`INT_CMD_SIZE-1:0] cmd_int_status_reg;
 output [`INT_CMD_SIZE-1:0] cmd_int_enable_reg;
 output [7:0] clock_divider_reg;
@@ -117,6 +119,9 @@ output [`INT_DATA_SIZE-1:0] data_int_enable_reg;
 //Register Controll
 output reg data_int_rst;
 output reg cmd_int_rst;
+output reg fifo_status_rst;
+//{tx fifo adr size, rx fifo adr size, 6'b0, fifo errors}
+input wire [15:0] fifo_status_reg;
 output [`BLKCNT_W-1:0]block_count_reg;
 output [31:0] dma_addr_reg;
 
@@ -133,7 +138,7 @@ byte_en_reg #(1) reset_r(wb_clk_i, wb_rst_i, we && wb_adr_i == `reset, wb_sel_i[
 byte_en_reg #(`CMD_TIMEOUT_W) cmd_timeout_r(wb_clk_i, wb_rst_i, we && wb_adr_i == `cmd_timeout, wb_sel_i[(`CMD_TIMEOUT_W-1)/8:0], wb_dat_i[`CMD_TIMEOUT_W-1:0], cmd_timeout_reg);
 byte_en_reg #(`DATA_TIMEOUT_W) data_timeout_r(wb_clk_i, wb_rst_i, we && wb_adr_i == `data_timeout, wb_sel_i[(`DATA_TIMEOUT_W-1)/8:0], wb_dat_i[`DATA_TIMEOUT_W-1:0], data_timeout_reg);
 byte_en_reg #(`BLKSIZE_W, `RESET_BLOCK_SIZE) block_size_r(wb_clk_i, wb_rst_i, we && wb_adr_i == `blksize, wb_sel_i[(`BLKSIZE_W-1)/8:0], wb_dat_i[`BLKSIZE_W-1:0], block_size_reg);
-byte_en_reg #(1) controll_r(wb_clk_i, wb_rst_i, we && wb_adr_i == `controller, wb_sel_i[0], wb_dat_i[0], controll_setting_reg);
+byte_en_reg #(`CONTROLLER_W) controll_r(wb_clk_i, wb_rst_i, we && wb_adr_i == `controller, wb_sel_i[0], wb_dat_i[`CONTROLLER_W-1:0], controll_setting_reg);
 byte_en_reg #(`INT_CMD_SIZE) cmd_int_r(wb_clk_i, wb_rst_i, we && wb_adr_i == `cmd_iser, wb_sel_i[(`INT_CMD_SIZE-1)/8:0], wb_dat_i[`INT_CMD_SIZE-1:0], cmd_int_enable_reg);
 byte_en_reg #(8) clock_d_r(wb_clk_i, wb_rst_i, we && wb_adr_i == `clock_d, wb_sel_i[0], wb_dat_i[7:0], clock_divider_reg);
 byte_en_reg #(`INT_DATA_SIZE) data_int_r(wb_clk_i, wb_rst_i, we && wb_adr_i == `data_iser, wb_sel_i[(`INT_DATA_SIZE-1)/8:0], wb_dat_i[`INT_DATA_SIZE-1:0], data_int_enable_reg);
@@ -147,18 +152,21 @@ begin
         cmd_start <= 0;
         data_int_rst <= 0;
         cmd_int_rst <= 0;
+        fifo_status_rst <= 0;
     end
     else
     begin
         cmd_start <= 0;
         data_int_rst <= 0;
         cmd_int_rst <= 0;
+        fifo_status_rst <= 0;
         if ((wb_stb_i & wb_cyc_i) || wb_ack_o)begin
             if (wb_we_i) begin
                 case (wb_adr_i)
                     `argument: cmd_start <= 1;//only msb triggers xfer
                     `cmd_isr: cmd_int_rst <= 1;
                     `data_isr: data_int_rst <= 1;
+                    `fifo_status: fifo_status_rst <= 1;
                 endcase
             end
             wb_ack_o <= wb_cyc_i & wb_stb_i & ~wb_ack_o;
@@ -192,6 +200,7 @@ always @(posedge wb_clk_i or posedge wb_rst_i)begin
                 `blkcnt: wb_dat_o <= block_count_reg;
                 `data_iser: wb_dat_o <= data_int_enable_reg;
                 `dst_src_addr: wb_dat_o <= dma_addr_reg;
+                `fifo_status: wb_dat_o <= fifo_status_reg;
             endcase
         end
 end
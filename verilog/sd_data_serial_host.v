@@ -69,6 +69,7 @@ module sd_data_serial_host(
            input [1:0] byte_alignment,
            output sd_data_busy,
            output busy,
+           output write_busy,
            output reg crc_ok
        );
 
@@ -114,6 +115,7 @@ generate
 endgenerate
 
 assign busy = (state != IDLE);
+assign write_busy = (state == WRITE_BUSY);
 assign start_bit = !DAT_dat_reg[0];
 assign sd_data_busy = !DAT_dat_reg[0];
 
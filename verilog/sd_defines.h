@@ -68,14 +68,28 @@
 `define INT_DATA_CCRCE 3
 `define INT_DATA_CFE 4
 
+//fifo status errors, sticky until cleared
+`define FIFO_STATUS_SIZE 2
+`define FIFO_RX_OVERRUN 0
+`define FIFO_TX_UNDERRUN 1
+
 //command register defines
-`define CMD_REG_SIZE 14
+`define CMD_REG_SIZE 16
 `define CMD_RESPONSE_CHECK 1:0
 `define CMD_BUSY_CHECK 2
 `define CMD_CRC_CHECK 3
 `define CMD_IDX_CHECK 4
 `define CMD_WITH_DATA 6:5
 `define CMD_INDEX 13:8
+//data commands only, see sd_auto_cmd. CMD23 wins if both are set
+`define CMD_AUTO_CMD12 14
+`define CMD_AUTO_CMD23 15
+
+//controller register defines
+`define CONTROLLER_W 3
+`define CONTROLLER_4BIT 0
+`define CONTROLLER_STREAM 1
+`define CONTROLLER_DESC 2
 
 //register addreses
 `define argument 8'h00
@@ -97,6 +111,7 @@
 `define data_iser 8'h40
 `define blksize 8'h44
 `define blkcnt 8'h48
+`define fifo_status 8'h4c
 `define dst_src_addr 8'h60
 
 //wb module defines
@@ -11,6 +11,7 @@
 //// Description                                                  ////
 //// Fifo interface between sd card and wishbone clock domains    ////
 //// and DMA engine eble to write/read to/from CPU memory         ////
+//// (contiguous or through a chain of descriptors)               ////
 ////                                                              ////
 //// Author(s):                                                   ////
 ////     - Marek Czerski, ma.czerski@gmail.com                    ////
@@ -47,21 +48,26 @@
 ////                                                              ////
 //////////////////////////////////////////////////////////////////////
 
+`include "sd_defines.h"
+
 module sd_fifo_filler(
            input wb_clk,
            input rst,
            //WB Signals
-           output reg [31:0] wbm_adr_o,
+           output [31:0] wbm_adr_o,
            output wbm_we_o,
            output [31:0] wbm_dat_o,
            input [31:0] wbm_dat_i,
            output wbm_cyc_o,
            output wbm_stb_o,
            input wbm_ack_i,
+           output [2:0] wbm_cti_o,
+           output [1:0] wbm_bte_o,
            //Data Master Control signals
            input en_rx_i,
            input en_tx_i,
            input [31:0] adr_i,
+           input [`BLKSIZE_W+`BLKCNT_W-1:0] xfersize_i,
            //Data Serial signals
            input sd_clk,
            input [31:0] dat_i,
@@ -71,27 +77,167 @@ module sd_fifo_filler(
            output sd_full_o,
            output sd_empty_o,
            output wb_full_o,
-           output wb_empty_o
+           output wb_empty_o,
+           //Stream, replaces the wishbone master while stream_i is set
+           input stream_i,
+           input [`BLKSIZE_W-1:0] blksize_i,
+           output [31:0] rx_data_o,
+           output rx_valid_o,
+           input rx_ready_i,
+           output rx_last_o,
+           input [31:0] tx_data_i,
+           input tx_valid_i,
+           output tx_ready_o,
+           //Descriptor dma, adr_i points to the first descriptor
+           input desc_i,
+           //a data word moved by the dma or a stream
+           output xfer_o
        );
 
-`define FIFO_MEM_ADR_SIZE 4
+//fifo depths are 2**RX_FIFO_ADR_SIZE and 2**TX_FIFO_ADR_SIZE words
+parameter RX_FIFO_ADR_SIZE = 4;
+parameter TX_FIFO_ADR_SIZE = 4;
+//0: classic single cycles, 1: incrementing bursts (CTI 3'b010, linear)
+//of up to MAX_BURST words, as many as the fifo holds (rx) or has room
+//for (tx) when the burst starts. A burst waits for half a fifo (or
+//MAX_BURST words, or the rest of an rx transfer) to be ready.
+parameter BURST = 0;
+parameter MAX_BURST = 16;
+//1: with desc_i set, adr_i is the address of a chain of descriptors,
+//four words each:
+//  +0  buffer address (word aligned)
+//  +4  [15:0] blocks for this buffer, [31] last descriptor of the chain
+//  +8  next descriptor address
+//  +12 status, written with [31] done, [15:0] blocks once the buffer
+//      is filled (rx) or read (tx)
+//past the last descriptor rx data is not taken (fifo overrun) and tx
+//is padded with zeros
+parameter DESC = 0;
+
+localparam RX_BURST_MIN = MAX_BURST < (1 << RX_FIFO_ADR_SIZE-1) ? MAX_BURST : (1 << RX_FIFO_ADR_SIZE-1);
+localparam TX_BURST_MIN = MAX_BURST < (1 << TX_FIFO_ADR_SIZE-1) ? MAX_BURST : (1 << TX_FIFO_ADR_SIZE-1);
+
+localparam D_DATA = 2'd0;
+localparam D_FETCH = 2'd1;
+localparam D_WB = 2'd2;
+localparam D_END = 2'd3;
+
 `define MEM_OFFSET 4
 
 wire reset_fifo;
+wire rx_en;
+wire tx_pad;
+reg rx_drain;
 wire fifo_rd;
 reg fifo_rd_ack;
 reg fifo_rd_reg;
+wire [31:0] rx_fifo_dout;
+wire [RX_FIFO_ADR_SIZE:0] rx_fifo_count;
+wire [TX_FIFO_ADR_SIZE:0] tx_fifo_count;
+wire rx_fifo_re;
+wire rx_prefetch_re;
+wire rx_pop;
+wire wb_xfer;
+reg [31:0] data_adr;
+wire data_cyc;
+wire data_stb;
+wire data_we;
+wire [31:0] data_dat;
+wire [2:0] data_cti;
+reg [`BLKSIZE_W-3:0] rx_word;
+wire [`BLKSIZE_W:0] blksize_plus;
+
+//burst and stream mode
+reg [15:0] burst_cnt;
+reg [2:0] fifo_ready;
+reg [31:0] rx_buf0, rx_buf1;
+reg [1:0] rx_buf_cnt;
+reg rx_buf_pending;
+wire [15:0] rx_avail;
+wire [15:0] tx_room;
+wire [15:0] avail;
+wire [`BLKSIZE_W+`BLKCNT_W-1:0] burst_min;
+reg [`BLKSIZE_W+`BLKCNT_W-1:0] words_left;
+wire [31:0] xfer_end;
+
+//descriptor mode
+wire desc_mode;
+wire desc_op;
+wire desc_pending;
+wire data_en;
+reg [1:0] desc_state;
+reg [1:0] desc_idx;
+reg [31:0] desc_adr;
+reg [31:0] desc_next;
+reg [15:0] desc_blocks;
+reg desc_last;
+reg [`BLKSIZE_W+`BLKCNT_W-1:0] desc_words;
+
+assign fifo_rd = data_cyc & wbm_ack_i;
+//rx stays enabled after the data master is done until the fifo and
+//the read ahead buffer are empty, the tail of a transfer still has to
+//reach memory or the stream
+assign rx_en = en_rx_i | rx_drain;
+assign reset_fifo = !rx_en & !en_tx_i;
+assign wb_xfer = data_cyc & data_stb & wbm_ack_i;
 
-assign fifo_rd = wbm_cyc_o & wbm_ack_i;
-assign reset_fifo = !en_rx_i & !en_tx_i;
+generate
+if (BURST) begin
+    assign data_we = rx_en;
+    assign data_cyc = burst_cnt != 0;
+    assign data_stb = data_cyc & (en_tx_i | rx_buf_cnt != 0);
+    assign data_cti = burst_cnt == 1 ? 3'b111 : 3'b010;
+    assign data_dat = rx_buf0;
+    assign rx_fifo_re = rx_prefetch_re;
+end
+else begin
+    assign data_we = rx_en & !wb_empty_o;
+    assign data_cyc = !stream_i & data_en & (rx_en ? rx_en & !wb_empty_o : en_tx_i & !wb_full_o);
+    assign data_stb = rx_en ? data_cyc & fifo_rd_ack : data_cyc;
+    assign data_cti = 3'b000;
+    assign data_dat = rx_fifo_dout;
+    assign rx_fifo_re = stream_i ? rx_prefetch_re : rx_en & data_cyc & wbm_ack_i;
+end
+endgenerate
 
-assign wbm_we_o = en_rx_i & !wb_empty_o;
-assign wbm_cyc_o = en_rx_i ? en_rx_i & !wb_empty_o : en_tx_i & !wb_full_o;
-assign wbm_stb_o = en_rx_i ? wbm_cyc_o & fifo_rd_ack : wbm_cyc_o;
+//descriptor reads and status writes are classic cycles between the
+//data ones
+assign wbm_adr_o = desc_op ? desc_adr + {desc_idx, 2'b00} : data_adr;
+assign wbm_we_o = desc_op ? desc_state == D_WB : data_we;
+assign wbm_cyc_o = desc_op | data_cyc;
+assign wbm_stb_o = desc_op | data_stb;
+assign wbm_cti_o = desc_op ? 3'b000 : data_cti;
+assign wbm_dat_o = desc_op ? {1'b1, 15'd0, desc_blocks} : data_dat;
+assign wbm_bte_o = 2'b00;
+
+assign desc_mode = DESC && desc_i && !stream_i;
+assign desc_op = desc_mode & (desc_state == D_FETCH | desc_state == D_WB);
+//a status write is due once the words of the descriptor are moved
+assign desc_pending = desc_mode & (desc_op | desc_state == D_DATA & desc_words == 0);
+assign data_en = !desc_mode | desc_state == D_DATA & desc_words != 0;
+
+//the fifo output lags the read by a cycle, keep up to two words read
+//ahead so the bus or the stream can take one every cycle
+assign rx_pop = stream_i ? rx_valid_o & rx_ready_i : BURST && rx_en && wb_xfer;
+assign rx_prefetch_re = rx_en & !wb_empty_o & ((rx_buf_cnt + rx_buf_pending < 2) | rx_pop);
+
+//stream words are big endian like the dma ones, first byte in [31:24].
+//last marks the final word of each block
+assign rx_data_o = rx_buf0;
+assign rx_valid_o = stream_i & rx_en & rx_buf_cnt != 0;
+assign blksize_plus = blksize_i + 3'd4;
+assign rx_last_o = rx_word == blksize_plus[`BLKSIZE_W:2] - 1'b1;
+//the tx stream gives exactly the words of the transfer. Past them the
+//fifo is topped up with zeros, like the dma reading past the buffer,
+//so the data master does not see it run empty before the end
+assign tx_ready_o = stream_i & en_tx_i & fifo_ready[2] & !wb_full_o & words_left != 0;
+assign tx_pad = en_tx_i & fifo_ready[2] & !wb_full_o &
+                (stream_i ? words_left == 0 : desc_mode & desc_state == D_END);
+assign xfer_o = wb_xfer | rx_valid_o & rx_ready_i | tx_valid_i & tx_ready_o;
 
 generic_fifo_dc_gray #(
     .dw(32), 
-    .aw(`FIFO_MEM_ADR_SIZE)
+    .aw(RX_FIFO_ADR_SIZE)
     ) generic_fifo_dc_gray0 (
     .rd_clk(wb_clk),
     .wr_clk(sd_clk), 
@@ -99,47 +245,179 @@ generic_fifo_dc_gray #(
     .clr(1'b0), 
     .din(dat_i), 
     .we(wr_i),
-    .dout(wbm_dat_o), 
-    .re(en_rx_i & wbm_cyc_o & wbm_ack_i), 
+    .dout(rx_fifo_dout), 
+    .re(rx_fifo_re), 
     .full(sd_full_o), 
     .empty(wb_empty_o), 
     .wr_level(), 
-    .rd_level() 
+    .rd_level(),
+    .wr_count(),
+    .rd_count(rx_fifo_count)
     );
     
 generic_fifo_dc_gray #(
     .dw(32), 
-    .aw(`FIFO_MEM_ADR_SIZE)
+    .aw(TX_FIFO_ADR_SIZE)
     ) generic_fifo_dc_gray1 (
     .rd_clk(sd_clk),
     .wr_clk(wb_clk), 
     .rst(!(rst | reset_fifo)), 
     .clr(1'b0), 
-    .din(wbm_dat_i), 
-    .we(en_tx_i & wbm_cyc_o & wbm_stb_o & wbm_ack_i),
+    .din(tx_pad ? 32'd0 : stream_i ? tx_data_i : wbm_dat_i), 
+    .we(en_tx_i & (tx_pad | (stream_i ? tx_valid_i & tx_ready_o : wb_xfer))),
     .dout(dat_o), 
     .re(rd_i), 
     .full(wb_full_o), 
     .empty(sd_empty_o), 
     .wr_level(), 
-    .rd_level() 
+    .rd_level(),
+    .wr_count(tx_fifo_count),
+    .rd_count()
     );
 
 always @(posedge wb_clk or posedge rst)
     if (rst) begin
-        wbm_adr_o <= 0;
+        data_adr <= 0;
         fifo_rd_reg <= 0;
         fifo_rd_ack <= 1;
+        rx_drain <= 0;
     end
     else begin
+        rx_drain <= en_rx_i | (rx_drain & (desc_pending | !(wb_empty_o & rx_buf_cnt == 0 & !rx_buf_pending)));
         fifo_rd_reg <= fifo_rd;
         fifo_rd_ack <= fifo_rd_reg | !fifo_rd;
-        if (wbm_cyc_o & wbm_stb_o & wbm_ack_i)
-            wbm_adr_o <= wbm_adr_o + `MEM_OFFSET;
+        if (wb_xfer)
+            data_adr <= data_adr + `MEM_OFFSET;
         else if (reset_fifo)
-            wbm_adr_o <= adr_i;
+            data_adr <= adr_i;
+        else if (desc_op & wbm_ack_i & desc_idx == 0)
+            data_adr <= wbm_dat_i;
     end
 
-endmodule
+//descriptor walker: fetch buffer, blocks and next, move the words of
+//the buffer, write the status back, follow next until the last one
+always @(posedge wb_clk or posedge rst)
+    if (rst) begin
+        desc_state <= D_DATA;
+        desc_idx <= 0;
+        desc_adr <= 0;
+        desc_next <= 0;
+        desc_blocks <= 0;
+        desc_last <= 0;
+        desc_words <= 0;
+    end
+    else if (reset_fifo) begin
+        desc_state <= D_FETCH;
+        desc_idx <= 0;
+        desc_adr <= adr_i;
+        desc_words <= 0;
+    end
+    else if (desc_mode) begin
+        case (desc_state)
+            D_FETCH:
+                if (wbm_ack_i) begin
+                    desc_idx <= desc_idx + 1'b1;
+                    if (desc_idx == 1) begin
+                        desc_blocks <= wbm_dat_i[15:0];
+                        desc_last <= wbm_dat_i[31];
+                        desc_words <= wbm_dat_i[15:0] * blksize_plus[`BLKSIZE_W:2];
+                    end
+                    if (desc_idx == 2) begin
+                        desc_next <= wbm_dat_i;
+                        desc_state <= D_DATA;
+                    end
+                end
+            D_DATA:
+                if (wb_xfer)
+                    desc_words <= desc_words - 1'b1;
+                else if (desc_words == 0 & !data_cyc) begin
+                    desc_idx <= 3;
+                    desc_state <= D_WB;
+                end
+            D_WB:
+                if (wbm_ack_i) begin
+                    desc_idx <= 0;
+                    if (desc_last)
+                        desc_state <= D_END;
+                    else begin
+                        desc_adr <= desc_next;
+                        desc_state <= D_FETCH;
+                    end
+                end
+        endcase
+    end
 
+//words a burst can move: buffered and in the rx fifo, or free in the
+//tx fifo. The fifos take writes two cycles after leaving reset, wait
+//for fifo_ready before the first burst
+assign rx_avail = rx_buf_cnt + rx_buf_pending + rx_fifo_count;
+assign tx_room = (1 << TX_FIFO_ADR_SIZE) - tx_fifo_count;
+assign avail = rx_en ? rx_avail : tx_room;
+//the last words of an rx transfer go out without waiting for more
+assign burst_min = !rx_en ? TX_BURST_MIN :
+                   words_left < RX_BURST_MIN ? words_left : RX_BURST_MIN;
+assign xfer_end = adr_i + xfersize_i - 1'b1;
 
+always @(posedge wb_clk or posedge rst)
+    if (rst) begin
+        burst_cnt <= 0;
+        fifo_ready <= 0;
+        rx_buf_cnt <= 0;
+        rx_buf_pending <= 0;
+        rx_buf0 <= 0;
+        rx_buf1 <= 0;
+        words_left <= 0;
+        rx_word <= 0;
+    end
+    else if (reset_fifo) begin
+        burst_cnt <= 0;
+        fifo_ready <= 0;
+        rx_buf_cnt <= 0;
+        rx_buf_pending <= 0;
+        rx_word <= 0;
+        //words touched by the transfer, partial ones included. A tx
+        //stream only gives this many, the dma may read ahead
+        words_left <= xfer_end[31:2] - adr_i[31:2] + 1'b1;
+    end
+    else begin
+        fifo_ready <= {fifo_ready[1:0], 1'b1};
+        if (data_cyc) begin
+            if (wb_xfer) begin
+                burst_cnt <= burst_cnt - 1'b1;
+                words_left <= words_left - 1'b1;
+            end
+        end
+        else if (tx_valid_i & tx_ready_o)
+            words_left <= words_left - 1'b1;
+        else if (!stream_i && data_en && fifo_ready[2] && avail != 0 && avail >= burst_min)
+            burst_cnt <= desc_mode && desc_words < MAX_BURST && desc_words < avail ? desc_words :
+                         avail > MAX_BURST ? MAX_BURST : avail;
+
+        if (rx_valid_o & rx_ready_i)
+            rx_word <= rx_last_o ? 0 : rx_word + 1'b1;
+
+        rx_buf_pending <= rx_fifo_re & (BURST || stream_i);
+        case ({rx_buf_pending, rx_pop})
+            2'b10: begin
+                if (rx_buf_cnt == 0)
+                    rx_buf0 <= rx_fifo_dout;
+                else
+                    rx_buf1 <= rx_fifo_dout;
+                rx_buf_cnt <= rx_buf_cnt + 1'b1;
+            end
+            2'b01: begin
+                rx_buf0 <= rx_buf1;
+                rx_buf_cnt <= rx_buf_cnt - 1'b1;
+            end
+            2'b11: begin
+                if (rx_buf_cnt == 1)
+                    rx_buf0 <= rx_fifo_dout;
+                else begin
+                    rx_buf0 <= rx_buf1;
+                    rx_buf1 <= rx_fifo_dout;
+                end
+            end
+        endcase
+    end
+
+endmodule
@@ -91,7 +91,26 @@ module sdc_controller(
            sd_clk_o_pad,
            sd_clk_i_pad,
            int_cmd, 
-           int_data
+           int_data,
+           //data stream
+           rx_stream_data_o,
+           rx_stream_valid_o,
+           rx_stream_ready_i,
+           rx_stream_last_o,
+           tx_stream_data_i,
+           tx_stream_valid_i,
+           tx_stream_ready_o,
+           //performance counter events
+           perf_cmd_start_o,
+           perf_cmd_int_o,
+           perf_data_int_o,
+           perf_data_busy_o,
+           perf_write_busy_o,
+           perf_rx_full_o,
+           perf_rx_empty_o,
+           perf_tx_full_o,
+           perf_tx_empty_o,
+           perf_xfer_o
        );
 
 input wb_clk_i;
@@ -124,17 +143,54 @@ output wire sd_cmd_oe_o;
 output sd_clk_o_pad;
 input wire sd_clk_i_pad;
 output int_cmd, int_data;
+output [31:0] rx_stream_data_o;
+output rx_stream_valid_o;
+input rx_stream_ready_i;
+output rx_stream_last_o;
+input [31:0] tx_stream_data_i;
+input tx_stream_valid_i;
+output tx_stream_ready_o;
+output perf_cmd_start_o;
+output [`INT_CMD_SIZE-1:0] perf_cmd_int_o;
+output [`INT_DATA_SIZE-1:0] perf_data_int_o;
+output perf_data_busy_o;
+output perf_write_busy_o;
+output perf_rx_full_o;
+output perf_rx_empty_o;
+output perf_tx_full_o;
+output perf_tx_empty_o;
+output perf_xfer_o;
+
+//fifo depths are 2**RX_FIFO_ADR_SIZE and 2**TX_FIFO_ADR_SIZE words
+parameter RX_FIFO_ADR_SIZE = 4;
+parameter TX_FIFO_ADR_SIZE = 4;
+//dma with incrementing bursts of up to MAX_BURST words, see sd_fifo_filler
+parameter BURST = 0;
+parameter MAX_BURST = 16;
+//with STREAM, data goes through the stream ports instead of the dma
+//master while the controller register CONTROLLER_STREAM bit is set
+parameter STREAM = 0;
+//with DESC, dst_src_addr points to a descriptor chain while the
+//controller register CONTROLLER_DESC bit is set, see sd_fifo_filler
+parameter DESC = 0;
 
 //SD clock
 wire sd_clk_o; //Sd_clk used in the system
 wire [3:0] wr_wbm_sel;
 wire [`BLKSIZE_W+`BLKCNT_W-1:0] xfersize;
 wire [31:0] wbm_adr;
+wire desc_mode;
 
 wire go_idle;
 wire cmd_start_wb_clk;
 wire cmd_start_sd_clk;
 wire cmd_start;
+wire auto_cmd_start;
+wire [`CMD_REG_SIZE-1:0] auto_command;
+wire [31:0] auto_argument;
+wire auto_data_start;
+wire [`INT_CMD_SIZE-1:0] cmd_status;
+wire [`INT_DATA_SIZE-1:0] data_status;
 wire [1:0] cmd_setting;
 wire cmd_start_tx;
 wire [39:0] cmd;
@@ -152,8 +208,10 @@ wire start_rx_fifo;
 wire tx_fifo_empty;
 wire tx_fifo_full;
 wire rx_fifo_full;
+wire rx_fifo_empty;
 wire sd_data_busy;
 wire data_busy;
+wire write_busy;
 wire data_crc_ok;
 wire rd_fifo;
 wire we_fifo;
@@ -166,6 +224,9 @@ wire cmd_int_rst;
 wire data_int_rst_wb_clk;
 wire data_int_rst_sd_clk;
 wire data_int_rst;
+wire fifo_status_rst_wb_clk;
+wire fifo_status_rst_sd_clk;
+wire fifo_status_rst;
 
 //wb accessible registers
 wire [31:0] argument_reg_wb_clk;
@@ -178,7 +239,7 @@ wire [31:0] response_1_reg_wb_clk;
 wire [31:0] response_2_reg_wb_clk;
 wire [31:0] response_3_reg_wb_clk;
 wire [`BLKSIZE_W-1:0] block_size_reg_wb_clk;
-wire [0:0] controll_setting_reg_wb_clk;
+wire [`CONTROLLER_W-1:0] controll_setting_reg_wb_clk;
 wire [`INT_CMD_SIZE-1:0] cmd_int_status_reg_wb_clk;
 wire [`INT_DATA_SIZE-1:0] data_int_status_reg_wb_clk;
 wire [`INT_CMD_SIZE-1:0] cmd_int_enable_reg_wb_clk;
@@ -186,6 +247,7 @@ wire [`INT_DATA_SIZE-1:0] data_int_enable_reg_wb_clk;
 wire [`BLKCNT_W-1:0] block_count_reg_wb_clk;
 wire [31:0] dma_addr_reg_wb_clk;
 wire [7:0] clock_divider_reg_wb_clk;
+wire [`FIFO_STATUS_SIZE-1:0] fifo_status_reg_wb_clk;
 
 wire [31:0] argument_reg_sd_clk;
 wire [`CMD_REG_SIZE-1:0] command_reg_sd_clk;
@@ -203,6 +265,9 @@ wire [`INT_DATA_SIZE-1:0] data_int_status_reg_sd_clk;
 wire [`BLKCNT_W-1:0] block_count_reg_sd_clk;
 wire [1:0] dma_addr_reg_sd_clk;
 wire [7:0] clock_divider_reg_sd_clk;
+reg [`FIFO_STATUS_SIZE-1:0] fifo_status_reg_sd_clk;
+wire [3:0] rx_fifo_adr_size = RX_FIFO_ADR_SIZE;
+wire [3:0] tx_fifo_adr_size = TX_FIFO_ADR_SIZE;
 
 sd_clock_divider clock_divider0(
     .CLK (sd_clk_i_pad),
@@ -216,7 +281,7 @@ assign sd_clk_o_pad  = sd_clk_o ;
 sd_cmd_master sd_cmd_master0(
     .sd_clk       (sd_clk_o),
     .rst          (wb_rst_i | software_reset_reg_sd_clk[0]),
-    .start_i      (cmd_start_sd_clk),
+    .start_i      (auto_cmd_start),
     .int_status_rst_i(cmd_int_rst_sd_clk),
     .setting_o    (cmd_setting),
     .start_xfr_o  (cmd_start_tx),
@@ -227,10 +292,10 @@ sd_cmd_master sd_cmd_master0(
     .index_ok_i   (cmd_index_ok),
     .busy_i       (sd_data_busy),
     .finish_i     (cmd_finish),
-    .argument_i   (argument_reg_sd_clk),
-    .command_i    (command_reg_sd_clk),
+    .argument_i   (auto_argument),
+    .command_i    (auto_command),
     .timeout_i    (cmd_timeout_reg_sd_clk),
-    .int_status_o (cmd_int_status_reg_sd_clk),
+    .int_status_o (cmd_status),
     .response_0_o (response_0_reg_sd_clk),
     .response_1_o (response_1_reg_sd_clk),
     .response_2_o (response_2_reg_sd_clk),
@@ -270,10 +335,28 @@ sd_data_master sd_data_master0(
     .rx_fifo_full_i   (rx_fifo_full),
     .xfr_complete_i   (!data_busy),
     .crc_ok_i         (data_crc_ok),
-    .int_status_o     (data_int_status_reg_sd_clk),
+    .int_status_o     (data_status),
     .int_status_rst_i (data_int_rst_sd_clk)
     );
 
+sd_auto_cmd sd_auto_cmd0(
+    .sd_clk            (sd_clk_o),
+    .rst               (wb_rst_i | software_reset_reg_sd_clk[0]),
+    .start_i           (cmd_start_sd_clk),
+    .command_i         (command_reg_sd_clk),
+    .argument_i        (argument_reg_sd_clk),
+    .blkcnt_i          (block_count_reg_sd_clk),
+    .cmd_start_o       (auto_cmd_start),
+    .command_o         (auto_command),
+    .argument_o        (auto_argument),
+    .cmd_int_status_i  (cmd_status),
+    .data_start_o      (auto_data_start),
+    .data_busy_i       (start_rx_fifo | start_tx_fifo),
+    .data_int_status_i (data_status),
+    .cmd_int_status_o  (cmd_int_status_reg_sd_clk),
+    .data_int_status_o (data_int_status_reg_sd_clk)
+    );
+
 sd_data_serial_host sd_data_serial_host0(
     .sd_clk         (sd_clk_o),
     .rst            (wb_rst_i | software_reset_reg_sd_clk[0]),
@@ -291,10 +374,17 @@ sd_data_serial_host sd_data_serial_host0(
     .byte_alignment (dma_addr_reg_sd_clk),
     .sd_data_busy   (sd_data_busy),
     .busy           (data_busy),
+    .write_busy     (write_busy),
     .crc_ok         (data_crc_ok)
     );
            
-sd_fifo_filler sd_fifo_filler0(
+sd_fifo_filler #(
+    .RX_FIFO_ADR_SIZE(RX_FIFO_ADR_SIZE),
+    .TX_FIFO_ADR_SIZE(TX_FIFO_ADR_SIZE),
+    .BURST(BURST),
+    .MAX_BURST(MAX_BURST),
+    .DESC(DESC)
+    ) sd_fifo_filler0(
     .wb_clk    (wb_clk_i),
     .rst       (wb_rst_i | software_reset_reg_sd_clk[0]),
     .wbm_adr_o (wbm_adr),
@@ -304,9 +394,12 @@ sd_fifo_filler sd_fifo_filler0(
     .wbm_cyc_o (m_wb_cyc_o),
     .wbm_stb_o (m_wb_stb_o),
     .wbm_ack_i (m_wb_ack_i),
+    .wbm_cti_o (m_wb_cti_o),
+    .wbm_bte_o (m_wb_bte_o),
     .en_rx_i   (start_rx_fifo),
     .en_tx_i   (start_tx_fifo),
     .adr_i     (dma_addr_reg_wb_clk),
+    .xfersize_i(xfersize),
     .sd_clk    (sd_clk_o),
     .dat_i     (data_in_rx_fifo),
     .dat_o     (data_out_tx_fifo),
@@ -314,10 +407,36 @@ sd_fifo_filler sd_fifo_filler0(
     .rd_i      (rd_fifo),
     .sd_empty_o   (tx_fifo_empty),
     .sd_full_o   (rx_fifo_full),
-    .wb_empty_o   (),
-    .wb_full_o    (tx_fifo_full)
+    .wb_empty_o   (rx_fifo_empty),
+    .wb_full_o    (tx_fifo_full),
+    .stream_i     (STREAM && controll_setting_reg_wb_clk[`CONTROLLER_STREAM]),
+    .blksize_i    (block_size_reg_wb_clk),
+    .rx_data_o    (rx_stream_data_o),
+    .rx_valid_o   (rx_stream_valid_o),
+    .rx_ready_i   (rx_stream_ready_i),
+    .rx_last_o    (rx_stream_last_o),
+    .tx_data_i    (tx_stream_data_i),
+    .tx_valid_i   (tx_stream_valid_i),
+    .tx_ready_o   (tx_stream_ready_o),
+    .desc_i       (desc_mode),
+    .xfer_o       (perf_xfer_o)
     );
 
+//rx fifo full while receiving, tx fifo empty while sending: the data
+//master aborts the transfer on both with CFE, these stay set until
+//fifo_status is written so software can tell which side starved
+always @(posedge sd_clk_o or posedge wb_rst_i)
+    if (wb_rst_i)
+        fifo_status_reg_sd_clk <= 0;
+    else if (fifo_status_rst_sd_clk | software_reset_reg_sd_clk[0])
+        fifo_status_reg_sd_clk <= 0;
+    else begin
+        if (start_rx_fifo & rx_fifo_full)
+            fifo_status_reg_sd_clk[`FIFO_RX_OVERRUN] <= 1;
+        if (start_tx_fifo & data_busy & tx_fifo_empty)
+            fifo_status_reg_sd_clk[`FIFO_TX_UNDERRUN] <= 1;
+    end
+
 assign xfersize = (block_size_reg_wb_clk + 1'b1) * (block_count_reg_wb_clk + 1'b1);
 sd_wb_sel_ctrl sd_wb_sel_ctrl0(
         .wb_clk         (wb_clk_i),
@@ -332,12 +451,10 @@ sd_wb_sel_ctrl sd_wb_sel_ctrl0(
 sd_data_xfer_trig sd_data_xfer_trig0 (
     .sd_clk                (sd_clk_o),
     .rst                   (wb_rst_i | software_reset_reg_sd_clk[0]),
-    .cmd_with_data_start_i (cmd_start_sd_clk & 
-                            (command_reg_sd_clk[`CMD_WITH_DATA] != 
-                             2'b00)),
+    .cmd_with_data_start_i (auto_data_start),
     .r_w_i                 (command_reg_sd_clk[`CMD_WITH_DATA] == 
                             2'b01),
-    .cmd_int_status_i      (cmd_int_status_reg_sd_clk),
+    .cmd_int_status_i      (cmd_status),
     .start_tx_o            (data_start_tx),
     .start_rx_o            (data_start_rx)
     );
@@ -356,6 +473,7 @@ sd_controller_wb sd_controller_wb0(
     .cmd_start                      (cmd_start),
     .data_int_rst                   (data_int_rst),
     .cmd_int_rst                    (cmd_int_rst),
+    .fifo_status_rst                (fifo_status_rst),
     .argument_reg                   (argument_reg_wb_clk),
     .command_reg                    (command_reg_wb_clk),
     .response_0_reg                 (response_0_reg_wb_clk),
@@ -373,7 +491,9 @@ sd_controller_wb sd_controller_wb0(
     .block_count_reg                (block_count_reg_wb_clk),
     .dma_addr_reg                   (dma_addr_reg_wb_clk),
     .data_int_status_reg            (data_int_status_reg_wb_clk),
-    .data_int_enable_reg            (data_int_enable_reg_wb_clk)
+    .data_int_enable_reg            (data_int_enable_reg_wb_clk),
+    .fifo_status_reg                ({tx_fifo_adr_size, rx_fifo_adr_size,
+                                      {(8-`FIFO_STATUS_SIZE){1'b0}}, fifo_status_reg_wb_clk})
     );
 
 //clock domain crossing regiters
@@ -399,9 +519,11 @@ sd_controller_wb sd_controller_wb0(
 edge_detect cmd_start_edge(.rst(wb_rst_i), .clk(wb_clk_i), .sig(cmd_start), .rise(cmd_start_wb_clk), .fall());
 edge_detect data_int_rst_edge(.rst(wb_rst_i), .clk(wb_clk_i), .sig(data_int_rst), .rise(data_int_rst_wb_clk), .fall());
 edge_detect cmd_int_rst_edge(.rst(wb_rst_i), .clk(wb_clk_i), .sig(cmd_int_rst), .rise(cmd_int_rst_wb_clk), .fall());
+edge_detect fifo_status_rst_edge(.rst(wb_rst_i), .clk(wb_clk_i), .sig(fifo_status_rst), .rise(fifo_status_rst_wb_clk), .fall());
 monostable_domain_cross cmd_start_cross(wb_rst_i, wb_clk_i, cmd_start_wb_clk, sd_clk_o, cmd_start_sd_clk);
 monostable_domain_cross data_int_rst_cross(wb_rst_i, wb_clk_i, data_int_rst_wb_clk, sd_clk_o, data_int_rst_sd_clk);
 monostable_domain_cross cmd_int_rst_cross(wb_rst_i, wb_clk_i, cmd_int_rst_wb_clk, sd_clk_o, cmd_int_rst_sd_clk);
+monostable_domain_cross fifo_status_rst_cross(wb_rst_i, wb_clk_i, fifo_status_rst_wb_clk, sd_clk_o, fifo_status_rst_sd_clk);
 bistable_domain_cross #(32) argument_reg_cross(wb_rst_i, wb_clk_i, argument_reg_wb_clk, sd_clk_o, argument_reg_sd_clk);
 bistable_domain_cross #(`CMD_REG_SIZE) command_reg_cross(wb_rst_i, wb_clk_i, command_reg_wb_clk, sd_clk_o, command_reg_sd_clk);
 bistable_domain_cross #(32) response_0_reg_cross(wb_rst_i, sd_clk_o, response_0_reg_sd_clk, wb_clk_i, response_0_reg_wb_clk);
@@ -412,20 +534,35 @@ bistable_domain_cross software_reset_reg_cross(wb_rst_i, wb_clk_i, software_rese
 bistable_domain_cross #(`CMD_TIMEOUT_W) cmd_timeout_reg_cross(wb_rst_i, wb_clk_i, cmd_timeout_reg_wb_clk, sd_clk_o, cmd_timeout_reg_sd_clk);
 bistable_domain_cross #(`DATA_TIMEOUT_W) data_timeout_reg_cross(wb_rst_i, wb_clk_i, data_timeout_reg_wb_clk, sd_clk_o, data_timeout_reg_sd_clk);
 bistable_domain_cross #(`BLKSIZE_W) block_size_reg_cross(wb_rst_i, wb_clk_i, block_size_reg_wb_clk, sd_clk_o, block_size_reg_sd_clk);
-bistable_domain_cross #(1) controll_setting_reg_cross(wb_rst_i, wb_clk_i, controll_setting_reg_wb_clk, sd_clk_o, controll_setting_reg_sd_clk);
+bistable_domain_cross #(1) controll_setting_reg_cross(wb_rst_i, wb_clk_i, controll_setting_reg_wb_clk[`CONTROLLER_4BIT], sd_clk_o, controll_setting_reg_sd_clk);
 bistable_domain_cross #(`INT_CMD_SIZE) cmd_int_status_reg_cross(wb_rst_i, sd_clk_o, cmd_int_status_reg_sd_clk, wb_clk_i, cmd_int_status_reg_wb_clk);
 bistable_domain_cross #(8) clock_divider_reg_cross(wb_rst_i, wb_clk_i, clock_divider_reg_wb_clk, sd_clk_i_pad, clock_divider_reg_sd_clk);
 bistable_domain_cross #(`BLKCNT_W) block_count_reg_cross(wb_rst_i, wb_clk_i, block_count_reg_wb_clk, sd_clk_o, block_count_reg_sd_clk);
 bistable_domain_cross #(2) dma_addr_reg_cross(wb_rst_i, wb_clk_i, dma_addr_reg_wb_clk[1:0], sd_clk_o, dma_addr_reg_sd_clk);
 bistable_domain_cross #(`INT_DATA_SIZE) data_int_status_reg_cross(wb_rst_i, sd_clk_o, data_int_status_reg_sd_clk, wb_clk_i, data_int_status_reg_wb_clk);
-
-assign m_wb_cti_o = 3'b000;
-assign m_wb_bte_o = 2'b00;
+bistable_domain_cross #(`FIFO_STATUS_SIZE) fifo_status_reg_cross(wb_rst_i, sd_clk_o, fifo_status_reg_sd_clk, wb_clk_i, fifo_status_reg_wb_clk);
 
 assign int_cmd =  |(cmd_int_status_reg_wb_clk & cmd_int_enable_reg_wb_clk);
 assign int_data =  |(data_int_status_reg_wb_clk & data_int_enable_reg_wb_clk);
 
-assign m_wb_sel_o = m_wb_cyc_o & m_wb_we_o ? wr_wbm_sel : 4'b1111;
+//events for counters outside the core. cmd_start, xfer and the
+//interrupt status are on wb_clk, the levels partly come from sd_clk and
+//have to be synchronized by the user. The fifo ones are the stalls: the
+//card waiting on the dma (rx full, tx empty) or the dma waiting on the
+//card (rx empty, tx full)
+assign perf_cmd_start_o = cmd_start_wb_clk;
+assign perf_cmd_int_o = cmd_int_status_reg_wb_clk;
+assign perf_data_int_o = data_int_status_reg_wb_clk;
+assign perf_data_busy_o = data_busy;
+assign perf_write_busy_o = write_busy;
+assign perf_rx_full_o = start_rx_fifo & rx_fifo_full;
+assign perf_rx_empty_o = start_rx_fifo & rx_fifo_empty;
+assign perf_tx_full_o = start_tx_fifo & tx_fifo_full;
+assign perf_tx_empty_o = start_tx_fifo & data_busy & tx_fifo_empty;
+
+//descriptor buffers are word aligned
+assign desc_mode = DESC && controll_setting_reg_wb_clk[`CONTROLLER_DESC];
+assign m_wb_sel_o = m_wb_cyc_o & m_wb_we_o & !desc_mode ? wr_wbm_sel : 4'b1111;
 assign m_wb_adr_o = {wbm_adr[31:2], 2'b00};
 
 endmodule